@@ -0,0 +1,4 @@
+""" figures of Gantt and vector traces """
+
+# the version of cmtrace, also read by setup.py
+__version__ = '0.1'
@@ -0,0 +1,321 @@
+""" support for generating graphics directly with Cairo """
+from abc import abstractmethod
+from math import atan2, ceil, pi
+import os
+import cairo
+from cmtrace.graphics.svgcanvas import Canvas, MM_PER_PT, DEFAULT_FONT
+from cmtrace.graphics.svgpath import path_commands
+
+# millimetres per inch, to convert the resolution
+MM_PER_INCH = 25.4
+
+# points per inch, the device unit of vector surfaces
+PT_PER_INCH = 72.0
+
+# default resolution of raster images in pixels per inch
+DEFAULT_DPI = 96.0
+
+# the arrow head marker, as defined by SVGCanvas, with its reference point
+ARROW_MARKER = [(0.0, 0.0), (0.0, 6.0), (9.0, 3.0)]
+ARROW_MARKER_REFERENCE = (9.0, 3.0)
+ARROW_MARKER_COLOR = (255, 0, 0)
+
+
+def _paint(value):
+    """ return the color (r, g, b) of a fill value of an SVG path, a color tuple, 'none',
+    'rgb(r,g,b)' or '#rrggbb' or '#rgb', or None if the path is not filled """
+    if not isinstance(value, str):
+        return tuple(value)
+    value = value.strip()
+    if value == 'none':
+        return None
+    if value.startswith('rgb(') and value.endswith(')'):
+        return tuple(float(c) for c in value[4:-1].split(','))
+    if value.startswith('#'):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = ''.join(d+d for d in digits)
+        return tuple(int(digits[i:i+2], 16) for i in range(0, 6, 2))
+    raise ValueError(f"Unsupported fill color: {value}")
+
+
+class CairoCanvas(Canvas):
+    """ Canvas object with the drawing interface of SVGCanvas that draws directly on a
+    Cairo surface. The surface is created when the first shape is drawn, so the size
+    and the view box must be set before anything is drawn. Subclasses create the
+    surface for a particular output format. """
+
+    def __init__(self, filename='canvas.png', height_in_mm=200, width_in_mm=300):
+        super().__init__()
+        self.filename = filename
+        self.height_in_mm = height_in_mm
+        self.width_in_mm = width_in_mm
+        self.view_box = (0, 0, width_in_mm, height_in_mm)
+        # the surface and its Cairo context, created when the first shape is drawn
+        self.surface = None
+        self.cr = None
+
+    def set_view_box(self, xmin, ymin, width, height):
+        """ set the viewbox """
+        self._check_not_started()
+        self.view_box = (xmin, ymin, width, height)
+
+    def set_size(self, height_in_mm, width_in_mm):
+        """ set the size of the drawing """
+        self._check_not_started()
+        self.height_in_mm = height_in_mm
+        self.width_in_mm = width_in_mm
+
+    def _check_not_started(self):
+        if self.cr is not None:
+            raise RuntimeError("The size of the drawing cannot be changed after drawing.")
+
+    @abstractmethod
+    def create_surface(self, units_per_mm):
+        """ create the surface for the drawing with the given number of device units per
+        mm """
+
+    @abstractmethod
+    def units_per_mm(self):
+        """ return the number of device units per mm of the surface """
+
+    def _start(self):
+        """ return the Cairo context to draw on, creating the surface if needed """
+        if self.cr is None:
+            units_per_mm = self.units_per_mm()
+            if self.surface is None:
+                self.surface = self.create_surface(units_per_mm)
+            self.cr = cairo.Context(self.surface)
+            # map the view box onto the surface
+            xmin, ymin, width, height = self.view_box
+            self.cr.scale(units_per_mm*self.width_in_mm/width,
+                          units_per_mm*self.height_in_mm/height)
+            self.cr.translate(-xmin, -ymin)
+        return self.cr
+
+    @staticmethod
+    def _set_color(cr, color):
+        cr.set_source_rgb(color[0]/255.0, color[1]/255.0, color[2]/255.0)
+
+    def _fill_and_stroke(self, fillcolor, stroke_width, stroke_color):
+        """ fill and stroke the current path """
+        cr = self.cr
+        if fillcolor is not None:
+            self._set_color(cr, fillcolor)
+            if stroke_width > 0:
+                cr.fill_preserve()
+            else:
+                cr.fill()
+        if stroke_width > 0:
+            self._set_color(cr, stroke_color)
+            cr.set_line_width(stroke_width)
+            cr.stroke()
+        else:
+            cr.new_path()
+
+    def draw_text(self, text, insert, fill=(0, 0, 0), font_size=None,
+                  font=DEFAULT_FONT, text_anchor="start", alignment_baseline="auto"):
+        """ draw a piece of text at point 'insert' using color 'fill' anchoring
+        according to 'text_anchor' """
+        the_font_size = self.font_size if font_size is None else font_size
+        y_offset = 0.0
+        if alignment_baseline=="central":
+            y_offset = 0.25*the_font_size
+        cr = self._start()
+        cr.select_font_face(font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+        cr.set_font_size(the_font_size)
+        text = str(text)
+        x_advance = cr.text_extents(text)[4]
+        anchor = {'start': 0.0, 'middle': 0.5, 'end': 1.0}.get(text_anchor, 0.0)
+        cr.move_to(insert[0] - anchor*x_advance, insert[1] + y_offset)
+        self._set_color(cr, fill)
+        cr.show_text(text)
+        cr.new_path()
+
+    def draw_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT, \
+                  stroke_color=(0, 0, 0)):
+        """ draw a rectangle """
+        self._start().rectangle(insert[0], insert[1], size[0], size[1])
+        self._fill_and_stroke(fillcolor, stroke_width, stroke_color)
+
+    def draw_line(self, start, end, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0)):
+        """
+        draw a line from start (x1, y1) to end (x2, y2), using stroke_width
+        """
+        cr = self._start()
+        cr.move_to(start[0], start[1])
+        cr.line_to(end[0], end[1])
+        self._fill_and_stroke(None, stroke_width, stroke_color)
+
+    def draw_path(self, path_spec, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0), is_arrow=False, \
+                  fill='none', offset_pre=None, offset_post=None,
+                  scale=None):
+        """ add a path to the drawing, optionally apply offset and scale and optionally make
+        it an arrow """
+        cr = self._start()
+        cr.save()
+        if not ((offset_pre is None) and (offset_post is None) and (scale is None)):
+            # the same transformation as SVGCanvas.draw_path
+            if offset_pre is not None:
+                cr.translate(offset_pre[0], offset_pre[1])
+            if scale is not None:
+                cr.scale(scale, scale)
+            if offset_post is not None:
+                cr.translate(offset_post[0], offset_post[1])
+        # the end point of the path and its direction, for the arrow head
+        direction = None
+        current = (0.0, 0.0)
+        for command in path_commands(path_spec):
+            if command[0] == 'M':
+                cr.move_to(command[1], command[2])
+            elif command[0] == 'L':
+                cr.line_to(command[1], command[2])
+                direction = (current, command[1:3])
+            elif command[0] == 'C':
+                cr.curve_to(*command[1:])
+                direction = (command[3:5], command[5:7])
+            else:
+                cr.close_path()
+            current = cr.get_current_point()
+        self._fill_and_stroke(_paint(fill), stroke_width, stroke_color)
+        if is_arrow and direction is not None:
+            self._draw_arrow_head(direction, stroke_width)
+        cr.restore()
+
+    def _draw_arrow_head(self, direction, stroke_width):
+        """ draw the arrow head marker at the end of the direction, scaled by the stroke
+        width and oriented along the direction """
+        cr = self.cr
+        (x0, y0), (x1, y1) = direction
+        cr.save()
+        cr.translate(x1, y1)
+        cr.rotate(atan2(y1-y0, x1-x0))
+        cr.scale(stroke_width, stroke_width)
+        cr.translate(-ARROW_MARKER_REFERENCE[0], -ARROW_MARKER_REFERENCE[1])
+        cr.move_to(*ARROW_MARKER[0])
+        for point in ARROW_MARKER[1:]:
+            cr.line_to(*point)
+        cr.close_path()
+        self._set_color(cr, ARROW_MARKER_COLOR)
+        cr.fill()
+        cr.restore()
+
+    def draw_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT,
+                    stroke_color=(0, 0, 0)):
+        """ draw a circle """
+        cr = self._start()
+        cr.new_sub_path()
+        cr.arc(insert[0], insert[1], radius, 0.0, 2.0*pi)
+        self._fill_and_stroke(fillcolor, stroke_width, stroke_color)
+
+    def save(self):
+        """ complete the drawing and write it to the file """
+        self._start()
+        self.write_surface()
+        self.surface.finish()
+        self.surface = None
+        self.cr = None
+
+    def write_surface(self):
+        """ write the surface to the file, for surfaces that are not written while they
+        are drawn """
+
+
+class PNGCanvas(CairoCanvas):
+    """ Canvas object to create PNG images at a resolution in pixels per inch """
+
+    def __init__(self, filename='canvas.png', height_in_mm=200, width_in_mm=300,
+                 dpi=DEFAULT_DPI):
+        super().__init__(filename, height_in_mm, width_in_mm)
+        self.dpi = dpi
+
+    def units_per_mm(self):
+        """ return the number of pixels per mm """
+        return self.dpi / MM_PER_INCH
+
+    def create_surface(self, units_per_mm):
+        """ create an image surface of the size of the drawing in pixels """
+        return cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                                  max(1, ceil(self.width_in_mm*units_per_mm)),
+                                  max(1, ceil(self.height_in_mm*units_per_mm)))
+
+    def write_surface(self):
+        """ write the image to the PNG file """
+        self.surface.write_to_png(self.filename)
+
+
+class VectorCanvas(CairoCanvas):
+    """ Canvas object to create vector graphics files, which Cairo writes while they are
+    drawn; subclasses create the surface for the file format """
+
+    def units_per_mm(self):
+        """ return the number of points per mm """
+        return PT_PER_INCH / MM_PER_INCH
+
+
+class PDFCanvas(VectorCanvas):
+    """ Canvas object to create PDF documents """
+
+    def create_surface(self, units_per_mm):
+        """ create a PDF surface of the size of the drawing in points """
+        return cairo.PDFSurface(self.filename, self.width_in_mm*units_per_mm,
+                                self.height_in_mm*units_per_mm)
+
+
+class PSCanvas(VectorCanvas):
+    """ Canvas object to create PostScript documents, or encapsulated PostScript """
+
+    def __init__(self, filename='canvas.ps', height_in_mm=200, width_in_mm=300, eps=False):
+        super().__init__(filename, height_in_mm, width_in_mm)
+        self.eps = eps
+
+    def create_surface(self, units_per_mm):
+        """ create a PostScript surface of the size of the drawing in points """
+        surface = cairo.PSSurface(self.filename, self.width_in_mm*units_per_mm,
+                                  self.height_in_mm*units_per_mm)
+        surface.set_eps(self.eps)
+        return surface
+
+
+class PDFPagesCanvas(PDFCanvas):
+    """ Canvas object to create PDF documents with multiple pages. Every save completes
+    a page; the size and view box of the next page can be set before it is drawn. The
+    document is written by close. """
+
+    def _start(self):
+        """ return the Cairo context to draw on, starting a new page of the size of the
+        drawing if needed """
+        if self.cr is None and self.surface is not None:
+            units_per_mm = self.units_per_mm()
+            self.surface.set_size(self.width_in_mm*units_per_mm,
+                                  self.height_in_mm*units_per_mm)
+        return super()._start()
+
+    def save(self):
+        """ complete the current page """
+        self._start().show_page()
+        self.cr = None
+
+    def close(self):
+        """ complete the document and write it to the file """
+        if self.surface is not None:
+            self.surface.finish()
+        self.surface = None
+        self.cr = None
+
+
+# the extensions of the files that are drawn with Cairo
+CAIRO_EXTENSIONS = ['.png', '.pdf', '.ps', '.eps']
+
+
+def create_cairo_canvas(filename, height_in_mm, width_in_mm, dpi=DEFAULT_DPI):
+    """ create the Cairo canvas for the format of the extension of the filename, one of
+    CAIRO_EXTENSIONS, or return None for other extensions """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.png':
+        return PNGCanvas(filename, height_in_mm, width_in_mm, dpi)
+    if extension == '.pdf':
+        return PDFCanvas(filename, height_in_mm, width_in_mm)
+    if extension in ['.ps', '.eps']:
+        return PSCanvas(filename, height_in_mm, width_in_mm, extension == '.eps')
+    return None
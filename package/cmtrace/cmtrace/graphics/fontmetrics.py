@@ -0,0 +1,57 @@
+""" cached measurement of the extent of text """
+from collections import OrderedDict
+import cairo
+
+# the maximum number of text extents that are kept
+DEFAULT_CACHE_SIZE = 4096
+
+
+class FontMetrics:
+    """ Measures the extent of text with Cairo. One Cairo context is kept for every font
+    and font size, and the extents of the most recently measured texts are kept in a
+    least recently used cache of bounded size. """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        # the Cairo context per font and font size
+        self._contexts = {}
+        # the extents per font, font size and text, least recently used first
+        self._extents = OrderedDict()
+
+    def _context(self, font, font_size):
+        """ return the Cairo context to measure text in the font and font size """
+        context = self._contexts.get((font, font_size))
+        if context is None:
+            surface = cairo.SVGSurface(None, 1000, 1000)
+            context = cairo.Context(surface)
+            context.select_font_face(font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+            context.set_font_size(font_size)
+            self._contexts[(font, font_size)] = context
+        return context
+
+    def extent(self, text, font, font_size):
+        """ return the height and width of the text in the font and font size """
+        key = (font, font_size, text)
+        extent = self._extents.get(key)
+        if extent is not None:
+            self._extents.move_to_end(key)
+            return extent
+        _, _, width, height, _, _ = self._context(font, font_size).text_extents(text)
+        extent = self._extents[key] = (height, width)
+        if len(self._extents) > self.cache_size:
+            self._extents.popitem(last=False)
+        return extent
+
+    def measure(self, labels, font, font_size):
+        """ return the list of the height and width of every label in the font and font
+        size """
+        return [self.extent(label, font, font_size) for label in labels]
+
+    def clear(self):
+        """ remove all cached contexts and extents """
+        self._contexts.clear()
+        self._extents.clear()
+
+
+# the font metrics shared by all canvases
+FONT_METRICS = FontMetrics()
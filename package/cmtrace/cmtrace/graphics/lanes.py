@@ -0,0 +1,44 @@
+""" assignment of overlapping firings to lanes within a row of a Gantt chart """
+
+from heapq import heappush, heappop
+
+# intervals that overlap by less than this are considered not to overlap
+EPSILON = 1e-5
+
+
+class LaneAllocator:
+    """ Sweep-line allocation of intervals to lanes. Intervals are allocated in order
+    of their start times; every interval gets the lowest lane that is free at its
+    start, so the number of lanes is the maximum number of overlapping intervals. """
+
+    def __init__(self, epsilon=EPSILON):
+        self.epsilon = epsilon
+        # the number of lanes in use
+        self.depth = 0
+        # heap of the end times and lanes of the active intervals
+        self._active = []
+        # heap of the lanes that are free
+        self._free = []
+
+    def allocate(self, start, end):
+        """ return the lane of the interval from start to end """
+        active = self._active
+        # release the lanes of the intervals that have ended
+        while len(active) > 0 and active[0][0] <= start + self.epsilon:
+            heappush(self._free, heappop(active)[1])
+        if len(self._free) > 0:
+            lane = heappop(self._free)
+        else:
+            lane = self.depth
+            self.depth += 1
+        heappush(active, (end, lane))
+        return lane
+
+
+def allocate_lanes(intervals, epsilon=EPSILON):
+    """ allocate lanes to the intervals, tuples that start with the start and end time,
+    sorted on start time. Returns the list of lanes of the intervals and the number
+    of lanes, the maximum depth of overlapping intervals. """
+    allocator = LaneAllocator(epsilon)
+    lanes = [allocator.allocate(i[0], i[1]) for i in intervals]
+    return lanes, allocator.depth
@@ -0,0 +1,95 @@
+""" level of detail aggregation of firings that are too small to be seen individually """
+
+from math import floor
+
+# number of shades in which the utilisation of a strip is drawn
+UTILISATION_LEVELS = 16
+
+# millimetres per inch, to convert the resolution
+MM_PER_INCH = 25.4
+
+
+class FiringAggregator:
+    """ Collects the firings of a row that are narrower than a threshold number of
+    pixels into buckets of one pixel wide. For every bucket it keeps the time that
+    firings of every color occupy it, so that the bucket can be drawn as part of
+    an aggregated bar or as a strip shaded by the utilisation. The amount of output
+    depends on the width of the row in pixels, not on the number of firings. """
+
+    def __init__(self, pixels_per_unit, threshold):
+        self.pixels_per_unit = pixels_per_unit
+        self.threshold = threshold
+        # busy time per color for every bucket
+        self._buckets = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ create an aggregator for the resolution and threshold in the settings, or
+        return None if level of detail aggregation is off """
+        if settings.level_of_detail() == 'none':
+            return None
+        pixels_per_unit = settings.scale_mm_per_unit_x() * settings.lod_resolution() / \
+            MM_PER_INCH
+        return cls(pixels_per_unit, settings.lod_threshold())
+
+    def is_small(self, duration):
+        """ check if a firing of the duration, in units, is narrower than the threshold """
+        return duration * self.pixels_per_unit < self.threshold
+
+    def add(self, start, end, color):
+        """ add a firing from start to end, in units, drawn in color """
+        color = tuple(color)
+        ppu = self.pixels_per_unit
+        for bucket in range(floor(start*ppu), floor(end*ppu)+1):
+            busy = min(end, (bucket+1)/ppu) - max(start, bucket/ppu)
+            if busy <= 0.0:
+                continue
+            colors = self._buckets.get(bucket)
+            if colors is None:
+                colors = self._buckets[bucket] = {}
+            colors[color] = colors.get(color, 0.0) + busy
+
+    def bars(self):
+        """ return a list of (start, end, color) of the runs of adjacent buckets with
+        the same dominant color """
+        return [(start, end, color) for start, end, (color,) in
+                self._runs(lambda colors, busy: (_dominant(colors),))]
+
+    def strips(self):
+        """ return a list of (start, end, color, utilisation) of the runs of adjacent
+        buckets with the same dominant color and shade of utilisation """
+        levels = UTILISATION_LEVELS
+        ppu = self.pixels_per_unit
+        return [(start, end, color, level / levels) for start, end, (color, level) in
+                self._runs(lambda colors, busy: (
+                    _dominant(colors), max(1, min(levels, round(busy*ppu*levels)))))]
+
+    def _runs(self, key):
+        """ return the runs of adjacent buckets with the same key, computed from the
+        colors and the total busy time of a bucket """
+        runs = []
+        ppu = self.pixels_per_unit
+        run_start = run_end = run_key = None
+        for bucket in sorted(self._buckets):
+            colors = self._buckets[bucket]
+            bucket_key = key(colors, sum(colors.values()))
+            if bucket == run_end and bucket_key == run_key:
+                run_end = bucket + 1
+                continue
+            if run_key is not None:
+                runs.append((run_start/ppu, run_end/ppu, run_key))
+            run_start, run_end, run_key = bucket, bucket + 1, bucket_key
+        if run_key is not None:
+            runs.append((run_start/ppu, run_end/ppu, run_key))
+        return runs
+
+
+def _dominant(colors):
+    """ return the color that occupies a bucket for the longest time """
+    return max(colors.items(), key=lambda c: c[1])[0]
+
+
+def shade(color, utilisation, background):
+    """ blend the color with the background according to the utilisation """
+    return tuple(int(round(utilisation*c + (1.0-utilisation)*b))
+                 for c, b in zip(color, background))
@@ -0,0 +1,236 @@
+""" export of a Gantt chart as a pyramid of tiles at increasing resolutions, with an
+HTML viewer that loads the tiles that are visible """
+import copy
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+from cmtrace.graphics.svggraphics import SVGTraceDrawer
+from cmtrace.graphics.tiling import _render_tile, _row_bounds, _sorted_events, _tile_rows, \
+    _window_events
+from cmtrace.graphics.tracesettings import TraceSettings
+from cmtrace.graphics.lod import MM_PER_INCH
+
+# the tiles cover a multiple of the distance between the numbers on the time axis
+TICK_UNITS = 5
+
+# the maximum number of levels; level l has 2**l tiles
+MAX_PYRAMID_LEVELS = 16
+
+VIEWER_FILENAME = 'index.html'
+LABELS_FILENAME = 'labels'
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+html, body { margin: 0; height: 100%%; font-family: sans-serif; }
+#bar { padding: 4px 8px; border-bottom: 1px solid #ccc; background: #f4f4f4; }
+#bar button { width: 2em; }
+#page { display: flex; height: calc(100%% - 34px); overflow-y: auto; align-items: flex-start; }
+#labels { flex: none; }
+#view { flex: 1; overflow-x: auto; overflow-y: hidden; }
+#chart { position: relative; }
+#chart img { position: absolute; top: 0; }
+</style>
+</head>
+<body>
+<div id="bar">
+<button id="zoom-out" title="zoom out (-)">&minus;</button>
+<button id="zoom-in" title="zoom in (+)">+</button>
+<span id="status"></span>
+</div>
+<div id="page">
+<img id="labels" alt="">
+<div id="view"><div id="chart"></div></div>
+</div>
+<script>
+// the tiles of level l are l/0.ext to l/(2^l-1).ext, each covering 1/2^l of the time axis
+const config = %(config)s;
+const view = document.getElementById('view');
+const chart = document.getElementById('chart');
+const status = document.getElementById('status');
+const labels = document.getElementById('labels');
+const tiles = new Map();
+let level = 0;
+
+labels.src = config.labels;
+labels.style.width = config.labelsWidth + 'px';
+labels.style.height = config.height + 'px';
+
+function tileCount() {
+    return 2 ** level;
+}
+
+function layout() {
+    chart.style.width = (config.tileWidth * tileCount()) + 'px';
+    chart.style.height = config.height + 'px';
+}
+
+// load the visible tiles of the current level and drop all others
+function update() {
+    const first = Math.max(0, Math.floor(view.scrollLeft / config.tileWidth));
+    const last = Math.min(tileCount() - 1,
+        Math.floor((view.scrollLeft + view.clientWidth) / config.tileWidth));
+    for (const [key, tile] of tiles) {
+        if (tile.level !== level || tile.index < first || tile.index > last) {
+            tile.image.remove();
+            tiles.delete(key);
+        }
+    }
+    for (let index = first; index <= last; index++) {
+        const key = level + '/' + index;
+        if (!tiles.has(key)) {
+            const image = document.createElement('img');
+            image.src = key + '.' + config.extension;
+            image.style.left = (index * config.tileWidth) + 'px';
+            image.style.width = config.tileWidth + 'px';
+            image.style.height = config.height + 'px';
+            chart.appendChild(image);
+            tiles.set(key, {level: level, index: index, image: image});
+        }
+    }
+    status.textContent = 'level ' + level + ' of ' + (config.levels - 1) + ', tiles ' +
+        first + '-' + last + ' of ' + tileCount();
+}
+
+// change the level by delta, keeping the time at position x of the view in place
+function zoom(delta, x) {
+    const next = Math.min(config.levels - 1, Math.max(0, level + delta));
+    if (next === level) {
+        return;
+    }
+    const position = (view.scrollLeft + x) / (config.tileWidth * tileCount());
+    level = next;
+    layout();
+    view.scrollLeft = position * config.tileWidth * tileCount() - x;
+    update();
+}
+
+document.getElementById('zoom-in').onclick = () => zoom(1, view.clientWidth / 2);
+document.getElementById('zoom-out').onclick = () => zoom(-1, view.clientWidth / 2);
+view.addEventListener('scroll', update);
+window.addEventListener('resize', update);
+view.addEventListener('wheel', (event) => {
+    if (event.ctrlKey) {
+        event.preventDefault();
+        zoom(event.deltaY < 0 ? 1 : -1, event.clientX - view.getBoundingClientRect().left);
+    }
+}, {passive: false});
+document.addEventListener('keydown', (event) => {
+    if (event.key === '+' || event.key === '=') {
+        zoom(1, view.clientWidth / 2);
+    } else if (event.key === '-') {
+        zoom(-1, view.clientWidth / 2);
+    }
+});
+layout();
+update();
+</script>
+</body>
+</html>
+"""
+
+
+def save_gantt_pyramid(actors, arrivals, outputs, directory, levels, settings=None,
+                       workers=1, extension='svg'):
+    """ make a Gantt chart as a pyramid of levels of tiles in the directory, with a
+    viewer, index.html, that loads the tiles that are visible. Level 0 is a single
+    tile with the whole chart, every next level has twice as many tiles with twice the
+    resolution. Firings that are too small to be seen are drawn as their utilisation,
+    unless the level of detail in the settings is merge. The rows have the same
+    lanes and heights on every level. The row labels are drawn once, in labels.svg.
+    The tiles are drawn by workers processes, in the format of extension. levels is
+    at most MAX_PYRAMID_LEVELS. Returns the name of the viewer file. """
+    if not 1 <= levels <= MAX_PYRAMID_LEVELS:
+        raise ValueError(f"The number of levels should be from 1 to {MAX_PYRAMID_LEVELS}.")
+    if settings is None:
+        settings = TraceSettings()
+    base_settings = copy.deepcopy(settings)
+    level_of_detail = base_settings.level_of_detail()
+    # the tiles are drawn in parallel instead of their rows
+    base_settings.set_row_workers(1)
+    # the lanes of the rows are allocated once, to all firings, as drawn on the finest
+    # levels, and reused on every level
+    base_settings.set_level_of_detail('none')
+    drawer = SVGTraceDrawer(base_settings)
+    labels, row_lanes, trace_heights, offset_x = drawer.prepare_gantt(actors, arrivals,
+                                                                      outputs)
+    base_settings.set_level_of_detail('utilisation' if level_of_detail == 'none'
+                                      else level_of_detail)
+    unit = base_settings.unit()
+    tile_units = TICK_UNITS * ceil(base_settings.length() / TICK_UNITS)
+    tile_width = tile_units * base_settings.scale_mm_per_unit_x()
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # the labels, without firings, in the margin left of the time axis
+    labels_settings = copy.deepcopy(base_settings)
+    labels_settings.width = offset_x
+    no_firings = [([], [], depth) for (_, _, depth) in row_lanes]
+    labels_filename = f"{LABELS_FILENAME}.{extension}"
+    _render_tile(labels_settings, labels, no_firings, trace_heights,
+                 {name: [] for name in arrivals}, {name: [] for name in outputs}, offset_x,
+                 0.0, os.path.join(directory, labels_filename))
+
+    bounds = _row_bounds(row_lanes)
+    level_jobs = (_level_jobs(base_settings, row_lanes, bounds, arrivals, outputs, labels,
+                              trace_heights, level, unit, drawer.time_offset, tile_units,
+                              tile_width, os.path.join(directory, str(level)), extension)
+                  for level in range(levels))
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for jobs in level_jobs:
+                list(executor.map(_render_tile, *zip(*jobs)))
+    else:
+        for jobs in level_jobs:
+            for job in jobs:
+                _render_tile(*job)
+
+    pixels_per_mm = base_settings.dpi() / MM_PER_INCH
+    config = {
+        'levels': levels,
+        'extension': extension,
+        'labels': labels_filename,
+        'tileWidth': round(tile_width * pixels_per_mm, 3),
+        'labelsWidth': round(offset_x * pixels_per_mm, 3),
+        'height': round(base_settings.height * pixels_per_mm, 3)
+    }
+    viewer_filename = os.path.join(directory, VIEWER_FILENAME)
+    with open(viewer_filename, 'w', encoding='utf-8') as viewer_file:
+        viewer_file.write(VIEWER_TEMPLATE % {
+            'title': html.escape(os.path.basename(os.path.abspath(directory))),
+            'config': json.dumps(config)})
+    return viewer_filename
+
+
+def _level_jobs(settings, row_lanes, bounds, arrivals, outputs, labels, trace_heights, level,
+                unit, origin, tile_units, tile_width, level_dir, extension):
+    """ return the arguments of _render_tile for the tiles of a level of the pyramid,
+    in the folder level_dir. row_lanes are the rows of the whole chart, as computed by
+    prepare_gantt with the unit of level 0 and the time origin at the start of the first
+    tile, and bounds their bounds, as computed by _row_bounds. The tiles of the level
+    are drawn with a unit 2**level times smaller, with the same lanes. The tiles have
+    no labels, their view box starts at the time axis. """
+    scale = 2**level
+    unit = unit / scale
+    level_settings = copy.deepcopy(settings)
+    level_settings.set_unit(unit)
+    level_settings.set_length(tile_units)
+    level_settings.width = tile_width
+    arrivals, outputs = _sorted_events(arrivals), _sorted_events(outputs)
+    if not os.path.exists(level_dir):
+        os.makedirs(level_dir)
+    jobs = []
+    for index in range(scale):
+        start, end = index*tile_units, (index+1)*tile_units
+        t_start, t_end = origin + start*unit, origin + end*unit
+        jobs.append((copy.deepcopy(level_settings), labels,
+                     _tile_rows(row_lanes, start, end, bounds, scale), trace_heights,
+                     _window_events(arrivals, t_start, t_end),
+                     _window_events(outputs, t_start, t_end), 0.0, t_start,
+                     os.path.join(level_dir, f"{index}.{extension}")))
+    return jobs
@@ -0,0 +1,134 @@
+""" on-disk cache of rendered figures, keyed on the contents of what they are made of """
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from cmtrace import __version__
+from cmtrace.trace.tracecache import content_hash, default_cache_dir
+
+# the folder of the render cache in the cache directory
+RENDER_CACHE_FOLDER = 'renders'
+
+# default size of the render cache, can be overruled by an environment variable
+DEFAULT_RENDER_CACHE_SIZE = 1 << 30
+RENDER_CACHE_SIZE_VARIABLE = 'CMTRACE_RENDER_CACHE_SIZE'
+
+# settings that do not change the figure
+OUTPUT_INDEPENDENT_SETTINGS = ['graphics:svg-writer', 'graphics:row-workers']
+
+
+class RenderCache:
+    """ Cache of rendered figures. Entries are keyed on a hash of the contents of the
+    trace file, the effective settings, the kind of chart, the format of the figure
+    and the version of cmtrace, so that a figure is only drawn again if one of them
+    changes. A cached figure is copied to the output file. The total size of the
+    cache is bounded; the least recently used entries are evicted first. """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory if directory is not None else \
+            os.path.join(default_cache_dir(), RENDER_CACHE_FOLDER)
+        if max_size is None:
+            max_size = int(os.environ.get(RENDER_CACHE_SIZE_VARIABLE, DEFAULT_RENDER_CACHE_SIZE))
+        self.max_size = max_size
+
+    @staticmethod
+    def key(trace_hash, settings, kind, filename, trace_format=None):
+        """ return the key of the figure of the trace with the content hash trace_hash,
+        drawn with the settings as the kind of chart in the format of the extension of
+        filename. The key must be determined before the figure is drawn, as drawing
+        completes the settings. """
+        effective = settings.effective_settings()
+        for tag in OUTPUT_INDEPENDENT_SETTINGS:
+            effective.pop(tag, None)
+        description = {
+            'version': __version__,
+            'trace': trace_hash,
+            'format': trace_format,
+            'kind': kind,
+            'output': os.path.splitext(filename)[1].lower(),
+            'settings': effective,
+            'size': [settings.height, settings.width]
+        }
+        data = json.dumps(description, sort_keys=True, default=repr)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def trace_hash(filename):
+        """ return the content hash of a trace file, for key """
+        return content_hash(filename)
+
+    def entry_path(self, key):
+        """ return the path of the cache entry with the key """
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, filename):
+        """ copy the cached figure with the key to filename and return True, or return
+        False if it is not in the cache """
+        path = self.entry_path(key)
+        try:
+            shutil.copyfile(path, filename)
+        except OSError:
+            return False
+        # mark the entry as recently used
+        os.utime(path)
+        return True
+
+    def store(self, key, filename):
+        """ store the figure in filename in the cache with the key """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return
+        if size > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # copy to a temporary file first, so that readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f, open(filename, 'rb') as figure:
+                shutil.copyfileobj(figure, f)
+            os.replace(temp_path, self.entry_path(key))
+        except OSError:
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def entries(self):
+        """ return a list of (path, size, last use time) of the cache entries """
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for name in os.listdir(self.directory):
+            if not name.endswith('.tmp'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((path, stat.st_size, stat.st_mtime))
+        return result
+
+    def evict(self):
+        """ remove the least recently used entries until the cache fits in its
+        maximum size """
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(e[1] for e in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """ remove all entries from the cache """
+        for path, _, _ in self.entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,43 @@
+""" immutable render context compiled from the trace settings """
+
+
+class RenderContext:
+    """ The settings that are used while drawing a chart, validated once and stored
+    in plain attributes, so that drawing a firing or an event does not look up and
+    parse the settings. It also holds the affine transformation of time, in units
+    or in time stamps, to millimetres. A render context cannot be modified. """
+
+    __slots__ = (
+        'unit', 'scale_x', 'scale_y', 'origin_x', 'origin_y',
+        'overlap_offset', 'overlap_horizontal_offset', 'event_radius',
+        'font', 'font_size', 'label_separation', 'tick_length', 'tick_number_separation',
+        'column_line_width', 'border_line_width', 'firing_stroke_width',
+        'background_color', 'row_background_color', 'alternate_color', 'show_text_labels',
+        'firing_color_mode', 'vector_color_mode', 'level_of_detail', 'batch_paths'
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("A render context cannot be modified.")
+
+    def __delattr__(self, name):
+        raise AttributeError("A render context cannot be modified.")
+
+    def x(self, t):
+        """ return the horizontal position in mm of time t in units """
+        return self.origin_x + t*self.scale_x
+
+    def x_of_time(self, t):
+        """ return the horizontal position in mm of time stamp t """
+        return self.origin_x + t/self.unit*self.scale_x
+
+    def width_of_time(self, t):
+        """ return the width in mm of a duration t in time stamps """
+        return t/self.unit*self.scale_x
+
+    def y(self, v):
+        """ return the vertical position in mm of v rows """
+        return self.origin_y + v*self.scale_y
@@ -1,6 +1,7 @@
 """ support for generating graphics in SVG """
+from abc import ABC, abstractmethod
 import svgwrite
-import cairo
+from cmtrace.graphics.fontmetrics import FONT_METRICS
 from cmtrace.latexsvg.latexsvg import latex_to_svg
 
 # conversion constants
@@ -13,10 +14,211 @@ DEFAULT_FONT = "Calibri, Arial"
 # scaling factor to make latex formulas appear in the correct size
 LATEX_SCALE = 1.4
 
-class SVGCanvas:
+# style properties that are lengths, which need a unit in a style sheet
+LENGTH_PROPERTIES = ['font-size', 'stroke-width']
+
+class PathBatch:
+    """ Collects rectangles and circles to draw all shapes with the same fill color and
+    stroke width as a single path, in the order in which the colors are first used. """
+
+    def __init__(self):
+        # the path segments per fill color and stroke width
+        self._segments = {}
+
+    def _add(self, fillcolor, stroke_width, segment):
+        key = (tuple(fillcolor), stroke_width)
+        segments = self._segments.get(key)
+        if segments is None:
+            segments = self._segments[key] = []
+        segments.append(segment)
+
+    def add_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT):
+        """ add a rectangle with top left corner insert and size (width, height) """
+        self._add(fillcolor, stroke_width,
+                  f'M{insert[0]},{insert[1]}h{size[0]}v{size[1]}h{-size[0]}z')
+
+    def add_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT):
+        """ add a circle with center insert, as two arcs """
+        self._add(fillcolor, stroke_width,
+                  f'M{insert[0]-radius},{insert[1]}a{radius},{radius} 0 1,0 {2*radius},0'
+                  f'a{radius},{radius} 0 1,0 {-2*radius},0z')
+
+    def draw(self, canvas, stroke_color=(0, 0, 0)):
+        """ draw the paths on the canvas """
+        for (fillcolor, stroke_width), segments in self._segments.items():
+            canvas.draw_path(' '.join(segments), stroke_width=stroke_width,
+                             stroke_color=stroke_color, fill=svgwrite.rgb(*fillcolor))
+        self._segments = {}
+
+
+class Canvas(ABC):
+    """ The drawing interface of the canvases. Subclasses draw the shapes in a particular
+    format; a canvas of a document also has a size and a view box and is saved. """
+
+    def __init__(self, css_styles=False):
+        # set the font size to the default size
+        self.font_size = DEFAULT_FONT_SIZE
+        # the class names of the distinct styles, if styles are collected in a style sheet
+        # instead of being written with every element
+        self.styles = {} if css_styles else None
+
+    def set_font_size(self, font_size):
+        """ set the default font size for draw_text """
+        self.font_size = font_size
+
+    def _style(self, *properties):
+        """ return the attributes to give an element the style properties, name and
+        value pairs, either the properties themselves or the class of the style """
+        if self.styles is None:
+            return dict(properties)
+        name = self.styles.get(properties)
+        if name is None:
+            name = self.styles[properties] = f's{len(self.styles)}'
+        return {'class': name}
+
+    def style_sheet(self):
+        """ return the style sheet with the classes of the collected styles """
+        rules = []
+        for properties, name in self.styles.items():
+            declarations = ';'.join(f'{p}:{v}px' if p in LENGTH_PROPERTIES else f'{p}:{v}'
+                                    for p, v in properties)
+            rules.append(f'.{name}{{{declarations}}}')
+        return '\n'.join(rules)
+
+    @staticmethod
+    def text_extent(text, font=DEFAULT_FONT, font_size=14):
+        """ Return height and width of the text in given font and font """
+        return FONT_METRICS.extent(text, font, font_size)
+
+    @staticmethod
+    def text_extents(labels, font=DEFAULT_FONT, font_size=14):
+        """ Return the list of the height and width of the labels in given font and font size """
+        return FONT_METRICS.measure(labels, font, font_size)
+
+    @abstractmethod
+    def draw_text(self, text, insert, fill=(0, 0, 0), font_size=None,
+                  font=DEFAULT_FONT, text_anchor="start", alignment_baseline="auto"):
+        """ draw a piece of text at point 'insert' using color 'fill' anchoring
+        according to 'text_anchor' """
+
+    @abstractmethod
+    def draw_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT, \
+                  stroke_color=(0, 0, 0)):
+        """ draw a rectangle """
+
+    @abstractmethod
+    def draw_line(self, start, end, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0)):
+        """
+        draw a line from start (x1, y1) to end (x2, y2), using stroke_width
+        """
+
+    @abstractmethod
+    def draw_path(self, path_spec, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0), is_arrow=False, \
+                  fill='none', offset_pre=None, offset_post=None,
+                  scale=None):
+        """ add a path to the drawing, optionally apply offset and scale and optionally make
+        it an arrow """
+
+    @abstractmethod
+    def draw_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT,
+                    stroke_color=(0, 0, 0)):
+        """ draw a circle """
+
+    def draw_text_latex(self, latex_str, color, position, anchor=(0, 0), scale=1.0):
+        """ Add text with LaTeX equation formatting at the relative anchor point
+        and apply optional scale."""
+        # invoke to latex_to_svg to deliver a collection of glyphs and instances of those glyphs
+        glyphs, instances, width, height = latex_to_svg(latex_str)
+        # determine the absolute anchor point
+        anchor_abs = (-anchor[0]*width, -anchor[1]*height)
+        # draw all the instances in the LaTeX result
+        for (coords, glyph) in instances:
+            # compute the offset for the current glyph instance from the absolute
+            # anchor and the coors of the glyph
+            offset = [sum(x) for x in zip(coords, anchor_abs)]
+            # draw the glyph as a path on the canvas
+            self.draw_path(glyphs[glyph[1:]], stroke_width=0.0, fill=color, \
+                           offset_post=offset, offset_pre=position, scale=LATEX_SCALE*scale)
+
+
+class RecordingCanvas(Canvas):
+    """ Canvas object that records the shapes drawn on it, and the size and view box of
+    the drawing, and draws them on the canvas it is given as well, if any. The
+    recording can be drawn again on other canvases, also in other processes. """
+
+    def __init__(self, canvas=None):
+        super().__init__()
+        self.canvas = canvas
+        # the calls of the drawing methods, with their arguments
+        self.calls = []
+
+    def _record(self, method, *args):
+        self.calls.append((method, args))
+        if self.canvas is not None:
+            getattr(self.canvas, method)(*args)
+
+    @staticmethod
+    def replay(calls, canvas):
+        """ draw the recorded calls on the canvas """
+        for method, args in calls:
+            getattr(canvas, method)(*args)
+
+    def set_font_size(self, font_size):
+        """ set the default font size for draw_text """
+        super().set_font_size(font_size)
+        self._record('set_font_size', font_size)
+
+    def set_view_box(self, xmin, ymin, width, height):
+        """ set the viewbox """
+        self._record('set_view_box', xmin, ymin, width, height)
+
+    def set_size(self, height_in_mm, width_in_mm):
+        """ set the size of the drawing """
+        self._record('set_size', height_in_mm, width_in_mm)
+
+    def draw_text(self, text, insert, fill=(0, 0, 0), font_size=None,
+                  font=DEFAULT_FONT, text_anchor="start", alignment_baseline="auto"):
+        """ draw a piece of text at point 'insert' using color 'fill' anchoring
+        according to 'text_anchor' """
+        self._record('draw_text', text, insert, fill, font_size, font, text_anchor,
+                     alignment_baseline)
+
+    def draw_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT, \
+                  stroke_color=(0, 0, 0)):
+        """ draw a rectangle """
+        self._record('draw_rect', insert, size, fillcolor, stroke_width, stroke_color)
+
+    def draw_line(self, start, end, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0)):
+        """
+        draw a line from start (x1, y1) to end (x2, y2), using stroke_width
+        """
+        self._record('draw_line', start, end, stroke_width, stroke_color)
+
+    def draw_path(self, path_spec, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0), is_arrow=False, \
+                  fill='none', offset_pre=None, offset_post=None,
+                  scale=None):
+        """ add a path to the drawing, optionally apply offset and scale and optionally make
+        it an arrow """
+        self._record('draw_path', path_spec, stroke_width, stroke_color, is_arrow, fill,
+                     offset_pre, offset_post, scale)
+
+    def draw_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT,
+                    stroke_color=(0, 0, 0)):
+        """ draw a circle """
+        self._record('draw_circle', insert, radius, fillcolor, stroke_width, stroke_color)
+
+    def save(self):
+        """ save the canvas that is drawn on as well, if any """
+        if self.canvas is not None:
+            self.canvas.save()
+
+
+class SVGCanvas(Canvas):
     """ Canvas object to create SVG drawings. """
 
-    def __init__(self, filename='canvas.svg', height_in_mm=200, width_in_mm=300):
+    def __init__(self, filename='canvas.svg', height_in_mm=200, width_in_mm=300,
+                 css_styles=False):
+        super().__init__(css_styles)
         height = str(height_in_mm)+'mm'
         width = str(width_in_mm)+'mm'
         # create the SVG drawing
@@ -29,27 +231,29 @@ class SVGCanvas:
         self.arrow_marker.add(self.drawing.path(d='M0,0 L0,6 L9,3 z', fill='#f00'))
         # add the arrow marker to defs section of the drawing
         self.drawing.defs.add(self.arrow_marker)
-        # set the font size to the default size
-        self.font_size= DEFAULT_FONT_SIZE
-
-    def set_font_size(self, font_size):
-        """ set the default font size for draw_text """
-        self.font_size = font_size
+        # the element to which drawn shapes are added
+        self.container = self.drawing
+        self._style_sheet = None
 
     def set_view_box(self, xmin, ymin, width, height):
         """ set the viewbox """
         self.drawing.viewbox(xmin, ymin, width, height)
 
-    @staticmethod
-    def text_extent(text, font=DEFAULT_FONT, font_size=14):
-        """ Return height and width of the text in given font and font """
-        surface = cairo.SVGSurface(None, 1000, 1000)
-        # surface.set_document_unit(cairo.SVG_UNIT_MM)
-        cr = cairo.Context(surface)
-        cr.select_font_face(font, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-        cr.set_font_size(font_size)
-        xbearing, ybearing, width, height, xadvance, yadvance = cr.text_extents(text)
-        return height, width
+    def set_size(self, height_in_mm, width_in_mm):
+        """ set the size of the drawing """
+        self.drawing['height'] = str(height_in_mm)+'mm'
+        self.drawing['width'] = str(width_in_mm)+'mm'
+
+    def add_group(self, parent=None):
+        """ add a group to the parent group, or to the drawing, and return it """
+        group = svgwrite.container.Group()
+        (self.drawing if parent is None else parent).add(group)
+        return group
+
+    def set_container(self, container=None):
+        """ add the shapes drawn from now on to the container group, or to the drawing
+        if container is None """
+        self.container = self.drawing if container is None else container
 
     def draw_text(self, text, insert, fill=(0, 0, 0), font_size=None,
                   font=DEFAULT_FONT, text_anchor="start", alignment_baseline="auto"):
@@ -67,25 +271,26 @@ class SVGCanvas:
             y_offset = 0.25*the_font_size
 
         # add text element to the drawing
-        self.drawing.add(self.drawing.text(text, insert=(insert[0], insert[1] + \
-                                    y_offset), fill=svgwrite.rgb(*fill), \
-            font_size=the_font_size, font_family=font, text_anchor=text_anchor, \
-                alignment_baseline="auto"))
+        self.container.add(self.drawing.text(text, insert=(insert[0], insert[1] + \
+                                    y_offset), **self._style(('fill', svgwrite.rgb(*fill)), \
+            ('font-size', the_font_size), ('font-family', font), ('text-anchor', text_anchor), \
+                ('alignment-baseline', "auto"))))
 
     def draw_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT, \
                   stroke_color=(0, 0, 0)):
         """ draw a rectangle """
         # add rectangle to the drawing
-        self.drawing.add(self.drawing.rect(insert=(insert[0], insert[1]), size=(size[0], size[1]), \
-                    fill=svgwrite.rgb(*fillcolor), stroke_width=stroke_width, \
-                    stroke=svgwrite.rgb(*stroke_color)))
+        self.container.add(self.drawing.rect(insert=(insert[0], insert[1]), size=(size[0], size[1]), \
+                    **self._style(('fill', svgwrite.rgb(*fillcolor)), ('stroke-width', stroke_width), \
+                    ('stroke', svgwrite.rgb(*stroke_color)))))
 
     def draw_line(self, start, end, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0)):
         """
         draw a line from start (x1, y1) to end (x2, y2), using stroke_width
         """
-        self.drawing.add(self.drawing.line(start=(start[0], start[1]), end=(end[0], end[1]), \
-                    stroke_width=stroke_width, stroke=svgwrite.rgb(*stroke_color)))
+        self.container.add(self.drawing.line(start=(start[0], start[1]), end=(end[0], end[1]), \
+                    **self._style(('stroke-width', stroke_width), \
+                    ('stroke', svgwrite.rgb(*stroke_color)))))
 
     def draw_path(self, path_spec, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0), is_arrow=False, \
                   fill='none', offset_pre=None, offset_post=None,
@@ -94,7 +299,7 @@ class SVGCanvas:
         it an arrow """
         # check if adding a transformation is required
         if (offset_pre is None) and (offset_post is None) and (scale is None):
-            container = self.drawing
+            container = self.container
         else:
             if scale is None:
                 scale = 1.0
@@ -108,11 +313,12 @@ class SVGCanvas:
             container = svgwrite.container.Group(
                 transform=f'translate({offset_pre[0]},{offset_pre[1]}) scale({scale})" \
                     f"translate({offset_post[0]},{offset_post[1]})')
-            self.drawing.add(container)
+            self.container.add(container)
 
         # create the path
         path = container.add(self.drawing.path(d=path_spec, \
-                    stroke_width=stroke_width, stroke=svgwrite.rgb(*stroke_color), fill=fill))
+                    **self._style(('stroke-width', stroke_width), \
+                    ('stroke', svgwrite.rgb(*stroke_color)), ('fill', fill))))
         # if it is an arrow, add the arrow head marker to the end of the path
         if is_arrow:
             path.set_markers((None, None, self.arrow_marker))
@@ -120,26 +326,16 @@ class SVGCanvas:
     def draw_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT,
                     stroke_color=(0, 0, 0)):
         """ draw a circle """
-        self.drawing.add(self.drawing.circle(center=(insert[0], insert[1]), r=radius, \
-                    fill=svgwrite.rgb(*fillcolor), stroke_width=stroke_width, \
-                    stroke=svgwrite.rgb(*stroke_color)))
-
-    def draw_text_latex(self, latex_str, color, position, anchor=(0, 0), scale=1.0):
-        """ Add text with LaTeX equation formatting at the relative anchor point
-        and apply optional scale."""
-        # invoke to latex_to_svg to deliver a collection of glyphs and instances of those glyphs
-        glyphs, instances, width, height = latex_to_svg(latex_str)
-        # determine the absolute anchor point
-        anchor_abs = (-anchor[0]*width, -anchor[1]*height)
-        # draw all the instances in the LaTeX result
-        for (coords, glyph) in instances:
-            # compute the offset for the current glyph instance from the absolute
-            # anchor and the coors of the glyph
-            offset = [sum(x) for x in zip(coords, anchor_abs)]
-            # draw the glyph as a path on the SVG drawing
-            self.draw_path(glyphs[glyph[1:]], stroke_width=0.0, fill=color, \
-                           offset_post=offset, offset_pre=position, scale=LATEX_SCALE*scale)
+        self.container.add(self.drawing.circle(center=(insert[0], insert[1]), r=radius, \
+                    **self._style(('fill', svgwrite.rgb(*fillcolor)), ('stroke-width', stroke_width), \
+                    ('stroke', svgwrite.rgb(*stroke_color)))))
 
     def save(self):
         """ save the canvas to a file """
+        if self.styles:
+            # replace the style sheet of an earlier save
+            if self._style_sheet is not None:
+                self.drawing.elements.remove(self._style_sheet)
+            self._style_sheet = self.drawing.style(self.style_sheet())
+            self.drawing.add(self._style_sheet)
         self.drawing.save()
@@ -0,0 +1,287 @@
+""" incremental drawing of Gantt charts of traces that are still being written """
+
+import os
+import tempfile
+from cmtrace.graphics.svggraphics import SVGTraceDrawer
+from cmtrace.graphics.svgcanvas import SVGCanvas
+from cmtrace.graphics.tracesettings import SCENARIO_SEPARATOR
+from cmtrace.graphics.lanes import LaneAllocator, EPSILON
+
+
+class FollowedRow:
+    """ A row of a followed Gantt chart. It is drawn in its own group that is moved
+    down when rows above it grow, so that its firings never have to be redrawn. """
+
+    def __init__(self, label, group, label_group, content_group):
+        self.label = label
+        self.group = group
+        self.label_group = label_group
+        self.content_group = content_group
+        # allocates the lanes of the firings in the row
+        self.lanes = LaneAllocator()
+        # number of firings drawn, for the alternating colors
+        self.count = 0
+        # position of the last event drawn, to detect overlapping events
+        self.prev_event = None
+
+    def height(self, overlap_offset):
+        """ return the height of the row in vertical units """
+        return 1.0 + max(0, self.lanes.depth-1) * overlap_offset
+
+
+class SVGTraceFollower(SVGTraceDrawer):
+    """ Draws the Gantt chart of a trace that grows while it is followed. New firings
+    and events are appended to the groups of their rows. When the time axis gets
+    longer, or rows are added or grow, only the axes are redrawn, the rows below are
+    moved and the size of the canvas is adjusted. The time unit is fixed when the
+    first firings are drawn; if it is determined automatically, a warning is printed
+    when the chart grows to a length for which another unit would have been chosen. """
+
+    def __init__(self, filename, settings=None):
+        super().__init__(settings)
+        self.filename = filename
+        self.input_rows = []
+        self.actor_rows = []
+        self.output_rows = []
+        self._rows_by_label = {}
+        # the row of every actor, or None if it is not drawn
+        self._actor_row = {}
+        # number of firings without iteration number per actor
+        self._iterations = {}
+        self._max_time = 0.0
+        self._auto_length = False
+        self._auto_unit = False
+        self._offset_x = 0.0
+        self._back = None
+        self._rows = None
+        self._front = None
+        self._color_map = None
+
+    def update(self, actors, firings, inputs, outputs):
+        """ draw the new firings, a dict from actor names to lists of firing intervals,
+        and new input and output time stamps, dicts from names to lists of time stamps.
+        actors is the dict with all actors read so far. Returns True if anything was
+        drawn. """
+        if len(firings) == 0 and len(inputs) == 0 and len(outputs) == 0:
+            return False
+        # the heights of the rows before drawing, None if nothing has been laid out yet
+        heights = None
+        if self.canvas is None:
+            self._start(actors)
+        else:
+            heights = self._heights()
+        # rows of input and output time stamps
+        for name, stamps in inputs.items():
+            self._draw_events(self._event_row(name, self.input_rows), stamps)
+        for name, stamps in outputs.items():
+            self._draw_events(self._event_row(name, self.output_rows), stamps)
+        # rows of actor firings
+        row_firings = {}
+        for name, intervals in firings.items():
+            row = self._row_of_actor(actors[name])
+            if row is not None:
+                if id(row) not in row_firings:
+                    row_firings[id(row)] = (row, [])
+                row_firings[id(row)][1].extend(self._scale_firings(actors[name], intervals))
+            for firing in intervals:
+                self._max_time = max(self._max_time, firing[1] - self.time_offset)
+        for row, scaled_firings in row_firings.values():
+            self._draw_row_firings(row, scaled_firings)
+        for stamps in list(inputs.values()) + list(outputs.values()):
+            self._max_time = max([self._max_time] + [t - self.time_offset for t in stamps])
+
+        if self._auto_unit and \
+            self.settings.default_unit_of_length(self._max_time) > self.settings.unit():
+            print(f"Warning: the time unit {self.settings.unit()} was determined from the "
+                  "first firings and is small for the length of the trace; set layout:unit "
+                  "in the settings.")
+            self._auto_unit = False
+
+        length_changed = False
+        if self._auto_length:
+            length = self._max_time / self.settings.unit() * (1+self.settings.length_extension())
+            if length > self.settings.length():
+                self.settings.set_length(length)
+                length_changed = True
+        if length_changed or self._heights() != heights:
+            self._layout()
+        return True
+
+    def save(self):
+        """ save the figure, replacing the file atomically so that viewers never see a
+        partially written figure """
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                self.canvas.drawing.write(f)
+            os.replace(temp_path, self.filename)
+        except OSError:
+            os.remove(temp_path)
+            raise
+
+    def _start(self, actors):
+        """ fix the time unit and create the canvas with groups for the background
+        axes, the rows and the front axes """
+        current = [(None, list(actors.values()))]
+        if self.settings.unit() is None or self.settings.unit() == 'auto':
+            self._auto_unit = True
+            self.settings.set_unit(self.settings.default_unit(current))
+        # the time axis starts at the start of the time window
+        self.time_offset = self.settings.time_origin()
+        if self.settings.length() is None or self.settings.length() == 'auto':
+            self._auto_length = True
+            self.settings.set_length(0.0)
+
+        # validate the settings before drawing
+        self.context = self.settings.compile()
+
+        self._color_map = self.settings.color_map()
+        if self._color_map is None:
+            self._color_map = {}
+            self.settings.set_color_map(self._color_map)
+
+        self.canvas = SVGCanvas(self.filename, 0.0, 0.0)
+        self._back = self.canvas.add_group()
+        self._rows = self.canvas.add_group()
+        self._front = self.canvas.add_group()
+
+        # the rows of the structure in the settings are known in advance
+        structure = self.settings.structure()
+        for label in self.settings.rows():
+            row = self._add_row(label, self.actor_rows)
+            for name in structure.get(label, [label]):
+                self._actor_row[name] = row
+
+    def _add_row(self, label, rows):
+        """ add a new row with the label at the end of rows """
+        group = self.canvas.add_group(self._rows)
+        row = FollowedRow(label, group, self.canvas.add_group(group),
+                          self.canvas.add_group(group))
+        rows.append(row)
+        label_size = SVGCanvas.text_extent(label, self.settings.font(),
+                                           self.settings.font_size())[1] + \
+            2*self.settings.label_separation()
+        self._offset_x = max(self._offset_x, label_size)
+        return row
+
+    def _event_row(self, name, rows):
+        """ return the row of the input or output events with the name """
+        for row in rows:
+            if row.label == name:
+                return row
+        return self._add_row(name, rows)
+
+    def _row_of_actor(self, actor):
+        """ return the row in which the actor is drawn, adding a row to the default
+        structure if needed, and assign colors to new actors and scenarios """
+        if actor.name not in self._iterations:
+            self._iterations[actor.name] = 0
+            palette = self.settings.color_palette()
+            if self.settings.firing_color_mode() == 'by-scenario':
+                key = actor.scenario
+            else:
+                key = actor.name
+            if key not in self._color_map:
+                self._color_map[key] = palette[len(self._color_map) % len(palette)]
+        if actor.name in self._actor_row:
+            return self._actor_row[actor.name]
+        if len(self.settings.rows()) > 0:
+            # the actor is not drawn
+            self._actor_row[actor.name] = None
+            return None
+        # default structure, one row per actor name, across scenarios
+        label = actor.name.split(SCENARIO_SEPARATOR)[-1]
+        row = self._rows_by_label.get(label)
+        if row is None:
+            row = self._add_row(label, self.actor_rows)
+            self._rows_by_label[label] = row
+            if self.settings.row_order() == "by-actor-name":
+                self.actor_rows.sort(key=lambda r: r.label)
+        self._actor_row[actor.name] = row
+        return row
+
+    def _scale_firings(self, actor, intervals):
+        """ return the firings of the actor as tuples of the start and end in units,
+        actor name, scenario, text label and iteration as draw_firings expects them """
+        unit = self.settings.unit()
+        result = []
+        for firing in intervals:
+            if firing[2] is not None:
+                iteration = int(firing[2])
+            else:
+                iteration = self._iterations[actor.name]
+            self._iterations[actor.name] += 1
+            result.append(((firing[0]-self.time_offset)/unit,
+                           (firing[1]-self.time_offset)/unit,
+                           actor.name, actor.scenario, firing[3], iteration))
+        return result
+
+    def _draw_row_firings(self, row, firings):
+        """ append the scaled firings to the row, in order of their start times """
+        firings.sort(key=lambda f: f[0])
+        coloring_mode = self.context.firing_color_mode
+        color_palette = self.settings.color_palette()
+        self.canvas.set_container(row.content_group)
+        for firing in firings:
+            f_color = self.firing_color(firing, row.count, coloring_mode, self._color_map,
+                                        color_palette)
+            lane = row.lanes.allocate(firing[0], firing[1])
+            # make sure that zero-length firings are visible
+            if firing[1] - firing[0] < EPSILON:
+                f_start = firing[0] - 0.05
+                f_duration = 0.1
+            else:
+                f_start = firing[0]
+                f_duration = firing[1]-firing[0]
+            if f_start + f_duration > 0.0:
+                f_start = max(f_start, 0.0)
+                self.draw_firing(f_start, f_duration, self.context.overlap_offset*lane,
+                                 f_color, firing[4])
+            row.count += 1
+        self.canvas.set_container()
+
+    def _draw_events(self, row, stamps):
+        """ append the time stamps to the row of events, continuing the overlap
+        detection from the events drawn before """
+        self.canvas.set_container(row.content_group)
+        row.prev_event = self._draw_sequence([t - self.time_offset for t in stamps], 0,
+                                             [(0, 0, 0)], row.prev_event)
+        self.canvas.set_container()
+
+    def _heights(self):
+        """ return the heights of all rows, from top to bottom """
+        overlap_offset = self.settings.overlap_offset()
+        return [row.height(overlap_offset) for row in
+                self.input_rows + self.actor_rows + self.output_rows]
+
+    def _layout(self):
+        """ move the rows to their vertical positions, redraw the labels and the axes,
+        and adjust the size of the canvas """
+        heights = self._heights()
+        if len(heights) == 0:
+            return
+        y_pos = 0.0
+        for row, height in zip(self.input_rows + self.actor_rows + self.output_rows, heights):
+            row.group['transform'] = f'translate(0,{y_pos*self.settings.scale_mm_per_unit_y()})'
+            row.label_group.elements.clear()
+            self.canvas.set_container(row.label_group)
+            self.draw_label(row.label, 0.5*height)
+            y_pos += height
+        total_height = y_pos
+
+        time_axis_length = self.settings.length()*self.settings.unit()
+        self._back.elements.clear()
+        self.canvas.set_container(self._back)
+        self.draw_axes_back_variable_height(time_axis_length, heights)
+        self._front.elements.clear()
+        self.canvas.set_container(self._front)
+        self.draw_axes_middle(time_axis_length, total_height)
+        self.draw_axes_front(time_axis_length, total_height)
+        self.canvas.set_container()
+
+        height = total_height * self.settings.scale_mm_per_unit_y() + \
+            (self.settings.margin_top()+self.settings.margin_bottom())
+        width = self.gantt_width(self._offset_x)
+        self.canvas.set_size(height, width)
+        self.canvas.set_view_box(-self._offset_x, -self.settings.margin_top(), width, height)
@@ -1,13 +1,28 @@
 """ support for generating graphics of traces and Gantt charts in SVG """
-from math import floor
+from math import ceil, floor
 import os
 from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
 from sys import modules as sysmodules
-from cmtrace.graphics.svgcanvas import SVGCanvas, MM_PER_PT
-from cmtrace.graphics.tracesettings import TraceSettings
+import numpy as np
+from cmtrace.graphics.svgcanvas import SVGCanvas, PathBatch, MM_PER_PT
+from cmtrace.graphics.svgstream import SVGStreamCanvas, SVGFragmentCanvas
+from cmtrace.graphics.cairocanvas import CAIRO_EXTENSIONS, create_cairo_canvas
+from cmtrace.graphics.tracesettings import TraceSettings, TraceSettingsException
+from cmtrace.graphics.lanes import allocate_lanes
+from cmtrace.graphics.lod import FiringAggregator, shade
+from cmtrace.trace.traceactor import ColumnarTraceActor, NO_VALUE
+from cmtrace.trace.vectortrace import VectorTrace
 if 'cairosvg' in sysmodules:
     import cairosvg
 
+# number of chunks of rows per worker when rows are drawn in parallel
+ROW_CHUNKS_PER_WORKER = 4
+
+# firings shorter than this are drawn with ZERO_DURATION_WIDTH, so that they are visible
+ZERO_DURATION = 1e-5
+ZERO_DURATION_WIDTH = 0.1
+
 class SVGTraceDrawer:
     """ Helper for drawing trace figures """
 
@@ -16,104 +31,144 @@ class SVGTraceDrawer:
         self.font_size = "10pt"
         self.canvas = None
         self.settings = settings if not settings is None else TraceSettings()
+        # the render context compiled from the settings, once the unit is known
+        self.context = None
+        # the time at the origin of the time axis
+        self.time_offset = 0
 
     def event_radius(self):
         """ get event radius in mm """
-        return self.settings.event_radius()*self.settings.scale_mm_per_unit_y()
+        return self.context.event_radius
 
     def alternate_color(self, col):
         """ modify the color to be used for alternating colors """
         return (col[0] * 0.9, col[1] * 0.9, col[2] * 0.9)
 
-    def draw_firings(self, firing_intervals, lb, _ub):
-        """ draw firings in figure; firings are tuple (start, end, actor name, scenario name)"""
-        # sort the firings on start time
-        firing_intervals.sort()
-
-        # determine number of overlapping intervals
-        epsilon = 1e-5
-        active_intervals = []
-        max_active_intervals = 0
-        for i in firing_intervals:
-            active_intervals = [f for f in active_intervals if f[1] > i[0] + epsilon]
-            if len(active_intervals) > max_active_intervals:
-                max_active_intervals = len(active_intervals)
-            active_intervals.append(i)
-
-        coloring_mode = self.settings.firing_color_mode()
+    def draw_firings(self, firing_intervals, lb, _ub, lanes=None):
+        """ draw firings in figure; firings are lists as computed by row_firings, with
+        the index of the firing in its row, which is used to alternate colors
+        lanes are the lanes of the firings, as computed by allocate_lanes on the sorted
+        firings; they are computed if they are not given """
+        if lanes is None:
+            # sort the firings on start time
+            firing_intervals.sort()
+            lanes, _ = allocate_lanes(firing_intervals)
+
+        context = self.context
+        coloring_mode = context.firing_color_mode
         color_map = self.settings.color_map()
         color_palette = self.settings.color_palette()
 
-        f_count = 0
-        # track overlapping firings
-        active_intervals = []
-
-        last_end = 0.0
-        active_offset = 0
-
-        for firing in firing_intervals:
-            if coloring_mode == "by-actor":
-                f_color = color_map[firing[2]]
-            elif coloring_mode == "by-iteration":
-                f_color = color_palette[firing[5] % len(color_palette)]
-            elif coloring_mode == "by-scenario":
-                f_color = color_map[firing[3]]
-            if self.settings.alternate_color():
-                if f_count%2 == 1:
-                    f_color = self.alternate_color(f_color)
-
+        # firings that are too small to be seen are aggregated, if enabled
+        aggregator = FiringAggregator.from_settings(self.settings)
+        # the firings are drawn as a path per color, and their labels on top, if enabled
+        batch, labels = (PathBatch(), []) if context.batch_paths else (None, None)
 
+        for firing, lane in zip(firing_intervals, lanes):
             # make sure that zero-length firings are visible
-            if firing[1] - firing[0] < 1e-5:
-                f_start = firing[0] - 0.05
-                f_duration = 0.1
+            f_duration = _drawn_duration(firing)
+            if firing[1] - firing[0] < ZERO_DURATION:
+                f_start = firing[0] - 0.5*f_duration
             else:
                 # do not draw outside of the range
                 f_start = firing[0]
-                f_duration = firing[1]-firing[0]
 
-            if f_start > last_end - epsilon:
-                active_offset = 0
-            else:
-                active_offset = (active_offset+1) % (max_active_intervals+1)
+            if aggregator is not None and aggregator.is_small(f_duration):
+                if f_start + f_duration > 0.0:
+                    # aggregate in the color without alternation
+                    aggregator.add(max(f_start, 0.0), f_start + f_duration,
+                                   self.firing_color(firing, 0, coloring_mode, color_map,
+                                                     color_palette))
+                continue
 
+            f_color = self.firing_color(firing, firing[6], coloring_mode, color_map,
+                                        color_palette)
 
             if f_start + f_duration > 0.0:
                 f_start = max(f_start, 0.0)
-                top_left = self.settings.origin_x() + f_start * \
-                            self.settings.scale_mm_per_unit_x(), self.settings.origin_y() \
-                            +(lb+self.settings.overlap_offset()*active_offset)* \
-                            self.settings.scale_mm_per_unit_y()
-                width_height = self.settings.scale_mm_per_unit_x()*(f_duration), \
-                            self.settings.scale_mm_per_unit_y()
-                self.canvas.draw_rect(top_left, width_height, f_color,
-                                      stroke_width=self.settings.firing_stroke_width())
-                if firing[4] is not None:
-                    if self.settings.show_text_labels():
-                        self.canvas.draw_text(
-                            firing[4],
-                            (top_left[0]+width_height[0]/2, top_left[1]+width_height[1]/2),
-                            font=self.settings.font(),
-                            font_size=0.5*self.settings.font_size(),
-                            text_anchor="middle",
-                            alignment_baseline="central"
-                        )
-
-            f_count += 1
-            last_end = f_start+f_duration
+                self.draw_firing(f_start, f_duration,
+                                 lb+context.overlap_offset*lane, f_color,
+                                 firing[4], batch, labels)
+
+        if aggregator is not None:
+            self.draw_aggregated_firings(aggregator, lb, batch)
+
+        if batch is not None:
+            batch.draw(self.canvas)
+            for top_left, width_height, text in labels:
+                self.draw_firing_label(top_left, width_height, text)
+
+    def draw_aggregated_firings(self, aggregator, lb, batch=None):
+        """ draw the firings collected by the aggregator in the top lane of the row with
+        upper bound lb, as bars or as a strip shaded by the utilisation """
+        if self.context.level_of_detail == 'merge':
+            for start, end, color in aggregator.bars():
+                self.draw_firing(start, end - start, lb, color, None, batch)
+        else:
+            background = self.context.background_color
+            for start, end, color, utilisation in aggregator.strips():
+                self.draw_firing(start, end - start, lb, shade(color, utilisation, background),
+                                 None, batch)
+
+    def firing_color(self, firing, f_count, coloring_mode, color_map, color_palette):
+        """ determine the fill color of the f_count-th firing of a row """
+        if coloring_mode == "by-actor":
+            f_color = color_map[firing[2]]
+        elif coloring_mode == "by-iteration":
+            f_color = color_palette[firing[5] % len(color_palette)]
+        elif coloring_mode == "by-scenario":
+            f_color = color_map[firing[3]]
+        if self.context.alternate_color:
+            if f_count%2 == 1:
+                f_color = self.alternate_color(f_color)
+        return f_color
+
+    def draw_firing(self, f_start, f_duration, y_top, f_color, text, batch=None, labels=None):
+        """ draw a firing starting at f_start with duration f_duration, with its top at
+        y_top, all in units, and with its optional text label. If a path batch is given,
+        the rectangle is added to the batch and the label is added to the list labels,
+        to be drawn after the batch. """
+        context = self.context
+        top_left = context.x(f_start), context.y(y_top)
+        width_height = context.scale_x*f_duration, context.scale_y
+        if batch is None:
+            self.canvas.draw_rect(top_left, width_height, f_color,
+                                  stroke_width=context.firing_stroke_width)
+        else:
+            batch.add_rect(top_left, width_height, f_color,
+                           stroke_width=context.firing_stroke_width)
+        if text is not None:
+            if context.show_text_labels:
+                if labels is None:
+                    self.draw_firing_label(top_left, width_height, text)
+                else:
+                    labels.append((top_left, width_height, text))
+
+    def draw_firing_label(self, top_left, width_height, text):
+        """ draw the text label in the center of a firing rectangle """
+        self.canvas.draw_text(
+            text,
+            (top_left[0]+width_height[0]/2, top_left[1]+width_height[1]/2),
+            font=self.context.font,
+            font_size=0.5*self.context.font_size,
+            text_anchor="middle",
+            alignment_baseline="central"
+        )
 
     def draw_label(self, label, y_center):
         """ draw a label at y_center """
 
-        lx = self.settings.origin_x() - self.settings.label_separation()
-        ly = self.settings.origin_y()+y_center*self.settings.scale_mm_per_unit_y()
-        self.canvas.draw_text(label, (lx, ly), font=self.settings.font(),
-                              font_size=self.settings.font_size(), text_anchor="end",
+        context = self.context
+        lx = context.origin_x - context.label_separation
+        ly = context.y(y_center)
+        self.canvas.draw_text(label, (lx, ly), font=context.font,
+                              font_size=context.font_size, text_anchor="end",
                               alignment_baseline="central")
 
-    def draw_traces(self, actors, num_arrivals, trace_heights):
+    def draw_traces(self, actors, num_arrivals, trace_heights, row_lanes=None):
         """ draw the actor traces. arrivals is used to determine the row to
-        start drawing traces. """
+        start drawing traces. row_lanes optionally contains for every row the sorted
+        firings and their lanes, as computed by row_lanes. """
 
         # compute the upper and lower bounds
         lb = []
@@ -124,73 +179,180 @@ class SVGTraceDrawer:
             ub.append(ll+h)
             ll += h
 
+        if row_lanes is None:
+            row_lanes = [self.row_lanes(actor_list) for (_, actor_list) in actors]
+        rows = [(label, scaled_firings, lanes, lb[mix], ub[mix]) for mix, ((label, _),
+                (scaled_firings, lanes, _)) in enumerate(zip(actors, row_lanes), num_arrivals)]
+        workers = self.settings.row_workers()
+        # rows can be drawn in parallel if the elements are serialised independently
+        if workers > 1 and not (isinstance(self.canvas, SVGStreamCanvas)
+                                and self.canvas.styles is None):
+            raise TraceSettingsException("graphics:row-workers should be 1 in settings, "
+                                         "unless svg files are written by the stream "
+                                         "svg-writer without css-styles.")
+        if workers > 1 and len(rows) > 1:
+            self.draw_rows_parallel(rows, workers)
+        else:
+            self.draw_rows(rows)
+
+    def draw_rows(self, rows):
+        """ draw the rows, tuples with the label, the sorted firings and their lanes and
+        the lower and upper bound of the row """
+        for label, scaled_firings, lanes, lower, upper in rows:
+            self.draw_label(label, 0.5*(lower+upper))
+            self.draw_firings(scaled_firings, lower, upper, lanes)
+
+    def draw_rows_parallel(self, rows, workers):
+        """ draw the rows, as for draw_rows, in a pool of workers processes that each
+        serialise consecutive rows into a fragment, and write the fragments in order """
+        # several chunks per worker to balance the load
+        chunk_size = max(1, ceil(len(rows) / (workers*ROW_CHUNKS_PER_WORKER)))
+        chunks = [rows[i:i+chunk_size] for i in range(0, len(rows), chunk_size)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            for fragment in executor.map(_draw_rows_fragment, [self.settings]*len(chunks),
+                                         chunks):
+                self.canvas.write_fragment(fragment)
+
+    def row_firings(self, actor_list):
+        """ return the firings of the actors in a row, sorted on start time, with
+        their start and end times in units from the origin of the time axis, as lists
+        [start, end, actor name, scenario name, text label, iteration, index], where
+        index is the index of the firing in the row, counting the firings that were
+        skipped before the time window """
         unit = self.settings.unit()
-        mix = num_arrivals
-        for (label, actor_list) in actors:
-            self.draw_label(label, 0.5*(lb[mix]+ub[mix]))
-            scaled_firings = []
-            for actor in actor_list:
-                if not actor is None:
-                    fix = 0
-                    for firing in actor.firing_intervals():
-                        if firing[2] is not None:
-                            iteration = int(firing[2])
-                        else:
-                            iteration = fix
-                        textLabel = firing[3]
-                        scaled_firings.append([firing[0]/unit, firing[1]/unit,
-                                               actor.name, actor.scenario, textLabel, iteration])
-                        fix += 1
-            self.draw_firings(scaled_firings, lb[mix], ub[mix])
-            mix += 1
+        scaled_firings = []
+        skipped = 0
+        for actor in actor_list:
+            if isinstance(actor, ColumnarTraceActor):
+                skipped += actor.skipped_firings
+                scaled_firings.extend(self._columnar_row_firings(actor))
+            elif not actor is None:
+                fix = actor.skipped_firings
+                skipped += actor.skipped_firings
+                for firing in actor.firing_intervals():
+                    if firing[2] is not None:
+                        iteration = int(firing[2])
+                    else:
+                        iteration = fix
+                    textLabel = firing[3]
+                    scaled_firings.append([(firing[0]-self.time_offset)/unit,
+                                           (firing[1]-self.time_offset)/unit,
+                                           actor.name, actor.scenario, textLabel, iteration])
+                    fix += 1
+        scaled_firings.sort()
+        for index, firing in enumerate(scaled_firings, skipped):
+            firing.append(index)
+        return scaled_firings
+
+    def _columnar_row_firings(self, actor):
+        """ return the firings of a columnar actor as for row_firings, without the
+        index, computed from its columns """
+        unit = self.settings.unit()
+        count = len(actor)
+        starts = ((actor.starts() - self.time_offset) / unit).tolist()
+        ends = ((actor.ends() - self.time_offset) / unit).tolist()
+        # firings without iteration are numbered from the skipped firings
+        numbers = np.arange(actor.skipped_firings, actor.skipped_firings + count)
+        iterations = actor.iterations()
+        if iterations.dtype == object:
+            iterations = [n if i is None else int(i)
+                          for i, n in zip(iterations.tolist(), numbers.tolist())]
+        else:
+            iterations = np.where(iterations == NO_VALUE, numbers, iterations).tolist()
+        texts = actor.text_values()
+        name, scenario = actor.name, actor.scenario
+        return [[starts[k], ends[k], name, scenario, texts[k], iterations[k]]
+                for k in range(count)]
+
+    def row_lanes(self, actor_list):
+        """ return the sorted firings of the actors in a row, the lanes in which they
+        are drawn and the number of lanes. Firings that are aggregated by the level of
+        detail, if enabled, are drawn in the top lane and take no lanes of their own,
+        so a row with only aggregated firings is one lane high. """
+        firings = self.row_firings(actor_list)
+        aggregator = FiringAggregator.from_settings(self.settings)
+        if aggregator is None:
+            lanes, depth = allocate_lanes(firings)
+            return firings, lanes, depth
+        shown = [index for index, firing in enumerate(firings)
+                 if not aggregator.is_small(_drawn_duration(firing))]
+        shown_lanes, depth = allocate_lanes([firings[index] for index in shown])
+        lanes = [0] * len(firings)
+        for index, lane in zip(shown, shown_lanes):
+            lanes[index] = lane
+        if len(shown) < len(firings):
+            depth = max(depth, 1)
+        return firings, lanes, depth
+
+    def lanes_height(self, depth):
+        """ return the height of a row with the given number of lanes """
+        return 1.0 + max(depth-1, 0) * self.settings.overlap_offset()
 
     def draw_arrivals(self, arrivals, offset):
         """ draw the arrival event sequences """
         # coloring_mode = self.settings.vector_color_mode()
         # color_index = self.settings.color_map()
+        context = self.context
         nix = offset
         for label in arrivals.keys():
             # draw the label
             self.canvas.draw_text(
                 label,
-                (self.settings.origin_x() - self.settings.label_separation(),
-                 self.settings.origin_y()+(nix+0.5)*self.settings.scale_mm_per_unit_y()),
-                font=self.settings.font(),
-                font_size=self.settings.font_size(),
+                (context.origin_x - context.label_separation, context.y(nix+0.5)),
+                font=context.font,
+                font_size=context.font_size,
                 text_anchor="end",
                 alignment_baseline="central"
             )
-            # draw the events
+            # draw the events, from the origin of the time axis
             f_color = [(0,0,0)] * len(arrivals[label])
-            self._draw_sequence(arrivals[label], nix, f_color)
+            stamps = arrivals[label] if self.time_offset == 0 else \
+                [t - self.time_offset for t in arrivals[label]]
+            self._draw_sequence(stamps, nix, f_color)
             nix += 1
 
-    def _draw_sequence(self, seq, nix, f_color):
+    def _draw_sequence(self, seq, nix, f_color, prev=None):
+        # the events are drawn as a path per color, on top of the halos of overlapping
+        # events, if enabled. prev is the position of the event before seq, if it has
+        # been drawn already; the position of the last event is returned
+        context = self.context
+        if context.batch_paths:
+            halos, dots = PathBatch(), PathBatch()
+        else:
+            halos = dots = None
+        unit = context.unit
+        overlap = context.overlap_horizontal_offset
+        radius = context.event_radius
+        y_pos = context.y(nix+0.5)
         eix = 0
-        prev = None
         for arrival in seq:
             overlapped = False
             if prev is not None:
-                if ((arrival - prev) / self.settings.unit()*self.settings.scale_mm_per_unit_x() < \
-                self.settings.overlap_horizontal_offset()) and \
-                (arrival - prev) / self.settings.unit()*self.settings.scale_mm_per_unit_x() > \
-                -self.settings.overlap_horizontal_offset():
+                distance = context.width_of_time(arrival - prev)
+                if -overlap < distance < overlap:
                     overlapped = True
-                    arrival = prev + self.settings.overlap_horizontal_offset() / \
-                        self.settings.scale_mm_per_unit_x() *  self.settings.unit()
+                    arrival = prev + overlap / context.scale_x * unit
             prev = arrival
             c_color = f_color[eix % len(f_color)]
             if arrival < 0.0:
-                arrival = - self.settings.unit()
-            pos = (self.settings.origin_x() + arrival/self.settings.unit()* \
-                   self.settings.scale_mm_per_unit_x(), self.settings.origin_y() + \
-                   (nix+0.5)*self.settings.scale_mm_per_unit_y())
-            if overlapped:
-                self.canvas.draw_circle(pos, self.event_radius()*1.15, (255, 255, 255), 0.0)
-            self.canvas.draw_circle(pos, self.event_radius(), c_color, 0.0)
+                arrival = - unit
+            pos = (context.x_of_time(arrival), y_pos)
+            if dots is not None:
+                if overlapped:
+                    halos.add_circle(pos, radius*1.15, (255, 255, 255), 0.0)
+                dots.add_circle(pos, radius, c_color, 0.0)
+            else:
+                if overlapped:
+                    self.canvas.draw_circle(pos, radius*1.15, (255, 255, 255), 0.0)
+                self.canvas.draw_circle(pos, radius, c_color, 0.0)
 
             eix += 1
 
+        if dots is not None:
+            halos.draw(self.canvas)
+            dots.draw(self.canvas)
+        return prev
+
     def _make_color_list(self,seq, coloring_mode, color_index, label):
         # determine the color
         if coloring_mode == "by-iteration":
@@ -207,19 +369,19 @@ class SVGTraceDrawer:
 
     def draw_sequences(self, sequences):
         """ draw event sequences """
-        coloring_mode = self.settings.vector_color_mode()
+        context = self.context
+        coloring_mode = context.vector_color_mode
         color_index = self.settings.color_map()
         nix = 0
         for (label, seq) in sequences:
             # draw the label
-            lx = self.settings.origin_x() - self.settings.label_separation()
-            ly = self.settings.origin_y()+(nix+0.5)*self.settings.scale_mm_per_unit_y() + \
-                3.0*MM_PER_PT
+            lx = context.origin_x - context.label_separation
+            ly = context.y(nix+0.5) + 3.0*MM_PER_PT
             self.canvas.draw_text(
                 label,
                 (lx, ly),
-                font=self.settings.font(),
-                font_size=self.settings.font_size(),
+                font=context.font,
+                font_size=context.font_size,
                 text_anchor="end",
                 alignment_baseline="central"
             )
@@ -234,46 +396,42 @@ class SVGTraceDrawer:
     def draw_axes_back_variable_height(self, x_size, y_sizes):
         """ draw the background part of the axes, xsize measured by the time axis,
         y_sizes contains the size, per lane of the Gantt chart, in vertical units"""
+        context = self.context
         total_y = reduce(lambda x,y: x+y, y_sizes)
-        self.canvas.draw_rect((self.settings.origin_x(), self.settings.origin_y()), \
-                              (x_size/self.settings.unit()*self.settings.scale_mm_per_unit_x(), \
-                               total_y*self.settings.scale_mm_per_unit_y()), \
-                                self.settings.background_color(), 0.0)
+        self.canvas.draw_rect((context.origin_x, context.origin_y), \
+                              (context.width_of_time(x_size), total_y*context.scale_y), \
+                                context.background_color, 0.0)
 
         # draw the even rows darker background
         lower = 0.0
         for y_val in range(1, len(y_sizes), 2):
             lower = lower + y_sizes[y_val-1]
             upper = lower + y_sizes[y_val]
-            self.canvas.draw_rect((self.settings.origin_x(), self.settings.origin_y()+ \
-                            lower*self.settings.scale_mm_per_unit_y()),
-                            (x_size/self.settings.unit()*self.settings.scale_mm_per_unit_x(), \
-                             (upper-lower)*self.settings.scale_mm_per_unit_y()), \
-                                self.settings.row_background_color(), 0.0)
+            self.canvas.draw_rect((context.origin_x, context.y(lower)),
+                            (context.width_of_time(x_size), (upper-lower)*context.scale_y), \
+                                context.row_background_color, 0.0)
             lower = upper
 
         # draw the vertical lines every 5th unit
         x_val = 0
         while x_val <= x_size:
             # compute the x position for the line
-            x_pos = self.settings.origin_x()+x_val/self.settings.unit()* \
-                self.settings.scale_mm_per_unit_x()
+            x_pos = context.x_of_time(x_val)
             # draw vertical tick line
-            self.canvas.draw_line((x_pos, self.settings.origin_y()), (x_pos, \
-                                            self.settings.origin_y()-self.settings.tick_length()), \
-                                                self.settings.column_line_width())
+            self.canvas.draw_line((x_pos, context.origin_y), (x_pos, \
+                                            context.origin_y-context.tick_length), \
+                                                context.column_line_width)
             # draw vertical line across the whole chart
-            self.canvas.draw_line((x_pos, self.settings.origin_y()), (x_pos, \
-                            self.settings.origin_y()+total_y*self.settings.scale_mm_per_unit_y()), \
-                            self.settings.column_line_width())
+            self.canvas.draw_line((x_pos, context.origin_y), (x_pos, context.y(total_y)), \
+                            context.column_line_width)
             # determine the time label
-            strval = self._format_value(x_val)
+            strval = self._format_value(x_val + self.time_offset)
             # add the text to the figure
-            self.canvas.draw_text(strval, (x_pos, self.settings.origin_y() - \
-                    self.settings.tick_number_separation()), font_size=self.settings.font_size(), \
-                    font=self.settings.font(), text_anchor="middle")
+            self.canvas.draw_text(strval, (x_pos, context.origin_y - \
+                    context.tick_number_separation), font_size=context.font_size, \
+                    font=context.font, text_anchor="middle")
             # determine the next value for a line
-            x_val += 5*self.settings.unit()
+            x_val += 5*context.unit
 
 
     def _format_value(self, val):
@@ -287,36 +445,33 @@ class SVGTraceDrawer:
     def draw_axes_middle(self, _, ysize):
         """ draw the middle part of the axes; in front of the actor firings, but behind
         the arrival dots. """
+        context = self.context
         self.canvas.draw_line(
-            (self.settings.origin_x(), self.settings.origin_y() - \
-             self.settings.border_line_width()*0.5),
-            (self.settings.origin_x(), self.settings.origin_y() + \
-             self.settings.scale_mm_per_unit_y()*ysize + self.settings.border_line_width()*0.5),
-            self.settings.border_line_width()
+            (context.origin_x, context.origin_y - context.border_line_width*0.5),
+            (context.origin_x, context.y(ysize) + context.border_line_width*0.5),
+            context.border_line_width
         )
 
     def draw_axes_front(self, xsize, ysize):
         """ draw the front part of the axes """
+        context = self.context
+        x_end = context.origin_x+context.scale_x*xsize/context.unit
         # draw horizontal axes
         self.canvas.draw_line(
-            (self.settings.origin_x(), self.settings.origin_y()),
-            (self.settings.origin_x()+self.settings.scale_mm_per_unit_x()* \
-             xsize/self.settings.unit(), self.settings.origin_y()),
-            self.settings.border_line_width()
+            (context.origin_x, context.origin_y),
+            (x_end, context.origin_y),
+            context.border_line_width
         )
         self.canvas.draw_line(
-            (self.settings.origin_x(), self.settings.origin_y()+ \
-             self.settings.scale_mm_per_unit_y()*ysize),
-            (self.settings.origin_x()+self.settings.scale_mm_per_unit_x()*xsize/ \
-             self.settings.unit(), self.settings.origin_y()+ \
-                self.settings.scale_mm_per_unit_y()*ysize),
-            self.settings.border_line_width()
+            (context.origin_x, context.y(ysize)),
+            (x_end, context.y(ysize)),
+            context.border_line_width
         )
 
     def __label_size(self, labels):
         """ estimate the size of the label """
-        length = max(map(lambda act: (SVGCanvas.text_extent(act, self.settings.font(),
-                                                            self.settings.font_size()))[1], labels))
+        length = max(width for _, width in SVGCanvas.text_extents(
+            labels, self.settings.font(), self.settings.font_size()))
         return length + 2* self.settings.label_separation()
 
     def save(self):
@@ -335,50 +490,41 @@ class SVGTraceDrawer:
         return list(map(lambda act: act[0], actors))
 
 
-    def required_height(self, actor_group):
-        '''Determine the required height for the event sequence depending in max
-        number of overlapping firings '''
-        # collect intervals for all actors in actor group
-        intervals = list(reduce(lambda f_new, fall: fall+f_new, [(list(a.firing_intervals()) if
-                                        a is not None else []) for a in actor_group],[]))
-        # sort intervals on start time
-        intervals.sort(key=lambda i: i[0])
-
-        # determine max overlapping intervals
-        epsilon = 1e-5
-        active_intervals = []
-        max_active_intervals = 0
-        # for each interval
-        for i in intervals:
-            # which previous intervals are still active?
-            active_intervals = [f for f in active_intervals if f[1] > i[0] + epsilon]
-            # keep track of max
-            if len(active_intervals) > max_active_intervals:
-                max_active_intervals = len(active_intervals)
-            active_intervals.append(i)
-
-        return 1.0 + max_active_intervals * self.settings.overlap_offset()
-
-
     def make_gantt_svg(self, actors, arrivals, outputs, filename):
         """
         make a Gantt chart
         actors is a dict with names and TraceActor object
         arrivals and outputs are dicts with names and lists of time stamps
         """
+        labels, row_lanes, trace_heights, offset_x = self.prepare_gantt(actors, arrivals,
+                                                                        outputs)
+        return self.draw_gantt(labels, row_lanes, trace_heights, arrivals, outputs, offset_x,
+                               filename)
+
+    def prepare_gantt(self, actors, arrivals, outputs):
+        """ determine the unit, the length, the size and the colors of a Gantt chart in
+        the settings, and return its layout: the labels of the rows, the sorted firings
+        and their lanes of every row, as computed by row_lanes, the heights of all rows
+        and the width of the labels """
         # get the actor names
         actor_names = self._actor_names(actors)
-
-        # determine required height
-        trace_heights = [1.0] * len(arrivals) + [self.required_height(actor_group) for (label,
-                                actor_group) in actors] + [1.0]*len(outputs)
-        total_height = reduce(lambda h, s: h+s, trace_heights)
+        # the time axis starts at the start of the time window
+        self.time_offset = self.settings.time_origin()
 
         # determine settings
         if self.settings.unit() is None:
             self.settings.set_unit(self.settings.default_unit(actors))
         if self.settings.unit() == 'auto':
             self.settings.set_unit(self.settings.default_unit(actors))
+
+        # allocate the lanes of the firings once, for the heights and the drawing
+        row_lanes = [self.row_lanes(actor_group) for (_, actor_group) in actors]
+
+        # determine required height
+        trace_heights = [1.0] * len(arrivals) + [self.lanes_height(depth) for (_, _, depth)
+                                in row_lanes] + [1.0]*len(outputs)
+        total_height = reduce(lambda h, s: h+s, trace_heights)
+
         if self.settings.length() is None:
             self.settings.set_length(self.settings.default_length_gantt(actors))
         if self.settings.length() == 'auto':
@@ -389,7 +535,7 @@ class SVGTraceDrawer:
         offset_x = self.__label_size(self._actor_labels(actors) + list(arrivals.keys()) + \
                                      list(outputs.keys()))
         if self.settings.width is None:
-            self.settings.width = self._gantt_width(offset_x)
+            self.settings.width = self.gantt_width(offset_x)
 
         if self.settings.color_map() is None:
             if self.settings.firing_color_mode() == 'by-scenario':
@@ -397,8 +543,23 @@ class SVGTraceDrawer:
             else:
                 self.settings.set_default_actor_color_map(actor_names)
 
+        return self._actor_labels(actors), row_lanes, trace_heights, offset_x
+
+    def draw_gantt(self, labels, row_lanes, trace_heights, arrivals, outputs, offset_x,
+                   filename, canvas=None):
+        """ draw a Gantt chart with the layout computed by prepare_gantt, on the given
+        canvas, resized to the size in the settings, or on a new canvas for the filename """
+        total_height = reduce(lambda h, s: h+s, trace_heights)
+
+        # validate the settings before drawing
+        self.context = self.settings.compile()
+
         # create the canvas
-        self.canvas = SVGCanvas(filename, self.settings.height, self.settings.width)
+        if canvas is None:
+            self.canvas = self.create_canvas(filename)
+        else:
+            self.canvas = canvas
+            self.canvas.set_size(self.settings.height, self.settings.width)
         # set the canvas view box
         self.canvas.set_view_box(-offset_x, -self.settings.margin_top(), self.settings.width, self.settings.height)
 
@@ -406,7 +567,8 @@ class SVGTraceDrawer:
 
         # draw the axes, traces and arrivals
         self.draw_axes_back_variable_height(time_axis_length, trace_heights)
-        self.draw_traces(actors, len(arrivals), trace_heights)
+        self.draw_traces([(label, None) for label in labels], len(arrivals), trace_heights,
+                         row_lanes)
         self.draw_axes_middle(time_axis_length, total_height)
         self.draw_arrivals(arrivals, 0)
         self.draw_arrivals(outputs, total_height - len(outputs))
@@ -415,11 +577,12 @@ class SVGTraceDrawer:
         # return the result
         return self.canvas
 
-    def _gantt_width(self, offset_x):
-        """" Determine the width, accounting for the last label """
+    def gantt_width(self, offset_x):
+        """ return the width of the Gantt chart with labels of width offset_x, accounting
+        for the last number on the time axis """
         m = floor(self.settings.length() / 5)
         label_center = m*5*self.settings.scale_mm_per_unit_x()
-        last_label = self._format_value(m*5*self.settings.unit())
+        last_label = self._format_value(m*5*self.settings.unit() + self.time_offset)
         last_label_end = label_center + 0.5 * SVGCanvas.text_extent(last_label,
                                             self.settings.font(), self.settings.font_size())[1]
         gantt_width = (self.settings.length()) * self.settings.scale_mm_per_unit_x()
@@ -427,14 +590,45 @@ class SVGTraceDrawer:
         return offset_x + max(last_label_end, gantt_width)
 
 
+    def create_canvas(self, filename):
+        """ create the canvas of the size in the settings; a PNG image, or a PDF, PS
+        or EPS document, drawn with Cairo, if the filename has that extension, otherwise
+        an SVG drawing with the SVG writer and the styling selected in the settings """
+        canvas = create_cairo_canvas(filename, self.settings.height, self.settings.width,
+                                     self.settings.dpi())
+        if canvas is not None:
+            return canvas
+        if self.settings.svg_writer() == 'stream':
+            return SVGStreamCanvas(filename, self.settings.height, self.settings.width,
+                                   self.settings.css_styles())
+        return SVGCanvas(filename, self.settings.height, self.settings.width,
+                         self.settings.css_styles())
+
     def save_gantt(self, actors, arrivals, outputs, filename='trace.svg'):
         """ make a Gantt chart in svg and save to file """
         canvas = self.make_gantt_svg(actors, arrivals, outputs, filename)
         canvas.save()
 
+    def save_gantt_files(self, actors, arrivals, outputs, filenames):
+        """ make a Gantt chart and save it to every file, in the format of its extension;
+        the layout is computed once for all files """
+        labels, row_lanes, trace_heights, offset_x = self.prepare_gantt(actors, arrivals,
+                                                                        outputs)
+        for filename in filenames:
+            canvas = self.draw_gantt(labels, row_lanes, trace_heights, arrivals, outputs,
+                                     offset_x, filename)
+            canvas.save()
+
     def __make_vector_svg(self, event_seqs, filename='trace.svg', _height_in_mm=200,
                           _width_in_mm=300):
         """ make a graph in svg of the event sequences and save to file """
+        event_seqs, offset_x = self.prepare_vector(event_seqs)
+        return self.draw_vector(event_seqs, offset_x, filename)
+
+    def prepare_vector(self, event_seqs):
+        """ determine the unit, the length, the size and the colors of a graph of the
+        event sequences in the settings, and return the rows of the graph and the width
+        of the labels """
 
         # determine settings
         if self.settings.unit() is None:
@@ -445,6 +639,8 @@ class SVGTraceDrawer:
             self.settings.set_length(self.settings.default_length_vectors(event_seqs))
         if self.settings.length() == "auto":
             self.settings.set_length(self.settings.default_length_vectors(event_seqs))
+        if isinstance(event_seqs, VectorTrace):
+            event_seqs = event_seqs.items()
         if self.settings.height is None:
             self.settings.height = len(event_seqs) * self.settings.scale_mm_per_unit_y() + \
                 (self.settings.margin_top()+self.settings.margin_bottom())
@@ -458,8 +654,17 @@ class SVGTraceDrawer:
                 token_names.append(row[0])
             self.settings.set_default_sequence_color_map(token_names)
 
+        return event_seqs, offset_x
+
+    def draw_vector(self, event_seqs, offset_x, filename):
+        """ draw a graph of the event sequences with the layout computed by
+        prepare_vector on a new canvas for the filename """
+
+        # validate the settings before drawing
+        self.context = self.settings.compile()
+
         # create the canvas
-        self.canvas = SVGCanvas(filename, self.settings.height, self.settings.width)
+        self.canvas = self.create_canvas(filename)
         self.canvas.set_view_box(-offset_x, -self.settings.margin_top(), self.settings.width,
                                  self.settings.height)
 
@@ -473,10 +678,21 @@ class SVGTraceDrawer:
         return self.canvas
 
     def save_vector(self, events_seqs, filename):
-        """ make a graph in svg of the event sequences and save to file """
+        """ make a graph in svg of the event sequences and save to file. The event
+        sequences are a list of rows with labels and sequences, or a VectorTrace that
+        is drawn with one row per token """
         canvas = self.__make_vector_svg(events_seqs, filename)
         canvas.save()
 
+    def save_vector_files(self, events_seqs, filenames):
+        """ make a graph of the event sequences, as for save_vector, and save it to
+        every file, in the format of its extension; the layout is computed once for all
+        files """
+        events_seqs, offset_x = self.prepare_vector(events_seqs)
+        for filename in filenames:
+            canvas = self.draw_vector(events_seqs, offset_x, filename)
+            canvas.save()
+
 def darken(color, factor=0.8):
     """ make a color darker """
     return (int(factor*color[0]), int(factor*color[1]), int(factor*color[2]))
@@ -491,11 +707,37 @@ def convert_svg_to_pdf(svg_file, pdf_file=None):
     #     cairosvg.svg2pdf(
     #         file_obj=open(svg_file, "rb"), write_to=pdf_file)
 
+def merges_row_fragments(settings, filename):
+    """ check if the rows of a Gantt chart can be drawn in parallel and merged in the
+    file with the settings, which requires an svg file written by the stream writer
+    without css-styles """
+    return os.path.splitext(filename)[1].lower() not in CAIRO_EXTENSIONS and \
+        settings.svg_writer() == 'stream' and not settings.css_styles()
+
+def _drawn_duration(firing):
+    """ return the duration, in units, with which a firing is drawn """
+    if firing[1] - firing[0] < ZERO_DURATION:
+        return ZERO_DURATION_WIDTH
+    return firing[1] - firing[0]
+
+def _draw_rows_fragment(settings, rows):
+    """ draw the rows with the settings and return the serialised SVG elements """
+    drawer = SVGTraceDrawer(settings)
+    drawer.context = settings.compile()
+    drawer.canvas = SVGFragmentCanvas()
+    drawer.draw_rows(rows)
+    return drawer.canvas.fragment()
+
 def save_vector_svg(events_seqs, filename='trace.svg', settings=None):
     """ draw a vector trace """
     drawer = SVGTraceDrawer(settings)
     drawer.save_vector(events_seqs, filename)
 
+def save_vector_files(events_seqs, filenames, settings=None):
+    """ draw a vector trace to several files """
+    drawer = SVGTraceDrawer(settings)
+    drawer.save_vector_files(events_seqs, filenames)
+
 # TODO: add the structural part of actors to the settings (structure)
 def save_gantt_svg(actors, arrivals, outputs, filename='trace.svg', settings=None):
     """
@@ -503,3 +745,8 @@ def save_gantt_svg(actors, arrivals, outputs, filename='trace.svg', settings=Non
     """
     drawer = SVGTraceDrawer(settings)
     drawer.save_gantt(actors, arrivals, outputs, filename)
+
+def save_gantt_files(actors, arrivals, outputs, filenames, settings=None):
+    """ draw a Gantt chart trace to several files """
+    drawer = SVGTraceDrawer(settings)
+    drawer.save_gantt_files(actors, arrivals, outputs, filenames)
@@ -0,0 +1,155 @@
+""" parsing of SVG path specifications into absolute drawing commands """
+import re
+from math import atan2, cos, pi, radians, sin, sqrt
+
+# the commands and numbers in a path specification
+PATH_TOKEN = re.compile(r'[MmZzLlHhVvCcSsQqTtAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# the number of arguments of every command
+ARGUMENT_COUNTS = {'M': 2, 'Z': 0, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2,
+                   'A': 7}
+
+
+class SVGPathException(Exception):
+    """Exceptions in SVG path specifications"""
+
+
+def _segments(path_spec):
+    """ yield the commands of the path specification with their arguments, repeating
+    the command for implicit repetitions """
+    command = None
+    arguments = []
+    for token in PATH_TOKEN.findall(path_spec):
+        if token.isalpha():
+            if command is not None and len(arguments) > 0:
+                raise SVGPathException(f"Incomplete arguments of {command} in path specification.")
+            command = token
+            if command in 'Zz':
+                yield command, []
+        else:
+            if command is None or command in 'Zz':
+                raise SVGPathException("Path specification should start with a command.")
+            arguments.append(float(token))
+            if len(arguments) == ARGUMENT_COUNTS[command.upper()]:
+                yield command, arguments
+                arguments = []
+                # further coordinate pairs after a move are lines
+                if command == 'M':
+                    command = 'L'
+                elif command == 'm':
+                    command = 'l'
+    if len(arguments) > 0:
+        raise SVGPathException(f"Incomplete arguments of {command} in path specification.")
+
+
+def path_commands(path_spec):
+    """ yield the path as absolute commands: ('M', x, y), ('L', x, y),
+    ('C', x1, y1, x2, y2, x, y) and ('Z',). Quadratic curves are converted to cubic
+    curves and arcs to one or more cubic curves. """
+    x = y = 0.0
+    start = (0.0, 0.0)
+    # the last control point of a curve, for smooth curves
+    cubic_control = quadratic_control = None
+    for command, args in _segments(path_spec):
+        relative = command.islower()
+        command = command.upper()
+        dx, dy = (x, y) if relative else (0.0, 0.0)
+        next_cubic = next_quadratic = None
+        if command == 'M':
+            x, y = args[0]+dx, args[1]+dy
+            start = (x, y)
+            yield ('M', x, y)
+        elif command == 'Z':
+            x, y = start
+            yield ('Z',)
+        elif command in 'LHV':
+            if command == 'L':
+                x, y = args[0]+dx, args[1]+dy
+            elif command == 'H':
+                x = args[0]+dx
+            else:
+                y = args[0]+dy
+            yield ('L', x, y)
+        elif command in 'CS':
+            if command == 'C':
+                x1, y1 = args[0]+dx, args[1]+dy
+                args = args[2:]
+            elif cubic_control is None:
+                x1, y1 = x, y
+            else:
+                x1, y1 = 2*x-cubic_control[0], 2*y-cubic_control[1]
+            x2, y2, x, y = args[0]+dx, args[1]+dy, args[2]+dx, args[3]+dy
+            next_cubic = (x2, y2)
+            yield ('C', x1, y1, x2, y2, x, y)
+        elif command in 'QT':
+            if command == 'Q':
+                qx, qy = args[0]+dx, args[1]+dy
+                args = args[2:]
+            elif quadratic_control is None:
+                qx, qy = x, y
+            else:
+                qx, qy = 2*x-quadratic_control[0], 2*y-quadratic_control[1]
+            x0, y0 = x, y
+            x, y = args[0]+dx, args[1]+dy
+            next_quadratic = (qx, qy)
+            yield ('C', x0+2.0/3.0*(qx-x0), y0+2.0/3.0*(qy-y0),
+                   x+2.0/3.0*(qx-x), y+2.0/3.0*(qy-y), x, y)
+        else:
+            x0, y0 = x, y
+            x, y = args[5]+dx, args[6]+dy
+            yield from _arc(x0, y0, args[0], args[1], args[2], args[3] != 0.0, args[4] != 0.0,
+                            x, y)
+        cubic_control, quadratic_control = next_cubic, next_quadratic
+
+
+def _arc(x0, y0, rx, ry, rotation, large_arc, sweep, x, y):
+    """ yield the cubic curves that approximate an elliptical arc, given as in SVG,
+    from the end point parameters to the center parameterization """
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0.0 or ry == 0.0 or (x0 == x and y0 == y):
+        if x0 != x or y0 != y:
+            yield ('L', x, y)
+        return
+    phi = radians(rotation)
+    cos_phi, sin_phi = cos(phi), sin(phi)
+    # the start point in the coordinates of the ellipse
+    hx, hy = (x0-x)/2.0, (y0-y)/2.0
+    x1 = cos_phi*hx + sin_phi*hy
+    y1 = -sin_phi*hx + cos_phi*hy
+    # scale up radii that are too small
+    scale = (x1*x1)/(rx*rx) + (y1*y1)/(ry*ry)
+    if scale > 1.0:
+        rx, ry = rx*sqrt(scale), ry*sqrt(scale)
+    numerator = rx*rx*ry*ry - rx*rx*y1*y1 - ry*ry*x1*x1
+    factor = sqrt(max(0.0, numerator / (rx*rx*y1*y1 + ry*ry*x1*x1)))
+    if large_arc == sweep:
+        factor = -factor
+    cx1, cy1 = factor*rx*y1/ry, -factor*ry*x1/rx
+    cx = cos_phi*cx1 - sin_phi*cy1 + (x0+x)/2.0
+    cy = sin_phi*cx1 + cos_phi*cy1 + (y0+y)/2.0
+    theta = atan2((y1-cy1)/ry, (x1-cx1)/rx)
+    delta = atan2((-y1-cy1)/ry, (-x1-cx1)/rx) - theta
+    if sweep and delta < 0.0:
+        delta += 2.0*pi
+    elif not sweep and delta > 0.0:
+        delta -= 2.0*pi
+    # approximate every quarter of the arc by a cubic curve
+    count = max(1, int(abs(delta) / (pi/2.0) + 0.999999))
+    step = delta / count
+    handle = 4.0/3.0*(sin(step/2.0)/(1.0+cos(step/2.0)))
+
+    def point(angle):
+        ex, ey = rx*cos(angle), ry*sin(angle)
+        return cx + cos_phi*ex - sin_phi*ey, cy + sin_phi*ex + cos_phi*ey
+
+    def derivative(angle):
+        ex, ey = -rx*sin(angle), ry*cos(angle)
+        return cos_phi*ex - sin_phi*ey, sin_phi*ex + cos_phi*ey
+
+    for i in range(count):
+        a0, a1 = theta + i*step, theta + (i+1)*step
+        p0, p1 = point(a0), point(a1)
+        d0, d1 = derivative(a0), derivative(a1)
+        end = (x, y) if i == count-1 else p1
+        yield ('C', p0[0]+handle*d0[0], p0[1]+handle*d0[1],
+               p1[0]-handle*d1[0], p1[1]-handle*d1[1], end[0], end[1])
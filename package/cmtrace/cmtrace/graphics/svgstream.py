@@ -0,0 +1,217 @@
+""" support for generating graphics in SVG by streaming the elements to a file """
+from abc import abstractmethod
+import svgwrite
+from cmtrace.graphics.svgcanvas import Canvas, MM_PER_PT, DEFAULT_FONT
+
+# the XML declaration and the fixed attributes of the root element, as svgwrite writes them
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8" ?>\n'
+SVG_ATTRIBUTES = {
+    'baseProfile': 'full',
+    'version': '1.1',
+    'xmlns': 'http://www.w3.org/2000/svg',
+    'xmlns:ev': 'http://www.w3.org/2001/xml-events',
+    'xmlns:xlink': 'http://www.w3.org/1999/xlink'
+}
+# the definition of the marker used for arrows
+ARROW_MARKER_DEFS = '<defs><marker id="arrow" markerHeight="6" markerUnits="strokeWidth" ' \
+    'markerWidth="6" orient="auto" refX="9" refY="3"><path d="M0,0 L0,6 L9,3 z" ' \
+    'fill="#f00" /></marker></defs>'
+
+# size of the write buffer of the output file
+BUFFER_SIZE = 1 << 20
+
+
+def _escape_attribute(value):
+    """ escape an attribute value like ElementTree """
+    if any(c in value for c in '&<>"\r\n\t'):
+        value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+            .replace('"', '&quot;').replace('\r', '&#13;').replace('\n', '&#10;') \
+            .replace('\t', '&#09;')
+    return value
+
+
+def _escape_text(text):
+    """ escape character data like ElementTree """
+    if any(c in text for c in '&<>'):
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return text
+
+
+def _start_tag(tag, attributes):
+    """ return the start tag of an element, with its attributes sorted on name and
+    converted to strings like svgwrite does """
+    parts = ['<', tag]
+    for name in sorted(attributes):
+        value = attributes[name]
+        if value is None:
+            continue
+        value = str(value)
+        if value:
+            parts.append(f' {name}="{_escape_attribute(value)}"')
+    return ''.join(parts)
+
+
+def _element(tag, attributes, text=None):
+    """ return an element without children """
+    if text is not None:
+        text = str(text)
+    if text:
+        return f'{_start_tag(tag, attributes)}>{_escape_text(text)}</{tag}>'
+    return _start_tag(tag, attributes) + ' />'
+
+
+class SVGElementCanvas(Canvas):
+    """ Canvas object that serialises every element as SVGCanvas would write it, as soon
+    as it is drawn; subclasses write the serialised elements """
+
+    @abstractmethod
+    def _write(self, data):
+        """ write serialised elements """
+
+    def draw_text(self, text, insert, fill=(0, 0, 0), font_size=None,
+                  font=DEFAULT_FONT, text_anchor="start", alignment_baseline="auto"):
+        """ draw a piece of text at point 'insert' using color 'fill' anchoring
+        according to 'text_anchor' """
+        the_font_size = self.font_size if font_size is None else font_size
+        y_offset = 0.0
+        if alignment_baseline=="central":
+            y_offset = 0.25*the_font_size
+        self._write(_element('text', {
+            'x': insert[0],
+            'y': insert[1] + y_offset,
+            **self._style(('fill', svgwrite.rgb(*fill)), ('font-size', the_font_size),
+                          ('font-family', font), ('text-anchor', text_anchor),
+                          ('alignment-baseline', "auto"))
+        }, text))
+
+    def draw_rect(self, insert, size, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT, \
+                  stroke_color=(0, 0, 0)):
+        """ draw a rectangle """
+        self._write(_element('rect', {
+            'x': insert[0],
+            'y': insert[1],
+            'width': size[0],
+            'height': size[1],
+            **self._style(('fill', svgwrite.rgb(*fillcolor)), ('stroke-width', stroke_width),
+                          ('stroke', svgwrite.rgb(*stroke_color)))
+        }))
+
+    def draw_line(self, start, end, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0)):
+        """
+        draw a line from start (x1, y1) to end (x2, y2), using stroke_width
+        """
+        self._write(_element('line', {
+            'x1': start[0],
+            'y1': start[1],
+            'x2': end[0],
+            'y2': end[1],
+            **self._style(('stroke-width', stroke_width), ('stroke', svgwrite.rgb(*stroke_color)))
+        }))
+
+    def draw_path(self, path_spec, stroke_width=MM_PER_PT, stroke_color=(0, 0, 0), is_arrow=False, \
+                  fill='none', offset_pre=None, offset_post=None,
+                  scale=None):
+        """ add a path to the drawing, optionally apply offset and scale and optionally make
+        it an arrow """
+        transform = None
+        if not ((offset_pre is None) and (offset_post is None) and (scale is None)):
+            if scale is None:
+                scale = 1.0
+            if offset_pre is None:
+                offset_pre = (0, 0)
+            if offset_post is None:
+                offset_post = (0, 0)
+            # the same transformation as SVGCanvas.draw_path
+            transform = f'translate({offset_pre[0]},{offset_pre[1]}) scale({scale})" \
+                    f"translate({offset_post[0]},{offset_post[1]})'
+        path = _element('path', {
+            'd': path_spec,
+            **self._style(('stroke-width', stroke_width), ('stroke', svgwrite.rgb(*stroke_color)),
+                          ('fill', fill)),
+            'marker-end': 'url(#arrow)' if is_arrow else None
+        })
+        if transform is not None:
+            path = f'{_start_tag("g", {"transform": transform})}>{path}</g>'
+        self._write(path)
+
+    def draw_circle(self, insert, radius, fillcolor=(0, 0, 0), stroke_width=MM_PER_PT,
+                    stroke_color=(0, 0, 0)):
+        """ draw a circle """
+        self._write(_element('circle', {
+            'cx': insert[0],
+            'cy': insert[1],
+            'r': radius,
+            **self._style(('fill', svgwrite.rgb(*fillcolor)), ('stroke-width', stroke_width),
+                          ('stroke', svgwrite.rgb(*stroke_color)))
+        }))
+
+
+class SVGStreamCanvas(SVGElementCanvas):
+    """ Canvas object to create SVG drawings with the same interface and output as
+    SVGCanvas, that writes every element to the file as soon as it is drawn, instead of
+    building the document in memory. The size and the view box must be set before
+    anything is drawn. """
+
+    def __init__(self, filename='canvas.svg', height_in_mm=200, width_in_mm=300,
+                 css_styles=False):
+        super().__init__(css_styles)
+        self.filename = filename
+        # the output file, opened when the first element is drawn
+        self._file = None
+        self.attributes = dict(SVG_ATTRIBUTES)
+        self.set_size(height_in_mm, width_in_mm)
+        self.set_view_box(0, 0, width_in_mm, height_in_mm)
+
+    def set_view_box(self, xmin, ymin, width, height):
+        """ set the viewbox """
+        self._check_not_started()
+        self.attributes['viewBox'] = svgwrite.utils.strlist([xmin, ymin, width, height])
+
+    def set_size(self, height_in_mm, width_in_mm):
+        """ set the size of the drawing """
+        self._check_not_started()
+        self.attributes['height'] = str(height_in_mm)+'mm'
+        self.attributes['width'] = str(width_in_mm)+'mm'
+
+    def _check_not_started(self):
+        if self._file is not None:
+            raise RuntimeError("The size of the SVG drawing cannot be changed after drawing.")
+
+    def _write(self, data):
+        """ write to the file, starting the document if needed """
+        if self._file is None:
+            self._file = open(self.filename, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+            self._file.write(XML_DECLARATION)
+            self._file.write(_start_tag('svg', self.attributes) + '>')
+            self._file.write(ARROW_MARKER_DEFS)
+        self._file.write(data)
+
+    def write_fragment(self, fragment):
+        """ write a fragment of serialised elements, created by SVGFragmentCanvas """
+        self._write(fragment)
+
+    def save(self):
+        """ complete the document and close the file """
+        if self.styles:
+            self._write(f'<style type="text/css"><![CDATA[{self.style_sheet()}]]></style>')
+        self._write('</svg>')
+        self._file.close()
+        self._file = None
+
+
+class SVGFragmentCanvas(SVGElementCanvas):
+    """ Canvas object that serialises the drawn elements like SVGStreamCanvas into a
+    fragment of an SVG document, which can be drawn in another process and written into
+    the document with SVGStreamCanvas.write_fragment. A fragment has no size and is not
+    saved. """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def _write(self, data):
+        self._parts.append(data)
+
+    def fragment(self):
+        """ return the serialised elements """
+        return ''.join(self._parts)
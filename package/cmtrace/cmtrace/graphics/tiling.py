@@ -0,0 +1,158 @@
+""" rendering of long Gantt charts as tiles that each cover a fixed length of time """
+import copy
+import os
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from math import ceil
+from cmtrace.graphics.svgcanvas import RecordingCanvas
+from cmtrace.graphics.svggraphics import SVGTraceDrawer
+from cmtrace.graphics.cairocanvas import PDFPagesCanvas
+from cmtrace.graphics.tracesettings import TraceSettings
+
+
+def tile_filename(filename, index, count):
+    """ return the filename of tile index out of count tiles, numbering the tiles with
+    equally many digits before the extension of filename """
+    base, extension = os.path.splitext(filename)
+    return f"{base}_{index:0{len(str(max(count-1, 0)))}d}{extension}"
+
+
+def tile_windows(length, tile_length):
+    """ return the start and end of the windows of tile_length units that cover a chart
+    of length units """
+    count = max(1, ceil(length / tile_length))
+    return [(k*tile_length, (k+1)*tile_length) for k in range(count)]
+
+
+def _in_window(firing, start, end):
+    """ check if the firing is drawn in the window from start to end, in units """
+    if firing[0] == firing[1]:
+        return start <= firing[0] < end
+    return firing[0] < end and firing[1] > start
+
+
+def _row_bounds(row_lanes):
+    """ return for every row of firings sorted on start time the start times of the
+    firings and the running maximum of their end times, to find the firings of a window
+    with bisect """
+    bounds = []
+    for firings, _, _ in row_lanes:
+        bounds.append(([firing[0] for firing in firings],
+                       list(accumulate((firing[1] for firing in firings), max))))
+    return bounds
+
+
+def _tile_rows(row_lanes, start, end, bounds=None, scale=1):
+    """ return the firings and lanes of the rows that are drawn in the window, clipped to
+    the window and relative to its start, keeping the lanes of the whole chart. The
+    times of the firings are multiplied by scale, to draw them with a unit that is scale
+    times smaller, and start and end are in that unit. The bounds of the rows, as
+    computed by _row_bounds, are computed if they are not given. """
+    if bounds is None:
+        bounds = _row_bounds(row_lanes)
+    tile_rows = []
+    for (firings, lanes, depth), (starts, max_ends) in zip(row_lanes, bounds):
+        tile_firings = []
+        tile_lanes = []
+        # the firings before first end before the window, the firings from last start
+        # after it
+        first = bisect_left(max_ends, start / scale)
+        last = bisect_left(starts, end / scale)
+        for firing, lane in zip(firings[first:last], lanes[first:last]):
+            f_start, f_end = firing[0] * scale, firing[1] * scale
+            if _in_window((f_start, f_end), start, end):
+                tile_firing = list(firing)
+                tile_firing[0] = max(f_start, start) - start
+                tile_firing[1] = min(f_end, end) - start
+                tile_firings.append(tile_firing)
+                tile_lanes.append(lane)
+        tile_rows.append((tile_firings, tile_lanes, depth))
+    return tile_rows
+
+
+def _sorted_events(events):
+    """ return the events with their time stamps sorted, for _window_events """
+    return {name: sorted(stamps) for name, stamps in events.items()}
+
+
+def _window_events(events, start, end):
+    """ return the sorted time stamps of the events in the window from start to end, in
+    time, of events sorted by _sorted_events """
+    return {name: stamps[bisect_left(stamps, start):bisect_left(stamps, end)]
+            for name, stamps in events.items()}
+
+
+def _render_tile(settings, labels, row_lanes, trace_heights, arrivals, outputs, offset_x,
+                 time_offset, filename, canvas=None, record=False):
+    """ draw a tile of a Gantt chart and save it to the file, or as a page of the
+    canvas, and return the filename. If record is set, the tile is recorded while it is
+    drawn and the recorded calls are returned instead, to draw the tile again. """
+    drawer = SVGTraceDrawer(settings)
+    drawer.time_offset = time_offset
+    if settings.width is None:
+        settings.width = drawer.gantt_width(offset_x)
+    recording = None
+    if record:
+        if canvas is None:
+            canvas = drawer.create_canvas(filename)
+        canvas = recording = RecordingCanvas(canvas)
+    canvas = drawer.draw_gantt(labels, row_lanes, trace_heights, arrivals, outputs, offset_x,
+                               filename, canvas)
+    canvas.save()
+    return filename if recording is None else recording.calls
+
+
+def save_gantt_tiles(actors, arrivals, outputs, filename, tile_length, settings=None,
+                     workers=1, bundle=None):
+    """ make a Gantt chart with the same rows, labels and colors in tiles of tile_length
+    units of the time axis, saved in files numbered after filename, in the format of its
+    extension. The tiles are drawn by workers processes. If bundle is the name of a
+    PDF file, the tiles are also saved as the pages of that file. Returns the list of
+    the names of the tile files. """
+    if settings is None:
+        settings = TraceSettings()
+    drawer = SVGTraceDrawer(settings)
+    labels, row_lanes, trace_heights, offset_x = drawer.prepare_gantt(actors, arrivals,
+                                                                      outputs)
+    unit = settings.unit()
+    origin = drawer.time_offset
+    # the tiles have the length of the tile and their own width
+    tile_settings = copy.deepcopy(settings)
+    tile_settings.set_length(tile_length)
+    tile_settings.width = None
+    # the tiles are drawn in parallel instead of their rows
+    tile_settings.set_row_workers(1)
+
+    windows = tile_windows(settings.length(), tile_length)
+    bounds = _row_bounds(row_lanes)
+    arrivals, outputs = _sorted_events(arrivals), _sorted_events(outputs)
+    # the tiles are recorded while they are drawn to add them to the bundle as well
+    record = bundle is not None
+    jobs = []
+    for index, (start, end) in enumerate(windows):
+        t_start, t_end = origin + start*unit, origin + end*unit
+        jobs.append((copy.deepcopy(tile_settings), labels,
+                     _tile_rows(row_lanes, start, end, bounds), trace_heights,
+                     _window_events(arrivals, t_start, t_end),
+                     _window_events(outputs, t_start, t_end), offset_x, t_start,
+                     tile_filename(filename, index, len(windows)), None, record))
+
+    canvas = None if bundle is None else PDFPagesCanvas(bundle)
+    if workers is not None and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            _add_pages(executor.map(_render_tile, *zip(*jobs)), canvas)
+    else:
+        _add_pages((_render_tile(*job) for job in jobs), canvas)
+    if canvas is not None:
+        canvas.close()
+    return [job[8] for job in jobs]
+
+
+def _add_pages(results, canvas):
+    """ draw the tiles recorded by _render_tile as the pages of the canvas, if any, as
+    they are drawn """
+    for calls in results:
+        if canvas is not None:
+            RecordingCanvas.replay(calls, canvas)
+            canvas.save()
@@ -3,6 +3,8 @@
 from math import floor, log10, pow as mathpow
 from yaml import Loader as yaml_Loader, load as yaml_load
 from cmtrace.graphics.colorpalette import COLOR_PALETTE_FILLS, COLOR_PALETTE_LINES
+from cmtrace.trace.vectortrace import VectorTrace
+from cmtrace.graphics.rendercontext import RenderContext
 
 SCENARIO_SEPARATOR = '@'
 
@@ -33,6 +35,14 @@ DEFAULTS = {
     'graphics:show-text-labels': True,
     'graphics:background-color': (255, 255, 255),
     'graphics:row-background-color': (240, 240, 240),
+    'graphics:level-of-detail': 'none', # none, merge or utilisation
+    'graphics:lod-resolution': 96.0,
+    'graphics:lod-threshold': 1.0,
+    'graphics:svg-writer': 'svgwrite', # svgwrite or stream
+    'graphics:css-styles': False,
+    'graphics:batch-paths': False,
+    'graphics:dpi': 96.0,
+    'graphics:row-workers': 1,
     'structure:row-order': "by-first-firing"
 }
 
@@ -79,6 +89,13 @@ class TraceSettings():
         """ read the YAML file and parse it """
         self.parse_settings(file)
 
+    def effective_settings(self):
+        """ return the flattened settings, with the defaults for the settings that are
+        not given """
+        result = dict(DEFAULTS)
+        result.update(self.settings)
+        return result
+
     def __get_value(self, tag):
         if tag in self.settings:
             return self.settings[tag]
@@ -262,6 +279,29 @@ class TraceSettings():
         return  orig[1]
 
 
+    def time_window(self):
+        """ return the pair (start, end) of the time window of the firings and events
+        that are read from the trace; either may be None for no restriction """
+        _val = self.__get_value('layout:time-window')
+        if _val is None:
+            return None, None
+        if not isinstance(_val, list) or len(_val) != 2:
+            raise TraceSettingsException("layout:time-window should be a pair of numbers in settings.")
+        try:
+            return tuple(None if _t is None else float(_t) for _t in _val)
+        except ValueError:
+            raise TraceSettingsException("layout:time-window should be a pair of numbers in settings.")
+
+    def time_origin(self):
+        """ return the time at the origin of the time axis of a Gantt chart, the start
+        of the time window, or 0 if the window has no start """
+        t_start, _ = self.time_window()
+        return 0 if t_start is None else t_start
+
+    def set_time_window(self, t_start, t_end):
+        """ set the time window of the firings and events read from the trace """
+        self.__set_value('layout:time-window', [t_start, t_end])
+
     def set_length(self, length):
         """ set the length of the graph in units """
         self.__set_value('layout:trace-length', length)
@@ -307,10 +347,167 @@ class TraceSettings():
         """ returns whether to show the firing text labels """
         return self.__get_value('graphics:show-text-labels')
 
+    def level_of_detail(self):
+        """ returns the level of detail mode for dense rows of firings: 'none' to draw
+        every firing, 'merge' to merge firings that are too small to be seen into bars,
+        or 'utilisation' to draw them as a strip shaded by the utilisation """
+        _val = self.__get_value('graphics:level-of-detail')
+        if _val not in ['none', 'merge', 'utilisation']:
+            raise TraceSettingsException("graphics:level-of-detail should be none, merge or utilisation in settings.")
+        return _val
+
+    def set_level_of_detail(self, mode):
+        """ sets the level of detail mode """
+        self.__set_value('graphics:level-of-detail', mode)
+
+    def lod_resolution(self):
+        """ returns the resolution of the output, in pixels per inch, used to determine
+        which firings are aggregated """
+        _val = self.__get_value('graphics:lod-resolution')
+        try:
+            _res = float(_val)
+        except (TypeError, ValueError):
+            raise TraceSettingsException("graphics:lod-resolution should be a number in settings.")
+        if _res <= 0.0:
+            raise TraceSettingsException("graphics:lod-resolution should be positive in settings.")
+        return _res
+
+    def set_lod_resolution(self, resolution):
+        """ sets the resolution used for the level of detail """
+        self.__set_value('graphics:lod-resolution', resolution)
+
+    def lod_threshold(self):
+        """ returns the width in pixels below which firings are aggregated """
+        _val = self.__get_value('graphics:lod-threshold')
+        try:
+            return float(_val)
+        except (TypeError, ValueError):
+            raise TraceSettingsException("graphics:lod-threshold should be a number in settings.")
+
+    def set_lod_threshold(self, threshold):
+        """ sets the width in pixels below which firings are aggregated """
+        self.__set_value('graphics:lod-threshold', threshold)
+
+    def svg_writer(self):
+        """ returns how the SVG file is written: 'svgwrite' to build the document in
+        memory, or 'stream' to write the elements to the file as they are drawn """
+        _val = self.__get_value('graphics:svg-writer')
+        if _val not in ['svgwrite', 'stream']:
+            raise TraceSettingsException("graphics:svg-writer should be svgwrite or stream in settings.")
+        return _val
+
+    def set_svg_writer(self, writer):
+        """ sets how the SVG file is written """
+        self.__set_value('graphics:svg-writer', writer)
+
+    def css_styles(self):
+        """ returns whether the styles of the elements are collected in a style sheet and
+        referred to by class, instead of written with every element """
+        return self.__get_value('graphics:css-styles')
+
+    def set_css_styles(self, css_styles):
+        """ sets whether the styles are collected in a style sheet """
+        self.__set_value('graphics:css-styles', css_styles)
+
+    def batch_paths(self):
+        """ returns whether the firings and events of a row are drawn as a single path
+        per color """
+        return self.__get_value('graphics:batch-paths')
+
+    def set_batch_paths(self, batch_paths):
+        """ sets whether the firings and events are drawn as a path per color """
+        self.__set_value('graphics:batch-paths', batch_paths)
+
+    def dpi(self):
+        """ returns the resolution of raster images in pixels per inch """
+        _val = self.__get_value('graphics:dpi')
+        try:
+            _dpi = float(_val)
+        except (TypeError, ValueError):
+            raise TraceSettingsException("graphics:dpi should be a number in settings.")
+        if _dpi <= 0.0:
+            raise TraceSettingsException("graphics:dpi should be positive in settings.")
+        return _dpi
+
+    def set_dpi(self, dpi):
+        """ sets the resolution of raster images """
+        self.__set_value('graphics:dpi', dpi)
+
+    def row_workers(self):
+        """ returns the number of processes that draw the rows of a Gantt chart """
+        _val = self.__get_value('graphics:row-workers')
+        if not isinstance(_val, int) or isinstance(_val, bool) or _val < 1:
+            raise TraceSettingsException("graphics:row-workers should be a positive integer in settings.")
+        return _val
+
+    def set_row_workers(self, workers):
+        """ sets the number of processes that draw the rows of a Gantt chart """
+        self.__set_value('graphics:row-workers', workers)
+
     def row_background_color(self):
         """ returns the background color for alternate rows of the chart """
         return self.__get_value('graphics:row-background-color')
 
+    def __number(self, tag, value):
+        """ check that the value of the setting tag is a number and return it as an int or
+        float """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise TraceSettingsException(f"{tag} should be a number in settings.")
+
+    def __color(self, tag, value):
+        """ check that the value of the setting tag is a color of three numbers """
+        if not isinstance(value, (list, tuple)) or len(value) != 3:
+            raise TraceSettingsException(f"{tag} should be a list of three numbers in settings.")
+        return tuple(self.__number(tag, c) for c in value)
+
+    def compile(self):
+        """ validate the settings used for drawing and return them as a render context.
+        The unit must have been determined. """
+        unit = self.__number('layout:unit', self.unit())
+        if unit <= 0:
+            raise TraceSettingsException("layout:unit should be positive in settings.")
+        origin = self.origin()
+        scale_y = self.__number('layout:trace-width', self.scale_mm_per_unit_y())
+        return RenderContext(
+            unit=unit,
+            scale_x=self.__number('layout:horizontal-scale', self.scale_mm_per_unit_x()),
+            scale_y=scale_y,
+            origin_x=self.__number('layout:origin', origin[0]),
+            origin_y=self.__number('layout:origin', origin[1]),
+            overlap_offset=self.__number('layout:overlap-vertical-offset',
+                                         self.overlap_offset()),
+            overlap_horizontal_offset=self.__number('layout:overlap-horizontal-offset',
+                                                    self.overlap_horizontal_offset()),
+            event_radius=self.__number('layout:event-radius', self.event_radius())*scale_y,
+            font=self.font(),
+            font_size=self.__number('layout:font-size', self.font_size()),
+            label_separation=self.__number('layout:label-separation',
+                                           self.label_separation()),
+            tick_length=self.__number('layout:tick-length', self.tick_length()),
+            tick_number_separation=self.__number('layout:tick-number-separation',
+                                                 self.tick_number_separation()),
+            column_line_width=self.__number('layout:column-linewidth',
+                                            self.column_line_width()),
+            border_line_width=self.__number('layout:border-linewidth',
+                                            self.border_line_width()),
+            firing_stroke_width=self.__number('graphics:firing-stroke-width',
+                                              self.firing_stroke_width()),
+            background_color=self.__color('graphics:background-color',
+                                          self.background_color()),
+            row_background_color=self.__color('graphics:row-background-color',
+                                              self.row_background_color()),
+            alternate_color=bool(self.alternate_color()),
+            show_text_labels=bool(self.show_text_labels()),
+            firing_color_mode=self.firing_color_mode(),
+            vector_color_mode=self.vector_color_mode(),
+            level_of_detail=self.level_of_detail(),
+            batch_paths=bool(self.batch_paths())
+        )
+
     def set_alternate_color(self, alt_value):
         """ sets the alternate colors setting """
         self.__set_value('graphics:alternate-color', alt_value)
@@ -353,25 +550,19 @@ class TraceSettings():
         """ sets the width of the canvas of the graph """
         self.width = width
 
-    def __max_firing_time(self, actor):
-        firings = actor.firing_intervals()
-        result = 0.0
-        for firing in firings:
-            if firing[1]>result:
-                result = firing[1]
-        return result
-
     def __max_time_gantt(self, actors):
         result = 0.0
         for _, group in actors:
             for act in group:
                 if not act is None:
-                    act_max = self.__max_firing_time(act)
+                    act_max = act.max_firing_time()
                     if act_max > result:
                         result = act_max
         return result
 
     def __max_time_event_seqs(self, event_seqs):
+        if isinstance(event_seqs, VectorTrace):
+            return max(0.0, event_seqs.max_timestamp())
         result = 0.0
         for _, seq in event_seqs:
             if not seq is None:
@@ -382,7 +573,11 @@ class TraceSettings():
 
     def default_unit(self, actors):
         """Determine default unit"""
-        length = self.__max_time_gantt(actors)
+        return self.default_unit_of_length(self.__max_time_gantt(actors) - self.time_origin())
+
+    @staticmethod
+    def default_unit_of_length(length):
+        """ determine the default unit of a Gantt chart of length in time """
         if length <= 0:
             return 1
         return mathpow(10.0, floor(log10(length))-1)
@@ -393,8 +588,9 @@ class TraceSettings():
         return mathpow(10.0, floor(log10(length))-1)
 
     def default_length_gantt(self, actors):
-        """ determine the length of the trace based on the firings in the trace in units. """
-        result = self.__max_time_gantt(actors)
+        """ determine the length of the trace based on the firings in the trace in units,
+        from the origin of the time axis """
+        result = self.__max_time_gantt(actors) - self.time_origin()
         if not self.unit() is None:
             result = result / self.unit()
         return result * (1+self.length_extension())
@@ -0,0 +1,351 @@
+''' Rendering of many figures, of many traces and settings, in one process pool '''
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+import yaml
+from cmtrace.graphics.tracesettings import TraceSettings
+from cmtrace.libtracetosvg import ensure_path, render_gantt_fig, render_vector_fig
+from cmtrace.trace.tracecache import GANTT_TRACE, VECTOR_TRACE
+from cmtrace.trace.tracereader import detect_trace_format, read_trace
+from cmtrace.trace.xmlreader import read_vector_trace_xml
+
+GANTT = 'Gantt'
+VECTOR = 'vector'
+CHART_TYPES = [GANTT, VECTOR]
+
+# the name of the default settings in output file templates
+DEFAULT_SETTINGS_NAME = 'default'
+
+
+class BatchException(Exception):
+    """Exceptions in batch manifests"""
+
+
+class BatchJob:
+    """ A figure to make: the trace file, the output file, the settings file, None
+    for the default settings, the type of chart, Gantt or vector, and the format of
+    a Gantt trace, None to determine it from the extension """
+
+    def __init__(self, trace_filename, output_filename, settings_filename=None,
+                 chart_type=GANTT, trace_format=None):
+        if chart_type not in CHART_TYPES:
+            raise BatchException(f"Unknown chart type {chart_type}.")
+        self.trace_filename = trace_filename
+        self.output_filename = output_filename
+        self.settings_filename = settings_filename
+        self.chart_type = chart_type
+        self.trace_format = trace_format
+
+    def trace_key(self):
+        """ jobs with the same key draw the same parsed trace """
+        return (os.path.realpath(self.trace_filename), self.chart_type, self.trace_format)
+
+    def settings(self):
+        """ return the settings of the job """
+        settings = TraceSettings()
+        if self.settings_filename is not None:
+            settings.parse_settings(self.settings_filename)
+        return settings
+
+
+class BatchResult:
+    """ The outcome of a job: the seconds it took to read the trace, None if the trace
+    was read for an earlier job or not at all, the seconds it took to draw the figure,
+    or to copy it, the error message if it failed and if the figure was copied from the
+    render cache """
+
+    def __init__(self, job, read_seconds, seconds, error=None, cached=False):
+        self.job = job
+        self.read_seconds = read_seconds
+        self.seconds = seconds
+        self.error = error
+        self.cached = cached
+
+    def succeeded(self):
+        """ check if the figure was made """
+        return self.error is None
+
+    def summary(self):
+        """ return a line describing the result """
+        status = 'ok' if self.succeeded() else 'FAILED'
+        if self.cached:
+            read = 'cached'
+        elif self.read_seconds is None:
+            read = 'reused'
+        else:
+            read = f"{self.read_seconds:.2f}s"
+        line = f"{status:6} read {read:>7} draw {self.seconds:6.2f}s  " \
+            f"{self.job.trace_filename} -> {self.job.output_filename}"
+        if not self.succeeded():
+            line += f": {self.error}"
+        return line
+
+
+def matrix_jobs(patterns, settings_filenames, output_template, chart_type=GANTT,
+                trace_format=None):
+    """ return the jobs for every trace file matching the glob patterns with every
+    settings file, None for the default settings. The output file names are made from
+    the output_template, in which {trace} is replaced by the name of the trace file
+    without its extension, {settings} by the name of the settings file without its
+    extension, or 'default', and {type} by the chart type """
+    if len(settings_filenames) == 0:
+        settings_filenames = [None]
+    jobs = []
+    for pattern in patterns:
+        trace_filenames = sorted(glob.glob(pattern))
+        if len(trace_filenames) == 0:
+            raise BatchException(f"No trace files match {pattern}.")
+        for trace_filename in trace_filenames:
+            trace_name = os.path.splitext(os.path.basename(trace_filename))[0]
+            for settings_filename in settings_filenames:
+                settings_name = DEFAULT_SETTINGS_NAME if settings_filename is None else \
+                    os.path.splitext(os.path.basename(settings_filename))[0]
+                output_filename = output_template.format(trace=trace_name,
+                                                         settings=settings_name,
+                                                         type=chart_type)
+                jobs.append(BatchJob(trace_filename, output_filename, settings_filename,
+                                     chart_type, trace_format))
+    _check_outputs(jobs)
+    return jobs
+
+
+def read_manifest(manifest_filename):
+    """ return the jobs of a YAML manifest with a list of jobs, each with a trace, an
+    output and optionally settings, type and format, and/or a matrix of traces, a list
+    of glob patterns, settings, a list of settings files, output, a template as for
+    matrix_jobs, and optionally type and format. Relative paths are relative to the
+    folder of the manifest. """
+    with open(manifest_filename, 'r', encoding='utf-8') as manifest_file:
+        manifest = yaml.safe_load(manifest_file)
+    if not isinstance(manifest, dict):
+        raise BatchException("The manifest should have jobs or a matrix.")
+    base_dir = os.path.dirname(os.path.abspath(manifest_filename))
+
+    def path(name):
+        return None if name is None else os.path.join(base_dir, name)
+
+    jobs = []
+    for spec in manifest.get('jobs', []):
+        if 'trace' not in spec or 'output' not in spec:
+            raise BatchException("Every job in the manifest should have a trace and an output.")
+        jobs.append(BatchJob(path(spec['trace']), path(spec['output']),
+                             path(spec.get('settings')), spec.get('type', GANTT),
+                             spec.get('format')))
+    if 'matrix' in manifest:
+        matrix = manifest['matrix']
+        if 'traces' not in matrix or 'output' not in matrix:
+            raise BatchException("The matrix in the manifest should have traces and an output.")
+        jobs += matrix_jobs([path(p) for p in matrix['traces']],
+                            [path(s) for s in matrix.get('settings', [])],
+                            path(matrix['output']), matrix.get('type', GANTT),
+                            matrix.get('format'))
+    _check_outputs(jobs)
+    return jobs
+
+
+def _check_outputs(jobs):
+    """ check that the jobs write to different files """
+    outputs = set()
+    for job in jobs:
+        output = os.path.realpath(job.output_filename)
+        if output in outputs:
+            raise BatchException(f"Several jobs write to {job.output_filename}.")
+        outputs.add(output)
+
+
+def _read_job_trace(job, cache):
+    """ read the complete trace of the job """
+    if job.chart_type == VECTOR:
+        if cache is not None:
+            return cache.read_vector_trace(job.trace_filename, 1.0)
+        return read_vector_trace_xml(job.trace_filename, 1.0)
+    if cache is not None:
+        return cache.read_trace(job.trace_filename, 1.0, trace_format=job.trace_format)
+    return read_trace(job.trace_filename, 1.0, trace_format=job.trace_format)
+
+
+def _render_job(job, trace):
+    """ draw the figure of the job from its parsed trace """
+    if job.chart_type == VECTOR:
+        render_vector_fig(trace, job.output_filename, job.settings())
+    else:
+        render_gantt_fig(*trace, job.output_filename, job.settings())
+
+
+def _ensure_output_path(job):
+    """ make sure that the folder of the output file of the job exists """
+    output_dir = os.path.dirname(job.output_filename)
+    if output_dir != '':
+        ensure_path(output_dir)
+
+
+def _fetch_job(job, render_cache, trace_hash):
+    """ copy the figure of the job from the render cache and return None, or return
+    its key if it is not in the cache """
+    if job.chart_type == VECTOR:
+        kind, trace_format = VECTOR_TRACE, None
+    else:
+        kind = GANTT_TRACE
+        trace_format = job.trace_format if job.trace_format is not None else \
+            detect_trace_format(job.trace_filename)
+    key = render_cache.key(trace_hash, job.settings(), kind, job.output_filename, trace_format)
+    if render_cache.fetch(key, job.output_filename):
+        return None
+    return key
+
+
+def _fetch_trace_jobs(jobs, render_cache):
+    """ copy the figures of the jobs, which draw the same trace, that are in the
+    render cache, if any. Returns the results of the jobs, None for the figures that
+    still have to be drawn, and the keys of those figures in the render cache. """
+    results = [None]*len(jobs)
+    keys = [None]*len(jobs)
+    if render_cache is None:
+        return results, keys
+    trace_hash = None
+    for index, job in enumerate(jobs):
+        start = time.perf_counter()
+        try:
+            _ensure_output_path(job)
+            if trace_hash is None:
+                trace_hash = render_cache.trace_hash(job.trace_filename)
+            keys[index] = _fetch_job(job, render_cache, trace_hash)
+            if keys[index] is None:
+                results[index] = BatchResult(job, None, time.perf_counter() - start,
+                                             cached=True)
+        except (Exception, SystemExit) as e:  # pylint: disable=broad-except
+            results[index] = BatchResult(job, None, time.perf_counter() - start,
+                                         str(e) or type(e).__name__)
+    return results, keys
+
+
+def _read_trace_jobs(jobs, cache):
+    """ read the trace of the jobs, which is the same for all jobs. Returns the trace,
+    the seconds it took to read it and the results of the jobs if it failed, else
+    None """
+    start = time.perf_counter()
+    try:
+        trace = _read_job_trace(jobs[0], cache)
+    except (Exception, SystemExit) as e:  # pylint: disable=broad-except
+        read_seconds = time.perf_counter() - start
+        return None, read_seconds, [BatchResult(job, read_seconds, 0.0,
+                                                f"reading the trace failed: {e}")
+                                    for job in jobs]
+    return trace, time.perf_counter() - start, None
+
+
+def _draw_trace_jobs(jobs, keys, trace, read_seconds, render_cache=None):
+    """ draw the figures of the jobs from their parsed trace, which took read_seconds
+    to read, None if it was counted for other jobs, store them in the render cache
+    under their keys, unless those are None, and return their results """
+    results = []
+    for job, key in zip(jobs, keys):
+        start = time.perf_counter()
+        error = None
+        try:
+            _ensure_output_path(job)
+            _render_job(job, trace)
+            if key is not None:
+                render_cache.store(key, job.output_filename)
+        except (Exception, SystemExit) as e:  # pylint: disable=broad-except
+            error = str(e) or type(e).__name__
+        results.append(BatchResult(job, read_seconds, time.perf_counter() - start, error))
+        read_seconds = None
+    return results
+
+
+def _pending_trace_jobs(jobs, cache, render_cache):
+    """ copy the figures of the jobs, which draw the same trace, that are in the render
+    cache, and read the trace once if there are other figures. Returns the results of
+    the jobs, None for the figures that still have to be drawn, the keys of those
+    figures in the render cache, the trace, or None if it was not read, and the
+    seconds it took to read it """
+    results, keys = _fetch_trace_jobs(jobs, render_cache)
+    pending = [index for index, result in enumerate(results) if result is None]
+    if len(pending) == 0:
+        return results, keys, None, None
+    trace, read_seconds, failed = _read_trace_jobs([jobs[index] for index in pending], cache)
+    if failed is not None:
+        for index, result in zip(pending, failed):
+            results[index] = result
+        return results, keys, None, None
+    return results, keys, trace, read_seconds
+
+
+def _run_trace_jobs(jobs, cache, render_cache=None):
+    """ read the trace of the jobs, which is the same for all jobs, once, draw the
+    figures of the jobs and return their results. Figures that are in the render
+    cache, if any, are copied from it, and the trace is only read if there are other
+    figures. """
+    results, keys, trace, read_seconds = _pending_trace_jobs(jobs, cache, render_cache)
+    pending = [index for index, result in enumerate(results) if result is None]
+    drawn = _draw_trace_jobs([jobs[index] for index in pending],
+                             [keys[index] for index in pending], trace, read_seconds,
+                             render_cache)
+    for index, result in zip(pending, drawn):
+        results[index] = result
+    return results
+
+
+def run_batch(jobs, workers=1, cache=None, render_cache=None):
+    """ make the figures of the jobs, in a pool of workers processes. Every trace is
+    read once, optionally from or into the TraceCache cache, for all the jobs that draw
+    it. The jobs of a trace with more jobs than the average number of jobs per worker
+    are divided over the workers, which get the trace read by the main process;
+    the other traces are read and drawn by a single worker.
+    Figures that are in the RenderCache render_cache, if provided, are copied from it
+    and the others are stored in it. A job that fails does not stop the other jobs.
+    Returns the results in the order of the jobs. """
+    groups = {}
+    for index, job in enumerate(jobs):
+        groups.setdefault(job.trace_key(), []).append((index, job))
+    groups = list(groups.values())
+
+    results = [None]*len(jobs)
+
+    def collect(group, group_results):
+        for (index, _), result in zip(group, group_results):
+            results[index] = result
+
+    if workers is None or workers <= 1 or len(jobs) <= 1:
+        for group in groups:
+            collect(group, _run_trace_jobs([job for _, job in group], cache, render_cache))
+        return results
+
+    size = max(1, ceil(len(jobs) / workers))
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = []
+        for group in groups:
+            if len(group) <= size:
+                futures.append((group, executor.submit(
+                    _run_trace_jobs, [job for _, job in group], cache, render_cache)))
+        for group in [group for group in groups if len(group) > size]:
+            group_jobs = [job for _, job in group]
+            group_results, keys, trace, read_seconds = \
+                _pending_trace_jobs(group_jobs, cache, render_cache)
+            collect(group, group_results)
+            pending = [(group[index], keys[index])
+                       for index, result in enumerate(group_results) if result is None]
+            for i in range(0, len(pending), size):
+                part = pending[i:i+size]
+                futures.append(([item for item, _ in part], executor.submit(
+                    _draw_trace_jobs, [job for (_, job), _ in part],
+                    [key for _, key in part], trace, read_seconds, render_cache)))
+                read_seconds = None
+        for group, future in futures:
+            collect(group, future.result())
+    return results
+
+
+def print_summary(results, seconds=None):
+    """ print a line for every result and the number of jobs that succeeded and failed,
+    and the total number of seconds, if given """
+    for result in results:
+        print(result.summary())
+    failed = sum(1 for result in results if not result.succeeded())
+    total = f"{len(results)} jobs, {len(results)-failed} succeeded, {failed} failed"
+    if seconds is not None:
+        total += f" in {seconds:.2f}s"
+    print(total)
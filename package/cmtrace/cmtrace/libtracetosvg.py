@@ -1,11 +1,18 @@
 '''Script to create an SVG figures from a trace '''
 import os
-import xml.etree.ElementTree as ET
-from cmtrace.graphics.svggraphics import save_gantt_svg, save_vector_svg, convert_svg_to_pdf
+import time
+from cmtrace.graphics.svggraphics import save_gantt_svg, save_vector_svg, convert_svg_to_pdf, \
+    save_gantt_files, save_vector_files
+from cmtrace.graphics.svgfollow import SVGTraceFollower
+from cmtrace.graphics.tiling import save_gantt_tiles
+from cmtrace.graphics.pyramid import save_gantt_pyramid
 from cmtrace.graphics.colorpalette import COLOR_PALETTE_FILLS
 from cmtrace.graphics.tracesettings import TraceSettings
-from cmtrace.dataflow.maxplus import MP_MINUS_INF
-from cmtrace.utils.utils import error
+from cmtrace.trace.traceactor import TraceActor
+from cmtrace.trace.xmlreader import read_trace_xml, read_vector_trace_xml, TraceTail
+from cmtrace.trace.tracereader import read_trace, detect_trace_format
+from cmtrace.trace.tracecache import GANTT_TRACE, VECTOR_TRACE
+from cmtrace.trace.tracefilter import TraceFilter
 
 from cmtrace.graphics.tracesettings import SCENARIO_SEPARATOR
 
@@ -14,154 +21,6 @@ def ensure_path(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
-class TraceActor:
-    """A TraceActor has a list of firings, and possibly a scenario"""
-
-    def __init__(self, name, scenario=None):
-        self.firings = list()
-        self.scenario = scenario
-        self.name = name
-
-    def add_firing(self, start, end, iteration, text):
-        """ add a firing to the list of firings """
-        self.firings.append((float(start), float(end), iteration, text))
-
-    def firing_intervals(self):
-        """ Return a list of (start,end, iteration) triples for all firings """
-        return self.firings
-
-    def max_firing_time(self):
-        """ return the largest of completion times of all firing intervals
-        or zero if the list is empty """
-        l = self.firing_intervals()
-        if len(l) == 0:
-            return 0.0
-        return max(map(lambda i: i[1], l))
-
-    def min_firing_time(self):
-        """ return the smallest of starting times of all firing intervals
-        or zero if the list is empty"""
-        l = self.firing_intervals()
-        if len(l) == 0:
-            return 0.0
-        return min(map(lambda i: i[0], l))
-
-
-def read_trace_xml(filename, scale=1.0):
-    """
-    read the xml trace file and apply an optional scaling to the time stamps
-    return actor firings, input arrivals and output arrivals.
-    arrivals are in the form of a dictionary with names as keys and list of time stamps as value
-    actor is a dict from actor name to TraceActor objects
-    """
-
-    # check if trace file exists
-    if not os.path.isfile(filename):
-        error(f"Trace file ({filename}) does not exist.")
-
-    # parse the XML
-    try:
-        root = ET.parse(filename)
-    except ET.ParseError as e:
-        error(f"Failed to parse xml file ({filename}).\nReason: {e}")
-
-    # dictionary to collect the actor traces
-    # keys will be actor scenarios plus actor names
-    actors = {}
-
-    # find all the firing nodes in the XML
-    for firing in root.findall("./firings/firing"):
-        # get the firing data from it
-        act = firing.attrib['actor']
-        start = scale*float(firing.attrib['start'])
-        end = scale*float(firing.attrib['end'])
-        if 'scenario' in firing.attrib:
-            scenario = firing.attrib['scenario']
-        else:
-            scenario = None
-        if 'iteration' in firing.attrib:
-            iteration = firing.attrib['iteration']
-        else:
-            iteration = None
-        text = None
-        if 'text' in firing.attrib:
-            text = firing.attrib['text']
-
-        # create a new entry if it is a new actor
-        if not scenario+SCENARIO_SEPARATOR+act in actors:
-            actors[scenario+SCENARIO_SEPARATOR+act] = TraceActor(scenario+SCENARIO_SEPARATOR+act,
-                                                                 scenario)
-
-        # add the new firing
-        actors[scenario+SCENARIO_SEPARATOR+act].add_firing(start, end, iteration, text)
-
-    inputs = {}
-    for inp in root.findall("./inputs/input"):
-        # get the timestamp data from it
-        timestamp = scale*float(inp.attrib['timestamp'])
-
-        # is the input named?
-        if 'name' in inp.attrib:
-            name = inp.attrib['name']
-        else:
-            name = 'Inputs'
-        if name not in inputs:
-            inputs[name] = list()
-        inputs[name].append(timestamp)
-
-    outputs = {}
-    for output in root.findall("./outputs/output"):
-        # get the timestamp data from it
-        timestamp = scale*float(output.attrib['timestamp'])
-
-        # is the input named?
-        if 'name' in output.attrib:
-            name = output.attrib['name']
-        else:
-            name = 'Outputs'
-        if name not in outputs:
-            outputs[name] = list()
-
-        outputs[name].append(timestamp)
-
-    return actors, inputs, outputs
-
-# TODO: extend event traces with an iteration number to enable weakly consistent graph
-# missing tokens in some iterations
-def read_vector_trace_xml(filename, scale=1.0):
-    """ read the xml vector trace file and apply an optional scaling to the time
-    stamps. ensure that the sequences all have the same length """
-
-    # parse the XML
-    root = ET.parse(filename)
-
-    # dictionary to collect the token traces
-    # keys will be token names
-    sequences = dict()
-
-    length = 1
-    # find all the vector nodes in the XML
-    for vector in root.findall("./vectors/vector"):
-        _ = int(vector.attrib['id'])
-        for token in vector.findall("token"):
-            name = token.attrib['name']
-            timestamp = scale*float(token.attrib['timestamp'])
-
-            # create a new entry if it is a new token; fill it with minus infinities
-            # for the length of the existing sequences
-            if not name in sequences:
-                sequences[name] = [MP_MINUS_INF] * (length-1)
-            sequences[name].append(timestamp)
-
-        # fill up all sequences to length
-        for _, seq in sequences.items():
-            if len(seq) < length:
-                seq.append(MP_MINUS_INF)
-        length += 1
-
-    return sequences
-
-
 def create_gantt_actors_all(actors):
     """ create a gantt actor list for all actors occurring in the trace,
     coloring according to the default color palette"""
@@ -189,15 +48,144 @@ def __scenario_actors(actors, actor_names, scenarios):
                 res.append(actors[scenario+SCENARIO_SEPARATOR+actor_name])
     return res
 
-def create_gantt_fig(trace_filename, svg_filename, settings=None):
-    """ create figure for the trace """
+def create_gantt_fig(trace_filename, svg_filename, settings=None, columnar=False, cache=None,
+                     workers=None, trace_format=None, render_cache=None):
+    """ create figure for the trace. If columnar is True the firings are stored in
+    NumPy columns instead of lists of tuples. If a TraceCache is provided, the
+    parsed trace is taken from, or stored in, the cache. workers is the number of
+    processes used to parse large traces. Only the actors in the rows of the settings
+    and the firings in the time window of the settings are read. trace_format is
+    'xml', 'jsonl' or 'csv'; if it is None it is determined by the file extension.
+    If a RenderCache is provided, the figure is copied from the cache if it has been
+    drawn before, otherwise it is stored in the cache. """
 
     # create default settings if none are provided
     if settings is None:
         settings = TraceSettings()
 
-    # read trace from file
-    actors, arrivals, outputs = read_trace_xml(trace_filename, 1.0)
+    figures = _uncached_figures(render_cache, trace_filename, settings, GANTT_TRACE,
+                                [svg_filename], trace_format)
+    if len(figures) == 0:
+        return
+
+    gantt_actors, arrivals, outputs = read_gantt_trace(trace_filename, settings, columnar,
+                                                       cache, workers, trace_format)
+
+    # gantt_actors: list of tuples with name, list of Actors
+    save_gantt_svg(gantt_actors, arrivals, outputs, svg_filename, settings=settings)
+    convert_svg_to_pdf(svg_filename)
+    _store_figures(render_cache, figures)
+
+def create_gantt_figs(trace_filename, filenames, settings=None, columnar=False, cache=None,
+                      workers=None, trace_format=None, render_cache=None):
+    """ create figures for the trace, as for create_gantt_fig, in all files of
+    filenames, in the formats of their extensions. The trace is read once and the
+    layout of the chart is computed once for all files that are not in the render
+    cache. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    figures = _uncached_figures(render_cache, trace_filename, settings, GANTT_TRACE,
+                                filenames, trace_format)
+    if len(figures) == 0:
+        return
+
+    gantt_actors, arrivals, outputs = read_gantt_trace(trace_filename, settings, columnar,
+                                                       cache, workers, trace_format)
+    save_gantt_files(gantt_actors, arrivals, outputs, list(figures), settings=settings)
+    _store_figures(render_cache, figures)
+
+def _uncached_figures(render_cache, trace_filename, settings, kind, filenames,
+                      trace_format=None):
+    """ copy the figures of the trace that are in the render cache, if any, to their
+    files and return a dictionary with the keys of the other figures by filename """
+    if render_cache is None:
+        return {filename: None for filename in filenames}
+    if kind == GANTT_TRACE and trace_format is None:
+        trace_format = detect_trace_format(trace_filename)
+    trace_hash = render_cache.trace_hash(trace_filename)
+    figures = {}
+    for filename in filenames:
+        key = render_cache.key(trace_hash, settings, kind, filename, trace_format)
+        if not render_cache.fetch(key, filename):
+            figures[filename] = key
+    return figures
+
+def _store_figures(render_cache, figures):
+    """ store the figures, a dictionary of keys by filename, in the render cache """
+    if render_cache is None:
+        return
+    for filename, key in figures.items():
+        render_cache.store(key, filename)
+
+def render_gantt_fig(actors, arrivals, outputs, svg_filename, settings=None):
+    """ create figure for a trace that has already been read, e.g., with read_trace,
+    with the actors and the firings in the time window of the settings. The trace is
+    not modified, so that it can be drawn with several settings. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    actors, arrivals, outputs = TraceFilter.from_settings(settings).apply(actors, arrivals,
+                                                                          outputs)
+    save_gantt_svg(gantt_rows(actors, settings), arrivals, outputs, svg_filename,
+                   settings=settings)
+    convert_svg_to_pdf(svg_filename)
+
+def create_gantt_tiles(trace_filename, filename, tile_length, settings=None, columnar=False,
+                       cache=None, workers=None, trace_format=None, bundle=None):
+    """ create figures for the trace in tiles of tile_length units of the time axis,
+    numbered after filename, drawn by workers processes, and optionally bundled as the
+    pages of the PDF file bundle. The trace is read as by create_gantt_fig. Returns the
+    names of the tile files. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    gantt_actors, arrivals, outputs = read_gantt_trace(trace_filename, settings, columnar,
+                                                       cache, workers, trace_format)
+    return save_gantt_tiles(gantt_actors, arrivals, outputs, filename, tile_length,
+                            settings=settings, workers=workers, bundle=bundle)
+
+def create_gantt_pyramid(trace_filename, directory, levels, settings=None, columnar=False,
+                         cache=None, workers=None, trace_format=None, extension='svg'):
+    """ create a pyramid of levels of tiles of the Gantt chart of the trace in the
+    directory, drawn by workers processes, with an HTML viewer that loads the visible
+    tiles. The trace is read as by create_gantt_fig. Returns the name of the viewer. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    gantt_actors, arrivals, outputs = read_gantt_trace(trace_filename, settings, columnar,
+                                                       cache, workers, trace_format)
+    return save_gantt_pyramid(gantt_actors, arrivals, outputs, directory, levels,
+                              settings=settings, workers=workers, extension=extension)
+
+def read_gantt_trace(trace_filename, settings, columnar=False, cache=None, workers=None,
+                     trace_format=None):
+    """ read the trace for a Gantt chart with the settings, as described for
+    create_gantt_fig, and return the list of the rows of the chart, tuples with the
+    name and the list of actors of the row, and the input and output events """
+
+    # read trace from file, skipping what will not be drawn
+    trace_filter = TraceFilter.from_settings(settings)
+    if cache is not None:
+        actors, arrivals, outputs = cache.read_trace(trace_filename, 1.0, workers=workers,
+                                                     trace_filter=trace_filter,
+                                                     trace_format=trace_format,
+                                                     columnar=columnar)
+    else:
+        actors, arrivals, outputs = read_trace(trace_filename, 1.0, columnar=columnar,
+                                               workers=workers, trace_filter=trace_filter,
+                                               trace_format=trace_format)
+
+    return gantt_rows(actors, settings), arrivals, outputs
+
+def gantt_rows(actors, settings):
+    """ return the rows of the Gantt chart of the actors with the settings, a list
+    of tuples with the name and the list of actors of the row, and assign colors to
+    the actors that have no color in the settings """
 
     actor_color_map = settings.color_map()
     if actor_color_map is None:
@@ -254,19 +242,99 @@ def create_gantt_fig(trace_filename, svg_filename, settings=None):
         if settings.row_order() == "by-actor-name":
             gantt_actors = sorted(gantt_actors, key=lambda a: a[0])
 
-    # gantt_actors: list of tuples with name, list of Actors
-    save_gantt_svg(gantt_actors, arrivals, outputs, svg_filename, settings=settings)
-    convert_svg_to_pdf(svg_filename)
+    return gantt_actors
+
+def follow_gantt_fig(trace_filename, svg_filename, settings=None, interval=1.0,
+                     idle_timeout=None):
+    """ follow a trace file that is still being written and update the Gantt chart
+    whenever new firings or events have been appended, every interval seconds, until
+    the trace is complete, nothing has been appended for idle_timeout seconds, or the
+    user interrupts. Only the appended part of the file is parsed and drawn. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    tail = TraceTail(trace_filename, 1.0, TraceFilter.from_settings(settings))
+    follower = SVGTraceFollower(svg_filename, settings)
+    idle = 0.0
+    try:
+        while True:
+            firings, inputs, outputs = tail.poll()
+            if follower.update(tail.actors, firings, inputs, outputs):
+                follower.save()
+                idle = 0.0
+            if tail.complete or (idle_timeout is not None and idle >= idle_timeout):
+                break
+            time.sleep(interval)
+            idle += interval
+    except KeyboardInterrupt:
+        pass
 
 # TODO: maybe allow to make plots with both gantt and tokens
 
-def create_vector_fig(trace_filename, svg_filename, settings=None):
-    """ create vector figure for the  trace """
+def create_vector_fig(trace_filename, svg_filename, settings=None, cache=None,
+                      render_cache=None):
+    """ create vector figure for the  trace. If a TraceCache is provided, the
+    parsed trace is taken from, or stored in, the cache. If a RenderCache is
+    provided, the figure is copied from the cache if it has been drawn before,
+    otherwise it is stored in the cache. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    figures = _uncached_figures(render_cache, trace_filename, settings, VECTOR_TRACE,
+                                [svg_filename])
+    if len(figures) == 0:
+        return
+
+    if cache is not None:
+        event_seqs = cache.read_vector_trace(trace_filename, 1.0)
+    else:
+        event_seqs = read_vector_trace_xml(trace_filename, 1.0)
+
+    render_vector_fig(event_seqs, svg_filename, settings)
+    _store_figures(render_cache, figures)
+
+def create_vector_figs(trace_filename, filenames, settings=None, cache=None,
+                       render_cache=None):
+    """ create vector figures for the trace, as for create_vector_fig, in all files of
+    filenames, in the formats of their extensions. The trace is read once and the
+    layout of the graph is computed once for all files that are not in the render
+    cache. """
+
+    if settings is None:
+        settings = TraceSettings()
+
+    figures = _uncached_figures(render_cache, trace_filename, settings, VECTOR_TRACE,
+                                filenames)
+    if len(figures) == 0:
+        return
+
+    if cache is not None:
+        event_seqs = cache.read_vector_trace(trace_filename, 1.0)
+    else:
+        event_seqs = read_vector_trace_xml(trace_filename, 1.0)
+
+    save_vector_files(vector_rows(event_seqs, settings), list(figures), settings)
+    _store_figures(render_cache, figures)
+
+def render_vector_fig(event_seqs, svg_filename, settings=None):
+    """ create vector figure for a trace that has already been read with
+    read_vector_trace_xml """
 
     if settings is None:
         settings = TraceSettings()
 
-    event_seqs = read_vector_trace_xml(trace_filename, 1.0)
+    save_vector_svg(vector_rows(event_seqs, settings), svg_filename, settings)
+
+#    save_gantt_svg(event_seq_rows, [], [], svg_filename, settings=settings)
+    convert_svg_to_pdf(svg_filename)
+
+def vector_rows(event_seqs, settings):
+    """ return the rows of the graph of the event sequences with the settings, a list
+    of tuples with the name and the list of sequences of the row, or the VectorTrace
+    ordered by the first time stamps if the settings do not define rows, and assign
+    colors to the tokens that have no color in the settings """
 
     structure = settings.structure()
 
@@ -287,28 +355,16 @@ def create_vector_fig(trace_filename, svg_filename, settings=None):
     # check if there are row layout settings specified
     rows = settings.rows()
 
-    if len(rows) > 0:
-        for row in rows:
-            # collect the actors to be represented in this row
-            if row in structure:
-                tokens_list = [(event_seqs[seq] if seq in event_seqs else None) for
-                               seq in structure[row]]
-            else:
-                tokens_list = [event_seqs[row]]
-            event_seq_rows.append((row, tokens_list))
-    else:
-        # create default layout, one row per token
-        # vector_tokens: list of tuples with name, list of event sequences
-        c_idx = 0
-        sorted_tokens = sorted(event_seqs.items(), key=lambda a: a[1][0])
-        for tok_name, seq in sorted_tokens:
-            event_seq_rows.append((tok_name, seq))
-            c_idx = (c_idx + 1) % len(COLOR_PALETTE_FILLS)
-
-
-    save_vector_svg(event_seq_rows, svg_filename, settings)
+    if len(rows) == 0:
+        # create default layout, one row per token, ordered by the first time stamp
+        return event_seqs.sorted_by_first_vector()
 
-
-
-#    save_gantt_svg(event_seq_rows, [], [], svg_filename, settings=settings)
-    convert_svg_to_pdf(svg_filename)
+    for row in rows:
+        # collect the actors to be represented in this row
+        if row in structure:
+            tokens_list = [(event_seqs[seq] if seq in event_seqs else None) for
+                           seq in structure[row]]
+        else:
+            tokens_list = [event_seqs[row]]
+        event_seq_rows.append((row, tokens_list))
+    return event_seq_rows
@@ -2,12 +2,41 @@
 Module Tests
 '''
 
-from unittest import TestCase
+from unittest import TestCase, mock
 
+import io
 import os
+import re
+import json
+import contextlib
+import gzip
+import shutil
+import struct
+import tempfile
 
-from cmtrace.graphics.tracesettings import TraceSettings
-from cmtrace.libtracetosvg import create_gantt_fig, create_vector_fig
+import numpy as np
+
+from cmtrace.graphics.tracesettings import TraceSettings, TraceSettingsException
+from cmtrace.graphics.fontmetrics import FontMetrics
+from cmtrace.libtracetosvg import create_gantt_fig, create_gantt_figs, create_gantt_pyramid, create_gantt_tiles, \
+    create_vector_fig, create_vector_figs, follow_gantt_fig, gantt_rows
+from cmtrace.graphics.svggraphics import SVGTraceDrawer
+from cmtrace.graphics.svgfollow import SVGTraceFollower
+from cmtrace.graphics.svgstream import SVGStreamCanvas, SVGFragmentCanvas
+from cmtrace.graphics.cairocanvas import CairoCanvas
+from cmtrace.graphics.lanes import EPSILON, LaneAllocator, allocate_lanes
+from cmtrace.graphics.tiling import _row_bounds, _tile_rows, tile_windows
+from cmtrace.graphics.pyramid import MAX_PYRAMID_LEVELS, _level_jobs, save_gantt_pyramid
+from cmtrace.utils import commandline
+from cmtrace.libbatch import BatchException, matrix_jobs, read_manifest, run_batch
+from cmtrace.trace.xmlreader import read_trace_xml, read_vector_trace_xml, TraceTail
+from cmtrace.trace.tracecache import TraceCache, GANTT_TRACE, MAGIC, FORMAT_VERSION, _content_hash
+from cmtrace.graphics.rendercache import RenderCache
+from cmtrace.trace.fastscan import read_trace_fast, scan_trace, SchemaDeviation
+from cmtrace.trace import sharding
+from cmtrace.trace.tracefilter import TraceFilter
+from cmtrace.trace.tracereader import read_trace
+from cmtrace.trace.traceactor import TraceActor, ColumnarTraceActor, iteration_column
 
 
 
@@ -26,6 +55,13 @@ class TestCmtrace(TestCase):
         settings = TraceSettings()
         create_vector_fig(trace_file, outfile, settings=settings)
 
+    def setUp(self):
+        """ the example directory and a temporary directory, removed after the test """
+        self.example_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'example')
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
     def test_default_trace(self):
         """Create a Gantt chart for a simple example trace."""
         # Create traces for simple example examples/trace.xml
@@ -43,6 +79,639 @@ class TestCmtrace(TestCase):
         settings.parse_settings(settings_file)
         create_gantt_fig(trace_file, output_file, settings=settings)
 
+    def test_level_of_detail(self):
+        """Aggregate the firings of an example trace that are too small to be seen."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        outputs = {}
+        # a low resolution makes all firings smaller than a pixel, a high one none
+        for mode, resolution in [('none', 2.0), ('merge', 2.0), ('utilisation', 2.0),
+                                 ('utilisation', 1e6)]:
+            settings = TraceSettings()
+            settings.set_level_of_detail(mode)
+            settings.set_lod_resolution(resolution)
+            output_file = os.path.join(self.temp_dir, f'trace_{mode}.svg')
+            create_gantt_fig(trace_file, output_file, settings=settings)
+            with open(output_file, encoding='utf-8') as f:
+                outputs[(mode, resolution)] = f.read()
+        sizes = {key: output.count('<rect') for key, output in outputs.items()}
+        fills = {key: set(re.findall(r'fill="([^"]*)"', output)) for key, output in outputs.items()}
+        self.assertLess(sizes[('merge', 2.0)], sizes[('none', 2.0)])
+        self.assertLess(sizes[('utilisation', 2.0)], sizes[('none', 2.0)])
+        # the aggregated strips are shaded by the utilisation, in other colors
+        self.assertTrue(fills[('utilisation', 2.0)] - fills[('none', 2.0)])
+        # at a high resolution no firings are aggregated
+        self.assertEqual(outputs[('utilisation', 1e6)], outputs[('none', 2.0)])
+        # aggregated firings are drawn in the top lane, which is all the row needs
+        actors, _, _ = read_trace_xml(os.path.join(self.example_dir, 'trace.xml'))
+        heights = {}
+        for mode in ['none', 'utilisation']:
+            settings = TraceSettings()
+            settings.set_level_of_detail(mode)
+            settings.set_lod_resolution(1e-3)
+            _, row_lanes, heights[mode], _ = SVGTraceDrawer(settings).prepare_gantt(
+                gantt_rows(actors, settings), {}, {})
+        self.assertGreater(heights['none'][0], 1.0)
+        self.assertEqual(heights['utilisation'], [1.0] * len(heights['utilisation']))
+        self.assertTrue(all(lane == 0 for _, lanes, _ in row_lanes for lane in lanes))
+
+    def test_svg_stream_writer(self):
+        """Stream the SVG elements to the file with the same result as svgwrite."""
+        jobs = [(create_gantt_fig, os.path.join(self.example_dir, 'trace.xml'),
+                 os.path.join(self.example_dir, 'settings.yaml'))]
+        for kind, create_fig in [('gantt', create_gantt_fig), ('vector', create_vector_fig)]:
+            traces_dir = os.path.join(self.example_dir, 'traces', kind)
+            for trace_file in sorted(os.listdir(traces_dir)):
+                jobs.append((create_fig, os.path.join(traces_dir, trace_file), None))
+        for create_fig, trace_file, settings_file in jobs:
+            outputs = []
+            for writer in ['svgwrite', 'stream']:
+                settings = TraceSettings()
+                if settings_file is not None:
+                    settings.parse_settings(settings_file)
+                settings.set_svg_writer(writer)
+                output_file = os.path.join(self.temp_dir, f'trace_{writer}.svg')
+                create_fig(trace_file, output_file, settings=settings)
+                with open(output_file, 'rb') as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], outputs[1], trace_file)
+        # groups, which can change after they are drawn, are only drawn by svgwrite
+        self.assertFalse(hasattr(SVGStreamCanvas, 'add_group'))
+        self.assertFalse(hasattr(SVGFragmentCanvas, 'save'))
+
+    def test_css_styles(self):
+        """Collect the styles of an example trace in a style sheet."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        outputs = {}
+        for writer in ['svgwrite', 'stream']:
+            for css_styles in [False, True]:
+                settings = TraceSettings()
+                settings.set_svg_writer(writer)
+                settings.set_css_styles(css_styles)
+                output_file = os.path.join(self.temp_dir, 'trace.svg')
+                create_gantt_fig(trace_file, output_file, settings=settings)
+                with open(output_file, encoding='utf-8') as f:
+                    outputs[(writer, css_styles)] = f.read()
+        self.assertEqual(outputs[('svgwrite', True)], outputs[('stream', True)])
+        self.assertIn('<style type="text/css">', outputs[('svgwrite', True)])
+        self.assertNotIn('fill=', outputs[('svgwrite', True)].split('</defs>')[1])
+        self.assertLess(len(outputs[('svgwrite', True)]), len(outputs[('svgwrite', False)]))
+
+    def test_batch_paths(self):
+        """Draw the firings and events of example traces as a path per color."""
+        jobs = [(create_gantt_fig, os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml'),
+                 '<rect'),
+                (create_vector_fig, os.path.join(self.example_dir, 'traces', 'vector', 'mp3decoder_vector_trace.xml'),
+                 '<circle')]
+        for create_fig, trace_file, shape in jobs:
+            counts = {}
+            for batch_paths in [False, True]:
+                settings = TraceSettings()
+                settings.set_batch_paths(batch_paths)
+                output_file = os.path.join(self.temp_dir, 'trace.svg')
+                create_fig(trace_file, output_file, settings=settings)
+                with open(output_file, encoding='utf-8') as f:
+                    content = f.read()
+                counts[batch_paths] = content.count(shape) + content.count('<path')
+            self.assertLess(counts[True], counts[False])
+
+    def test_font_metrics(self):
+        """Measure labels with the cached font metrics."""
+        metrics = FontMetrics(cache_size=2)
+        labels = ['A', 'BB', 'A']
+        extents = metrics.measure(labels, 'Arial', 10)
+        self.assertEqual(extents[0], extents[2])
+        self.assertEqual(extents[1], metrics.extent('BB', 'Arial', 10))
+        self.assertLess(extents[0][1], extents[1][1])
+        # labels that were removed from the cache, or cleared, are measured again
+        self.assertEqual(metrics.measure(['CCC', 'DDDD', 'A', 'BB'], 'Arial', 10)[2:], extents[:2])
+        metrics.clear()
+        self.assertEqual(metrics.measure(labels, 'Arial', 10), extents)
+
+    def test_render_context(self):
+        """Compile the settings into an immutable render context."""
+        settings = TraceSettings()
+        settings.set_unit(2.0)
+        context = settings.compile()
+        self.assertEqual(context.x_of_time(4.0), 10.0)
+        self.assertEqual(context.y(2.0), 10.0)
+        with self.assertRaises(AttributeError):
+            context.unit = 1.0
+        settings.set_firing_stroke_width('wide')
+        with self.assertRaises(TraceSettingsException):
+            settings.compile()
+
+    def test_png_output(self):
+        """Rasterise Gantt and vector charts of example traces to PNG images."""
+        # only the canvases of a file format create a surface
+        with self.assertRaises(TypeError):
+            CairoCanvas('trace.png')
+        output_file = os.path.join(self.temp_dir, 'trace.png')
+        settings = TraceSettings()
+        settings.set_dpi(150)
+        settings.set_batch_paths(True)
+        create_gantt_fig(os.path.join(self.example_dir, 'trace.xml'), output_file,
+                         settings=settings)
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(4), b'\x89PNG')
+        create_vector_fig(os.path.join(self.example_dir, 'traces', 'vector', 'mp3decoder_vector_trace.xml'),
+                          output_file, settings=TraceSettings())
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(4), b'\x89PNG')
+
+    def test_vector_document_output(self):
+        """Draw a Gantt chart of an example trace as PDF, PS and EPS documents."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        for extension, header in [('pdf', b'%PDF'), ('ps', b'%!PS'), ('eps', b'%!PS')]:
+            output_file = os.path.join(self.temp_dir, f'trace.{extension}')
+            create_gantt_fig(trace_file, output_file, settings=TraceSettings())
+            with open(output_file, 'rb') as f:
+                content = f.read()
+            self.assertTrue(content.startswith(header))
+            self.assertEqual(b'EPSF' in content.split(b'\n')[0], extension == 'eps')
+
+    def test_multiple_outputs(self):
+        """Draw a Gantt chart and a vector graph to several files, reading every trace once."""
+        for create_figs, create_fig, trace_file in [
+                (create_gantt_figs, create_gantt_fig, os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')),
+                (create_vector_figs, create_vector_fig, os.path.join(self.example_dir, 'traces', 'vector', 'mpeg4dec_vector_trace.xml'))]:
+            output_files = [os.path.join(self.temp_dir, f'trace.{extension}') for extension in ['svg', 'png', 'pdf']]
+            create_figs(trace_file, output_files, settings=TraceSettings())
+            for output_file in output_files:
+                self.assertTrue(os.path.getsize(output_file) > 0)
+            expected_file = os.path.join(self.temp_dir, 'expected.svg')
+            create_fig(trace_file, expected_file, settings=TraceSettings())
+            with open(expected_file, encoding='utf-8') as f:
+                expected = f.read()
+            with open(output_files[0], encoding='utf-8') as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_gantt_tiles(self):
+        """Draw a Gantt chart of an example trace in tiles, in parallel."""
+        # the firings of a tile are clipped to its window, and a firing in two tiles has
+        # the same color in both
+        settings = TraceSettings()
+        settings.set_unit(1.0)
+        actors, _, _ = read_trace_xml(os.path.join(self.example_dir, 'trace.xml'))
+        drawer = SVGTraceDrawer(settings)
+        _, row_lanes, _, _ = drawer.prepare_gantt(gantt_rows(actors, settings), {}, {})
+        drawer.context = settings.compile()
+        colors = {}
+        for start, end in tile_windows(settings.length(), 5.0):
+            for firings, _, _ in _tile_rows(row_lanes, start, end):
+                for firing in firings:
+                    self.assertTrue(0.0 <= firing[0] <= firing[1] <= end - start)
+                    colors.setdefault((firing[2], firing[5]), []).append(
+                        drawer.firing_color(firing, firing[6], drawer.context.firing_color_mode,
+                                            settings.color_map(), settings.color_palette()))
+        split = [c for c in colors.values() if len(c) > 1]
+        self.assertEqual(len(split), 2)
+        for tile_colors in split:
+            self.assertEqual(tile_colors[0], tile_colors[1])
+
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        output_file = os.path.join(self.temp_dir, 'trace.svg')
+        bundle_file = os.path.join(self.temp_dir, 'trace.pdf')
+        settings = TraceSettings()
+        settings.set_length(14.0)
+        tiles = create_gantt_tiles(trace_file, output_file, 5.0, settings=settings,
+                                   workers=2, bundle=bundle_file)
+        self.assertEqual([os.path.basename(t) for t in tiles],
+                         ['trace_0.svg', 'trace_1.svg', 'trace_2.svg'])
+        contents = []
+        for tile in tiles:
+            with open(tile, encoding='utf-8') as f:
+                contents.append(f.read())
+        # every tile has the same rows, with the firings of its window
+        for content in contents:
+            self.assertEqual(content.count('text-anchor="end"'),
+                             contents[0].count('text-anchor="end"'))
+            self.assertGreater(content.count('<rect'), 3)
+        self.assertTrue(os.path.exists(bundle_file))
+
+    def test_gantt_pyramid(self):
+        """Draw a Gantt chart as a pyramid of tiles with a viewer."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        viewer = create_gantt_pyramid(trace_file, self.temp_dir, 3, settings=TraceSettings(), workers=2)
+        with open(viewer, encoding='utf-8') as f:
+            self.assertIn('"levels": 3', f.read())
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'labels.svg')))
+        rects = []
+        for level in range(3):
+            tiles = sorted(os.listdir(os.path.join(self.temp_dir, str(level))))
+            self.assertEqual(tiles, [f'{index}.svg' for index in range(2**level)])
+            count = 0
+            for tile in tiles:
+                with open(os.path.join(self.temp_dir, str(level), tile), encoding='utf-8') as f:
+                    count += f.read().count('<rect')
+            rects.append(count)
+        # the firings on the coarse levels are aggregated
+        self.assertLess(rects[0], rects[2])
+        # the firings and events of every tile are clipped to its window
+        settings = TraceSettings()
+        actors, arrivals, outputs = read_trace_xml(trace_file)
+        rows = gantt_rows(actors, settings)
+        drawer = SVGTraceDrawer(settings)
+        labels, row_lanes, trace_heights, _ = drawer.prepare_gantt(rows, arrivals, outputs)
+        unit = settings.unit() / 4
+        jobs = _level_jobs(settings, row_lanes, _row_bounds(row_lanes), arrivals, outputs,
+                           labels, trace_heights, 2, settings.unit(), drawer.time_offset, 10,
+                           50.0, os.path.join(self.temp_dir, 'clip'), 'svg')
+        count = 0
+        for job in jobs:
+            for firings, _, _ in job[2]:
+                for firing in firings:
+                    self.assertTrue(0.0 <= firing[0] <= firing[1] <= 10)
+                    count += 1
+            for events in [job[4], job[5]]:
+                for stamps in events.values():
+                    self.assertTrue(all(job[7] <= t < job[7] + 10*unit for t in stamps))
+        self.assertGreater(count, 0)
+        # every level has the lanes and row heights of the whole chart
+        for level in range(3):
+            for job in _level_jobs(settings, row_lanes, _row_bounds(row_lanes), arrivals,
+                                   outputs, labels, trace_heights, level, settings.unit(),
+                                   drawer.time_offset, 10, 50.0,
+                                   os.path.join(self.temp_dir, 'lanes'), 'svg'):
+                self.assertEqual(job[3], trace_heights)
+                self.assertEqual([depth for _, _, depth in job[2]],
+                                 [depth for _, _, depth in row_lanes])
+                self.assertTrue(all(lane < depth for _, lanes, depth in job[2] for lane in lanes))
+        # the number of tiles doubles with every level, so the levels are bounded
+        with self.assertRaises(ValueError):
+            save_gantt_pyramid(rows, arrivals, outputs, self.temp_dir, MAX_PYRAMID_LEVELS + 1)
+
+    def test_parallel_rows(self):
+        """Draw the rows of a Gantt chart in parallel, identical to drawing them serially."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        contents = []
+        for workers in [1, 3]:
+            output_file = os.path.join(self.temp_dir, f'trace_{workers}.svg')
+            settings = TraceSettings()
+            settings.set_svg_writer('stream')
+            settings.set_row_workers(workers)
+            create_gantt_fig(trace_file, output_file, settings=settings)
+            with open(output_file, encoding='utf-8') as f:
+                contents.append(f.read())
+        self.assertEqual(contents[0], contents[1])
+        # svgwrite cannot merge the rows drawn in parallel
+        settings = TraceSettings()
+        settings.set_row_workers(3)
+        with self.assertRaises(TraceSettingsException):
+            create_gantt_fig(trace_file, output_file, settings=settings)
+        settings = TraceSettings()
+        settings.set_row_workers(0)
+        with self.assertRaises(TraceSettingsException):
+            settings.row_workers()
+
+    def test_read_trace_xml(self):
+        """Read the firings of the simple example trace."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        actors, inputs, outputs = read_trace_xml(trace_file, 2.0)
+        self.assertEqual(sorted(actors.keys()), ['a@A', 'a@B', 'a@C', 'b@A', 'b@B', 'b@C'])
+        self.assertEqual(actors['a@B'].firing_intervals(), [(0.0, 4.0, '0', 'B0'),
+                                                            (16.0, 20.0, '3', 'B3')])
+        self.assertEqual(actors['b@C'].scenario, 'b')
+        self.assertEqual(inputs, {})
+        self.assertEqual(outputs, {})
+
+    def test_columnar_trace_actor(self):
+        """Read the simple example trace into columnar actors."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        actors, _, _ = read_trace_xml(trace_file, 1.0, columnar=True)
+        self.assertEqual(actors['a@B'].firing_intervals(), [(0.0, 2.0, '0', 'B0'),
+                                                            (8.0, 10.0, '3', 'B3')])
+        self.assertEqual(actors['b@B'].max_firing_time(), 7.0)
+        self.assertEqual(actors['b@B'].min_firing_time(), 3.0)
+        self.assertEqual(actors['b@B'].labels(), ['B1', 'B2'])
+        # iterations that are not plain integers are kept as they are
+        actor = ColumnarTraceActor('a@A', 'A')
+        actor.add_firing(0.0, 1.0, '-1', None)
+        actor.add_firing(1.0, 2.0, None, None)
+        actor.add_firings(np.array([2.0, 3.0]), np.array([3.0, 4.0]),
+                          iteration_column(['007', 'x']), np.array([0, 0]), np.array(['t']))
+        self.assertEqual(actor.firing_intervals(), [(0.0, 1.0, '-1', None), (1.0, 2.0, None, None),
+                                                    (2.0, 3.0, '007', 't'), (3.0, 4.0, 'x', 't')])
+        # the rows of a chart are made from the columns, with the same result
+        settings = TraceSettings()
+        settings.set_unit(0.5)
+        drawer = SVGTraceDrawer(settings)
+        all_actors, _, _ = read_trace_xml(trace_file, 1.0)
+        self.assertEqual(drawer.row_firings(list(actors.values())),
+                         drawer.row_firings(list(all_actors.values())))
+        actor = ColumnarTraceActor('a@A', 'A')
+        actor.add_firings(np.array([0.0, 1.0]), np.array([1.0, 2.0]),
+                          iteration_column(['007', None]))
+        self.assertEqual([f[5] for f in drawer.row_firings([actor])], [7, 1])
+
+    def test_trace_cache(self):
+        """Read the simple example trace through the trace cache."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        cache = TraceCache(self.temp_dir)
+        actors, _, _ = cache.read_trace(trace_file)
+        self.assertEqual(len(cache.entries()), 1)
+        cached_actors, _, _ = cache.read_trace(trace_file)
+        for name, actor in read_trace_xml(trace_file)[0].items():
+            self.assertEqual(actors[name].firing_intervals(), actor.firing_intervals())
+            self.assertEqual(cached_actors[name].firing_intervals(),
+                             actor.firing_intervals())
+        columnar_actors, _, _ = cache.read_trace(trace_file, columnar=True)
+        self.assertTrue(all(isinstance(actor, ColumnarTraceActor)
+                            for actor in columnar_actors.values()))
+        # the columns are views of the mapped entry, copied when firings are added
+        actor = columnar_actors['a@A']
+        self.assertFalse(actor.starts().flags.writeable)
+        actor.add_firing(20.0, 21.0, None, None)
+        self.assertEqual(actor.max_firing_time(), 21.0)
+        cache.clear()
+        self.assertEqual(len(cache.entries()), 0)
+
+    def test_filtered_trace_cache(self):
+        """Read only the selected actors and time window through the default trace cache."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        output_file = os.path.join(self.temp_dir, 'trace.svg')
+        trace_filter = TraceFilter(None, 3.5, 8.0)
+        with mock.patch.dict(os.environ, {'CMTRACE_CACHE_DIR': self.temp_dir}):
+            settings_file = os.path.join(self.temp_dir, 'rows.yaml')
+            with open(settings_file, 'w', encoding='utf-8') as f:
+                f.write("structure:\n  rows: [a@B, b@B]\n")
+            settings = TraceSettings()
+            settings.parse_settings(settings_file)
+            settings.set_time_window(3.5, 8.0)
+            create_gantt_fig(trace_file, output_file, settings=settings, cache=TraceCache())
+            with mock.patch('sys.argv', ['cmtrace', '--time-window', '3.5', '8.0',
+                                         trace_file, output_file]):
+                commandline.main()
+            cache = TraceCache()
+        # only the filtered traces are cached, the complete trace is never parsed
+        self.assertEqual(len(cache.entries()), 2)
+        self.assertIsNone(cache.load(trace_file, GANTT_TRACE, 1.0))
+        for actors_filter in [TraceFilter.from_settings(settings), trace_filter]:
+            actors, _, _ = cache.load(trace_file, GANTT_TRACE, 1.0, trace_filter=actors_filter)
+            self.assertEqual(actors['a@B'].skipped_firings, 1)
+            self.assertEqual(actors['a@B'].firing_intervals()[0][:2], (8.0, 10.0))
+        # the actors that are not in the rows are kept without firings
+        self.assertEqual(len(actors['a@C']), 1)
+        actors, _, _ = cache.load(trace_file, GANTT_TRACE, 1.0,
+                                  trace_filter=TraceFilter.from_settings(settings))
+        self.assertEqual(len(actors['a@C']), 0)
+        # a filtered read from a cached complete trace gives the same result
+        cache.clear()
+        cache.read_trace(trace_file)
+        actors, _, _ = cache.read_trace(trace_file, trace_filter=trace_filter)
+        self.assertEqual(actors['a@B'].skipped_firings, 1)
+        self.assertEqual([f[:2] for f in actors['a@B'].firing_intervals()], [(8.0, 10.0)])
+
+    def test_corrupt_trace_cache(self):
+        """Parse the trace again when its cache entry is malformed."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        cache = TraceCache(self.temp_dir)
+        path = cache.entry_path(trace_file, GANTT_TRACE, 1.0)
+        header = json.dumps({'version': FORMAT_VERSION}).encode('utf-8')
+        for contents in [MAGIC + struct.pack('<Q', len(header)) + header,
+                         MAGIC + struct.pack('<Q', 1000) + b'{"version":',
+                         MAGIC + b'\x00']:
+            with open(path, 'wb') as f:
+                f.write(contents)
+            actors, _, _ = cache.read_trace(trace_file)
+            self.assertEqual(list(actors.keys()), list(read_trace_xml(trace_file)[0].keys()))
+            # the entry is replaced by a valid one
+            self.assertIsNotNone(cache.load(trace_file, GANTT_TRACE, 1.0))
+
+    def test_render_cache(self):
+        """Copy a figure from the render cache when the trace and settings are unchanged."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        render_cache = RenderCache(os.path.join(self.temp_dir, 'cache'))
+        output_file = os.path.join(self.temp_dir, 'trace.svg')
+        create_gantt_fig(trace_file, output_file, settings=TraceSettings(), render_cache=render_cache)
+        entries = render_cache.entries()
+        self.assertEqual(len(entries), 1)
+        # mark the cached figure, to see if it is copied instead of drawn
+        with open(entries[0][0], 'a', encoding='utf-8') as f:
+            f.write('<!-- cached -->')
+        create_gantt_fig(trace_file, output_file, settings=TraceSettings(), render_cache=render_cache)
+        with open(output_file, encoding='utf-8') as f:
+            self.assertTrue(f.read().endswith('<!-- cached -->'))
+        # other settings make another figure
+        settings = TraceSettings()
+        settings.set_length(20.0)
+        create_gantt_fig(trace_file, output_file, settings=settings, render_cache=render_cache)
+        with open(output_file, encoding='utf-8') as f:
+            self.assertFalse(f.read().endswith('<!-- cached -->'))
+        self.assertEqual(len(render_cache.entries()), 2)
+        # the least recently used figures are evicted
+        render_cache.max_size = os.path.getsize(output_file)
+        render_cache.evict()
+        self.assertEqual(len(render_cache.entries()), 1)
+        render_cache.clear()
+        self.assertEqual(len(render_cache.entries()), 0)
+        # a cold run with both caches hashes the trace once
+        _content_hash.cache_clear()
+        create_gantt_fig(trace_file, output_file, settings=TraceSettings(),
+                         cache=TraceCache(os.path.join(self.temp_dir, 'traces')),
+                         render_cache=render_cache)
+        self.assertEqual(_content_hash.cache_info().misses, 1)
+
+    def test_fast_trace_scanner(self):
+        """Scan the example traces with the fast reader."""
+        traces_dir = os.path.join(self.example_dir, 'traces', 'gantt')
+        for trace_file in [os.path.join(self.example_dir, 'trace.xml')] + \
+            [os.path.join(traces_dir, f) for f in os.listdir(traces_dir)]:
+            actors, inputs, outputs = read_trace_xml(trace_file, fast=False)
+            fast_actors, fast_inputs, fast_outputs = read_trace_fast(trace_file)
+            self.assertEqual(list(fast_actors.keys()), list(actors.keys()))
+            for name, actor in actors.items():
+                self.assertEqual(fast_actors[name].firing_intervals(), actor.firing_intervals())
+            self.assertEqual(fast_inputs, inputs)
+            self.assertEqual(fast_outputs, outputs)
+        # documents outside the plain schema are left to ElementTree
+        with self.assertRaises(SchemaDeviation):
+            scan_trace(b'<trace><!-- comment --><firings/></trace>')
+        latin1 = '<?xml version="1.0" encoding="ISO-8859-1"?><trace><firings>' \
+            '<firing id="0" start="0" end="1" actor="a" scenario="s" iteration="0" text="\u00e9"/>' \
+            '</firings></trace>'
+        with self.assertRaises(SchemaDeviation):
+            scan_trace(latin1.encode('latin-1'))
+        latin1_file = os.path.join(self.temp_dir, 'trace.xml')
+        with open(latin1_file, 'wb') as f:
+            f.write(latin1.encode('latin-1'))
+        actors, _, _ = read_trace_xml(latin1_file)
+        self.assertEqual(actors['s@a'].firing_intervals(), [(0.0, 1.0, '0', '\u00e9')])
+
+    def test_sharded_trace_reader(self):
+        """Read an example trace in parallel shards."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        actors, _, _ = read_trace_xml(trace_file, fast=False, columnar=True)
+        min_shard_size = sharding.MIN_SHARD_SIZE
+        # make sure that the small example is split into shards
+        sharding.MIN_SHARD_SIZE = 1000
+        try:
+            sharded_actors, _, _ = sharding.read_trace_sharded(trace_file, workers=4)
+        finally:
+            sharding.MIN_SHARD_SIZE = min_shard_size
+        self.assertEqual(list(sharded_actors.keys()), list(actors.keys()))
+        for name, actor in actors.items():
+            self.assertEqual(sharded_actors[name].firing_intervals(), actor.firing_intervals())
+        # iterations are read as they are written
+        records = ''.join(f'<firing id="{k}" start="{k}" end="{k+1}" actor="a" scenario="s" '
+                          f'iteration="{k:03}"/>' for k in range(200))
+        trace_file = os.path.join(self.temp_dir, 'trace.xml')
+        with open(trace_file, 'w', encoding='utf-8') as f:
+            f.write(f'<trace><firings>{records}</firings></trace>')
+        actors, _, _ = read_trace_xml(trace_file, fast=False)
+        sharding.MIN_SHARD_SIZE = 1000
+        try:
+            sharded_actors, _, _ = sharding.read_trace_sharded(trace_file, actor_class=TraceActor,
+                                                               workers=4)
+        finally:
+            sharding.MIN_SHARD_SIZE = min_shard_size
+        self.assertEqual(sharded_actors['s@a'].firing_intervals(), actors['s@a'].firing_intervals())
+        self.assertEqual(actors['s@a'].firing_intervals()[7][2], '007')
+
+    def test_compressed_trace(self):
+        """Read a gzip compressed copy of the simple example trace."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        actors, _, _ = read_trace_xml(trace_file)
+        compressed_file = os.path.join(self.temp_dir, 'trace.xml.gz')
+        with open(trace_file, 'rb') as f_in, gzip.open(compressed_file, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        compressed_actors, _, _ = read_trace_xml(compressed_file)
+        for name, actor in actors.items():
+            self.assertEqual(compressed_actors[name].firing_intervals(), actor.firing_intervals())
+
+    def test_lanes(self):
+        """Allocate overlapping firings to the lowest free lanes."""
+        # the lane of a firing is reused by a later firing that starts after it ends
+        lanes, depth = allocate_lanes([(0.0, 4.0), (1.0, 2.0), (2.5, 3.0), (3.0, 6.0),
+                                       (3.5, 5.0)])
+        self.assertEqual(lanes, [0, 1, 1, 1, 2])
+        self.assertEqual(depth, 3)
+        # firings that touch, within EPSILON, do not overlap
+        lanes, depth = allocate_lanes([(0.0, 1.0), (1.0, 2.0), (2.0 - EPSILON/2, 3.0)])
+        self.assertEqual(lanes, [0, 0, 0])
+        self.assertEqual(depth, 1)
+        lanes, depth = allocate_lanes([(0.0, 1.0), (1.0 - 2*EPSILON, 2.0)])
+        self.assertEqual(lanes, [0, 1])
+        self.assertEqual(depth, 2)
+        # the depth is the maximum number of overlapping firings
+        allocator = LaneAllocator()
+        self.assertEqual([allocator.allocate(t, t + 3.0) for t in range(6)], [0, 1, 2, 0, 1, 2])
+        self.assertEqual(allocator.depth, 3)
+        self.assertEqual(allocate_lanes([]), ([], 0))
+
+    def test_trace_filter(self):
+        """Read only the selected actors and time window of the simple example trace."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        all_actors, _, _ = read_trace_xml(trace_file)
+        trace_filter = TraceFilter(['a@B', 'b@B'], 3.5, 8.0)
+        for fast in [True, False]:
+            actors, _, _ = read_trace_xml(trace_file, fast=fast, trace_filter=trace_filter)
+            # actors that are not selected are kept without firings, for their colors
+            self.assertEqual(list(actors.keys()), list(all_actors.keys()))
+            self.assertEqual(actors['a@C'].firing_intervals(), [])
+            self.assertEqual([f[:2] for f in actors['a@B'].firing_intervals()], [(8.0, 10.0)])
+            self.assertEqual([f[:2] for f in actors['b@B'].firing_intervals()],
+                             [(3.0, 6.0), (4.0, 7.0)])
+            self.assertEqual(actors['a@B'].skipped_firings, 1)
+        # the time axis starts at the window and the colors alternate as without it
+        rows = {}
+        for window in [(None, None), (3.5, None)]:
+            settings = TraceSettings()
+            settings.set_unit(1.0)
+            settings.set_time_window(*window)
+            actors, _, _ = read_trace_xml(trace_file, trace_filter=TraceFilter.from_settings(settings))
+            drawer = SVGTraceDrawer(settings)
+            labels, row_lanes, _, _ = drawer.prepare_gantt(gantt_rows(actors, settings), {}, {})
+            rows[window] = dict(zip(labels, (firings for firings, _, _ in row_lanes)))
+            self.assertEqual(drawer.time_offset, window[0] or 0)
+        self.assertEqual([f[0] for f in rows[(3.5, None)]['B']], [-0.5, 0.5, 4.5])
+        self.assertEqual([f[6] for f in rows[(3.5, None)]['B']],
+                         [f[6] for f in rows[(None, None)]['B'][1:]])
+
+    def test_line_trace_readers(self):
+        """Read the same trace from JSON-lines and CSV files."""
+        actors, _, _ = read_trace_xml(os.path.join(self.example_dir, 'trace.xml'))
+        jsonl_lines = []
+        csv_lines = ['type,actor,scenario,start,end,iteration,text,name,timestamp']
+        for actor in actors.values():
+            act = actor.name.split('@')[-1]
+            for start, end, iteration, text in actor.firing_intervals():
+                jsonl_lines.append(json.dumps({'actor': act, 'scenario': actor.scenario,
+                                               'start': start, 'end': end,
+                                               'iteration': iteration, 'text': text}))
+                csv_lines.append(f"firing,{act},{actor.scenario},{start},{end},"
+                                 f"{iteration or ''},{text or ''},,")
+        jsonl_lines.append('{"type": "input", "name": "x", "timestamp": 1.5}')
+        csv_lines.append('input,,,,,,,x,1.5')
+        for name, lines in [('trace.jsonl', jsonl_lines), ('trace.csv', csv_lines)]:
+            trace_file = os.path.join(self.temp_dir, name)
+            with open(trace_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            line_actors, inputs, _ = read_trace(trace_file)
+            self.assertEqual(list(line_actors.keys()), list(actors.keys()))
+            for act_name, actor in actors.items():
+                self.assertEqual(line_actors[act_name].firing_intervals(),
+                                 actor.firing_intervals())
+            self.assertEqual(inputs, {'x': [1.5]})
+        # all readers reject a firing without scenario in the same way
+        for name, content in [
+                ('missing.xml', '<trace><firings><firing id="0" start="0" end="1" actor="A"/>'
+                                '</firings></trace>'),
+                ('missing.jsonl', '{"actor": "A", "start": 0, "end": 1}\n'),
+                ('missing.csv', 'actor,start,end\nA,0,1\n')]:
+            trace_file = os.path.join(self.temp_dir, name)
+            with open(trace_file, 'w', encoding='utf-8') as f:
+                f.write(content)
+            output = io.StringIO()
+            with self.assertRaises(SystemExit), contextlib.redirect_stdout(output):
+                read_trace(trace_file)
+            self.assertIn('firing of actor A has no scenario', output.getvalue())
+
+    def test_follow_trace(self):
+        """Follow an example trace while it is being written."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'gantt', 'mpeg4dec_trace.xml')
+        actors, _, _ = read_trace_xml(trace_file)
+        with open(trace_file, 'rb') as f:
+            data = f.read()
+        growing_file = os.path.join(self.temp_dir, 'trace.xml')
+        tail = TraceTail(growing_file)
+        count = 0
+        # append the trace in parts that split records
+        for k in range(0, len(data), 1000):
+            with open(growing_file, 'ab') as f:
+                f.write(data[k:k+1000])
+            firings, _, _ = tail.poll()
+            count += sum(len(intervals) for intervals in firings.values())
+        self.assertTrue(tail.complete)
+        self.assertEqual(count, sum(len(a.firing_intervals()) for a in actors.values()))
+        for name, actor in actors.items():
+            self.assertEqual(tail.actors[name].firing_intervals(), actor.firing_intervals())
+        svg_file = os.path.join(self.temp_dir, 'trace.svg')
+        follow_gantt_fig(growing_file, svg_file)
+        self.assertTrue(os.path.isfile(svg_file))
+        # an event that overlaps with one of an earlier update is drawn with a halo
+        settings = TraceSettings()
+        settings.set_unit(1.0)
+        follower = SVGTraceFollower(svg_file, settings)
+        follower.update({}, {}, {'x': [1.0]}, {})
+        follower.update({}, {}, {'x': [1.0]}, {})
+        follower.save()
+        with open(svg_file, encoding='utf-8') as f:
+            self.assertEqual(f.read().count('<circle'), 3)
+
+    def test_vector_trace(self):
+        """Read an example vector trace into the columnar store."""
+        trace_file = os.path.join(self.example_dir, 'traces', 'vector', 'mp3decoder_vector_trace.xml')
+        trace = read_vector_trace_xml(trace_file)
+        self.assertEqual(trace.timestamps.shape, (trace.num_vectors(), len(trace)))
+        # absent tokens are padded with minus infinity
+        self.assertTrue(((trace.timestamps < 0) | trace.present).all())
+        cache = TraceCache(self.temp_dir)
+        cache.read_vector_trace(trace_file)
+        cached = cache.read_vector_trace(trace_file)
+        self.assertEqual(cached.tokens, trace.tokens)
+        self.assertTrue((cached.timestamps == trace.timestamps).all())
+        self.assertTrue((cached.present == trace.present).all())
+
     def test_default_vector_trace(self):
         """Create a Gantt chart for a simple example trace."""
         # TODO: be done.
@@ -83,3 +752,35 @@ class TestCmtrace(TestCase):
             full_trace_file = os.path.join(traces_dir, trace_file)
             # make the trace
             self._make_trace_vector_test(full_trace_file, full_output_file)
+
+    def test_batch(self):
+        """Draw a trace with several settings from a manifest, reading the trace once."""
+        trace_file = os.path.join(self.example_dir, 'trace.xml')
+        settings_file = os.path.join(self.example_dir, 'settings.yaml')
+        manifest_file = os.path.join(self.temp_dir, 'manifest.yaml')
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            f.write(f"matrix:\n  traces: ['{trace_file}']\n"
+                    f"  settings: ['{settings_file}']\n  output: 'out/{{trace}}_{{settings}}.svg'\n"
+                    f"jobs:\n  - trace: '{trace_file}'\n    output: 'out/trace_default.svg'\n")
+        jobs = read_manifest(manifest_file)
+        results = run_batch(jobs)
+        self.assertTrue(all(result.succeeded() for result in results))
+        # the trace is read for the first job and reused for the second
+        self.assertIsNone(results[1].read_seconds)
+        # the jobs of the trace are divided over the workers, but the trace is read once
+        results = run_batch(jobs, workers=2)
+        self.assertTrue(all(result.succeeded() for result in results))
+        self.assertEqual(sum(result.read_seconds is not None for result in results), 1)
+        self.assertIsNone(results[1].read_seconds)
+        for name, settings in [('trace_default.svg', None), ('trace_settings.svg', settings_file)]:
+            expected_file = os.path.join(self.temp_dir, 'expected.svg')
+            expected_settings = TraceSettings()
+            if settings is not None:
+                expected_settings.parse_settings(settings)
+            create_gantt_fig(trace_file, expected_file, settings=expected_settings)
+            with open(expected_file, encoding='utf-8') as f:
+                expected = f.read()
+            with open(os.path.join(self.temp_dir, 'out', name), encoding='utf-8') as f:
+                self.assertEqual(f.read(), expected)
+        with self.assertRaises(BatchException):
+            matrix_jobs([trace_file], [settings_file, settings_file], '{trace}.svg')
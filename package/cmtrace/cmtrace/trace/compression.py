@@ -0,0 +1,50 @@
+""" support for reading compressed trace files """
+
+import bz2
+import gzip
+import lzma
+
+# signatures at the start of compressed files, and the functions to open them
+COMPRESSION_FORMATS = [
+    (b'\x1f\x8b', gzip.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'BZh', bz2.open)
+]
+
+# extensions of compressed files
+COMPRESSED_EXTENSIONS = ['.gz', '.xz', '.bz2']
+
+# errors raised by the decompressors on corrupt input
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError)
+
+
+def _compressed_opener(filename):
+    """ return the function to open the compressed file, or None if it is not compressed """
+    with open(filename, 'rb') as f:
+        signature = f.read(6)
+    for magic, opener in COMPRESSION_FORMATS:
+        if signature.startswith(magic):
+            return opener
+    return None
+
+
+def is_compressed(filename):
+    """ check if the file is compressed with gzip, xz or bz2 """
+    return _compressed_opener(filename) is not None
+
+
+def open_trace(filename):
+    """ open the trace file for reading in binary mode. Compressed files are
+    decompressed while they are read. """
+    opener = _compressed_opener(filename)
+    if opener is None:
+        return open(filename, 'rb')
+    return opener(filename, 'rb')
+
+
+def strip_compression_extension(filename):
+    """ return the file name without a compression extension """
+    for ext in COMPRESSED_EXTENSIONS:
+        if filename.lower().endswith(ext):
+            return filename[:-len(ext)]
+    return filename
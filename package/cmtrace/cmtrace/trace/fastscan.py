@@ -0,0 +1,295 @@
+""" fast reader for sdf3 xml Gantt traces that scans the memory-mapped file for the
+flat and fixed trace schema without building XML element objects """
+
+import re
+import mmap
+from xml.sax.saxutils import unescape
+import numpy as np
+from cmtrace.trace.traceactor import TraceActor, ColumnarTraceActor, NO_VALUE, \
+    iteration_column, iteration_values, actor_key
+
+# optional XML declaration at the start of the document
+PROLOG_RE = re.compile(rb'\s*(<\?xml\s[^<>?]*\?>)?')
+# the encoding in the XML declaration
+ENCODING_RE = re.compile(rb'\sencoding\s*=\s*["\']([^"\']*)["\']')
+# a start, end or empty element tag, preceded by optional white space,
+# with double quoted attribute values
+TAG_RE = re.compile(
+    rb'\s*<(/?)([A-Za-z_][\w.-]*)((?:\s+[A-Za-z_][\w.-]*\s*=\s*"[^"<]*")*)\s*(/?)>')
+# a single attribute in the attributes of a tag
+ATTR_RE = re.compile(rb'([A-Za-z_][\w.-]*)\s*=\s*"([^"]*)"')
+# trailing white space at the end of the document
+TRAILER_RE = re.compile(rb'\s*')
+# a firing record with its attributes in the order in which sdf3 writes them,
+# without entities in the values
+FIRING_RE = re.compile(
+    rb'\s*<firing\s+id="[^"&]*"\s+start="([^"&]*)"\s+end="([^"&]*)"\s+actor="([^"&]*)"'
+    rb'\s+scenario="([^"&]*)"\s+iteration="([^"&]*)"(\s+text="[^"&]*")?\s*/>')
+
+# encodings that can be decoded as UTF-8, in lower case
+UTF8_ENCODINGS = [b'utf-8', b'utf8', b'us-ascii', b'ascii']
+
+# approximate size in bytes of the chunks in which the firings section is read
+CHUNK_SIZE = 1 << 24
+
+# the root element, and the sections with the records they may contain
+ROOT_TAG = b'trace'
+SECTIONS = {b'firings': b'firing', b'inputs': b'input', b'outputs': b'output'}
+
+
+class SchemaDeviation(Exception):
+    """The document is not a plain sdf3 trace document that the fast scanner can read"""
+
+
+def _attributes(attr_bytes):
+    """ return a dict with the attributes of a tag, replacing predefined entities """
+    attrib = dict(ATTR_RE.findall(attr_bytes))
+    if b'&' in attr_bytes:
+        for key, val in attrib.items():
+            if b'&#' in val:
+                # character references are left to ElementTree
+                raise SchemaDeviation("character reference")
+            attrib[key] = unescape(val.decode('utf-8'), {'&quot;': '"', '&apos;': "'"}) \
+                .encode('utf-8')
+    return attrib
+
+
+class FiringCollector:
+    """ collects firings into actors, remembering the actor for every actor and
+    scenario combination to avoid rebuilding the key for every firing """
+
+    def __init__(self, actors, scale, actor_class=TraceActor, trace_filter=None):
+        self.actors = actors
+        self.scale = scale
+        self.actor_class = actor_class
+        self.trace_filter = trace_filter
+        self._lookup = {}
+        # actors and scenarios rejected by the filter
+        self._rejected = set()
+        # all actors, with their raw name and scenario, in order of first occurrence
+        self._order = []
+
+    def add(self, attrib):
+        """ add the firing with the given raw attributes """
+        try:
+            act = attrib[b'actor']
+            start = self.scale*float(attrib[b'start'])
+            end = self.scale*float(attrib[b'end'])
+        except (KeyError, ValueError) as e:
+            raise SchemaDeviation(f"invalid firing: {e}")
+        scenario = attrib.get(b'scenario')
+        actor = self._lookup.get((act, scenario))
+        if actor is None:
+            actor = self._actor(act, scenario)
+            if actor is None:
+                return
+        if self.trace_filter is not None and \
+            not self.trace_filter.accepts_firing(start, end, actor):
+            return
+        iteration = attrib.get(b'iteration')
+        if iteration is not None:
+            iteration = iteration.decode('utf-8')
+        text = attrib.get(b'text')
+        if text is not None:
+            text = text.decode('utf-8')
+        actor.add_firing(start, end, iteration, text)
+
+    def add_records(self, records):
+        """ add a list of firings matched by FIRING_RE """
+        groups = {}
+        for record in records:
+            key = (record[2], record[3])
+            if key in groups:
+                groups[key].append(record)
+            else:
+                groups[key] = [record]
+        scale = self.scale
+        try:
+            for (act, scenario), group in groups.items():
+                actor = self._lookup.get((act, scenario))
+                if actor is None:
+                    actor = self._actor(act, scenario)
+                    if actor is None:
+                        continue
+                starts, ends, _, _, iterations, texts = zip(*group)
+                # strip text=" and the closing quote from the optional text attribute
+                texts = [t[t.index(b'"')+1:-1].decode('utf-8') if t else None for t in texts]
+                if isinstance(actor, ColumnarTraceActor):
+                    starts = scale*np.array(list(map(float, starts)))
+                    ends = scale*np.array(list(map(float, ends)))
+                    iterations = iteration_column([i.decode('utf-8') for i in iterations])
+                    texts = np.array([actor.intern_label(t) for t in texts], dtype=np.int32)
+                    if self.trace_filter is not None and self.trace_filter.has_window():
+                        actor.skipped_firings += self.trace_filter.skipped_count(ends)
+                        mask = self.trace_filter.firing_mask(starts, ends)
+                        starts, ends = starts[mask], ends[mask]
+                        iterations, texts = iterations[mask], texts[mask]
+                    actor.add_firings(starts, ends, iterations, texts, actor.labels())
+                else:
+                    for start, end, iteration, text in zip(starts, ends, iterations, texts):
+                        start = scale*float(start)
+                        end = scale*float(end)
+                        if self.trace_filter is None or \
+                            self.trace_filter.accepts_firing(start, end, actor):
+                            actor.add_firing(start, end, iteration.decode('utf-8'), text)
+        except ValueError as e:
+            raise SchemaDeviation(f"invalid firing: {e}")
+
+    def add_columns(self, act, scenario, starts, ends, iterations, texts, labels,
+                    skipped_firings=0):
+        """ add firings given as columns like those of a ColumnarTraceActor, and the
+        number of firings that were skipped before the time window of the filter """
+        actor = self._lookup.get((act, scenario))
+        if actor is None:
+            actor = self._actor(act, scenario)
+            if actor is None:
+                return
+        actor.skipped_firings += skipped_firings
+        if isinstance(actor, ColumnarTraceActor):
+            actor.add_firings(starts, ends, iterations, texts, labels)
+            return
+        for start, end, iteration, text in zip(starts.tolist(), ends.tolist(),
+                                               iteration_values(iterations), texts.tolist()):
+            actor.add_firing(start, end, iteration, None if text == NO_VALUE else labels[text])
+
+    def raw_actors(self):
+        """ return a list of pairs of the raw actor name and scenario and the actor,
+        in order of first occurrence, including the actors rejected by the filter,
+        which have no firings """
+        return list(self._order)
+
+    def _actor(self, act, scenario):
+        """ look up or create the actor, return None if it is rejected by the filter;
+        rejected actors are created without firings """
+        if (act, scenario) in self._rejected:
+            return None
+        act_str = act.decode('utf-8')
+        scenario_str = None if scenario is None else scenario.decode('utf-8')
+        try:
+            key = actor_key(act_str, scenario_str)
+        except ValueError as e:
+            # the error is reported by ElementTree
+            raise SchemaDeviation(str(e))
+        if not key in self.actors:
+            self.actors[key] = self.actor_class(key, scenario_str)
+        self._order.append(((act, scenario), self.actors[key]))
+        if self.trace_filter is not None and not self.trace_filter.accepts_actor(key):
+            self._rejected.add((act, scenario))
+            return None
+        self._lookup[(act, scenario)] = self.actors[key]
+        return self.actors[key]
+
+
+def _add_event(events, attrib, scale, default_name, trace_filter):
+    """ add the time stamp of an input or output record, if it passes the filter """
+    try:
+        timestamp = scale*float(attrib[b'timestamp'])
+    except (KeyError, ValueError) as e:
+        raise SchemaDeviation(f"invalid event: {e}")
+    if trace_filter is not None and not trace_filter.accepts_event(timestamp):
+        return
+    name = attrib[b'name'].decode('utf-8') if b'name' in attrib else default_name
+    if name not in events:
+        events[name] = list()
+    events[name].append(timestamp)
+
+
+def scan_firing_records(data, pos, end, firings):
+    """ read the firing records between pos and end in chunks, as long as
+    every tag in a chunk is a firing in the order written by sdf3.
+    Returns the position up to where the records have been read. """
+    while pos < end:
+        # extend the chunk to the start of the next tag, so that it ends on
+        # a record boundary
+        chunk_end = data.find(b'<', min(pos + CHUNK_SIZE, end), end)
+        if chunk_end < 0:
+            chunk_end = end
+        chunk = data[pos:chunk_end]
+        records = FIRING_RE.findall(chunk)
+        # any other tag is left to the generic scanner
+        if chunk.count(b'<') != len(records):
+            return pos
+        firings.add_records(records)
+        pos = chunk_end
+    return pos
+
+
+def _scan_firings_section(data, pos, firings):
+    """ read the records of the firings section starting at pos.
+    Returns the position up to where the section has been read. """
+    end = data.find(b'</firings', pos)
+    if end < 0:
+        return pos
+    return scan_firing_records(data, pos, end, firings)
+
+
+def scan_trace(data, scale=1.0, actor_class=TraceActor, section_reader=_scan_firings_section,
+               trace_filter=None):
+    """ scan the bytes of an sdf3 trace document and return the actors, inputs and
+    outputs like read_trace_xml. Raises SchemaDeviation if the document does not follow
+    the plain trace schema. section_reader(data, pos, firings) is used to read the
+    records of a firings section in bulk; it returns the position up to where it read
+    the section, the remainder is read tag by tag. Only the firings and events that pass
+    the optional TraceFilter are kept. """
+    actors = {}
+    inputs = {}
+    outputs = {}
+    firings = FiringCollector(actors, scale, actor_class, trace_filter)
+
+    prolog = PROLOG_RE.match(data)
+    if prolog.group(1) is not None:
+        encoding = ENCODING_RE.search(prolog.group(1))
+        if encoding is not None and encoding.group(1).lower() not in UTF8_ENCODINGS:
+            raise SchemaDeviation(f"encoding {encoding.group(1).decode('ascii', 'replace')}")
+    pos = prolog.end()
+    # the open elements
+    stack = []
+    tag_match = TAG_RE.match
+    while True:
+        m = tag_match(data, pos)
+        if m is None:
+            break
+        pos = m.end()
+        closing, tag, attr_bytes, empty = m.groups()
+        depth = len(stack)
+        if closing:
+            if depth == 0 or stack[-1] != tag or attr_bytes or empty:
+                raise SchemaDeviation(f"unexpected end tag {tag}")
+            stack.pop()
+            if depth == 1:
+                break
+            continue
+        if depth == 2 and tag == SECTIONS[stack[1]] and empty:
+            attrib = _attributes(attr_bytes)
+            if tag == b'firing':
+                firings.add(attrib)
+            elif tag == b'input':
+                _add_event(inputs, attrib, scale, 'Inputs', trace_filter)
+            else:
+                _add_event(outputs, attrib, scale, 'Outputs', trace_filter)
+            continue
+        if (depth == 0 and tag == ROOT_TAG) or (depth == 1 and tag in SECTIONS):
+            if not empty:
+                stack.append(tag)
+                if tag == b'firings':
+                    pos = section_reader(data, pos, firings)
+            elif depth == 0:
+                break
+            continue
+        raise SchemaDeviation(f"unexpected element {tag}")
+
+    # the document must be complete, with nothing but white space after the root
+    if len(stack) > 0 or TRAILER_RE.match(data, pos).end() != len(data):
+        raise SchemaDeviation(f"unexpected content at offset {pos}")
+    return actors, inputs, outputs
+
+
+def read_trace_fast(filename, scale=1.0, actor_class=TraceActor, trace_filter=None):
+    """ read the trace file by scanning the memory-mapped file. Returns None if the
+    document does not follow the plain trace schema, or cannot be mapped. """
+    try:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return scan_trace(data, scale, actor_class, trace_filter=trace_filter)
+    except (OSError, ValueError, SchemaDeviation):
+        return None
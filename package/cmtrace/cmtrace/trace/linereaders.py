@@ -0,0 +1,173 @@
+""" readers for Gantt traces with one firing or event record per line, in JSON-lines
+or CSV format
+
+Every record has the same fields as the elements of an sdf3 xml trace. A firing has
+the fields actor, scenario, start and end, and the optional fields iteration and text.
+An input or output event has a timestamp and an optional name. The field type is
+'firing', 'input' or 'output'; records without a type are firings. For example:
+
+    {"type": "firing", "actor": "A", "scenario": "s", "start": 0, "end": 2, "iteration": 0}
+    {"type": "input", "name": "x", "timestamp": 1.5}
+
+or, in CSV with a header line:
+
+    type,actor,scenario,start,end,iteration,text,name,timestamp
+    firing,A,s,0,2,0,,,
+    input,,,,,,,x,1.5
+"""
+
+import io
+import os
+import csv
+import json
+from cmtrace.trace.traceactor import TraceActor, ColumnarTraceActor, actor_key, add_event
+from cmtrace.trace.compression import open_trace, DECOMPRESSION_ERRORS
+from cmtrace.utils.utils import error
+
+# record types
+FIRING_RECORD = 'firing'
+INPUT_RECORD = 'input'
+OUTPUT_RECORD = 'output'
+
+
+class RecordCollector:
+    """ collects firing and event records into actors, inputs and outputs like
+    read_trace_xml, remembering the actor for every actor and scenario combination """
+
+    def __init__(self, scale, actor_class=TraceActor, trace_filter=None):
+        self.scale = scale
+        self.actor_class = actor_class
+        self.trace_filter = trace_filter
+        self.actors = {}
+        self.inputs = {}
+        self.outputs = {}
+        # actor for every actor and scenario, None if it is rejected by the filter
+        self._lookup = {}
+
+    def add(self, record):
+        """ add a record, a dict with its fields; empty fields are treated as absent """
+        kind = record.get('type') or FIRING_RECORD
+        if kind == FIRING_RECORD:
+            self.add_firing(record['actor'], record.get('scenario'), record['start'],
+                            record['end'], record.get('iteration'), record.get('text'))
+        elif kind == INPUT_RECORD:
+            self.add_event(self.inputs, record.get('name') or 'Inputs', record['timestamp'])
+        elif kind == OUTPUT_RECORD:
+            self.add_event(self.outputs, record.get('name') or 'Outputs', record['timestamp'])
+        else:
+            raise ValueError(f"unknown record type {kind}")
+
+    def add_firing(self, act, scenario, start, end, iteration, text):
+        """ add a firing, if it passes the filter """
+        key = (act, scenario)
+        if key in self._lookup:
+            actor = self._lookup[key]
+        else:
+            # an empty field is a missing scenario, like in the xml reader
+            scenario = scenario or None
+            name = actor_key(act, scenario)
+            if not name in self.actors:
+                self.actors[name] = self.actor_class(name, scenario)
+            actor = self.actors[name]
+            # the firings of actors that are not selected are not kept
+            if self.trace_filter is not None and not self.trace_filter.accepts_actor(name):
+                actor = None
+            self._lookup[key] = actor
+        if actor is None:
+            return
+        start = self.scale*float(start)
+        end = self.scale*float(end)
+        if self.trace_filter is not None and \
+            not self.trace_filter.accepts_firing(start, end, actor):
+            return
+        if iteration == '':
+            iteration = None
+        elif iteration is not None:
+            iteration = str(int(iteration))
+        actor.add_firing(start, end, iteration, text or None)
+
+    def add_event(self, events, name, timestamp):
+        """ add the time stamp of an input or output, if it passes the filter """
+        timestamp = self.scale*float(timestamp)
+        if self.trace_filter is not None and not self.trace_filter.accepts_event(timestamp):
+            return
+        add_event(events, name, timestamp)
+
+    def result(self):
+        """ return the actors, inputs and outputs """
+        return self.actors, self.inputs, self.outputs
+
+
+def _read_lines(filename, scale, columnar, trace_filter, read_records):
+    """ read the records of the trace file with read_records(f, collector), reporting
+    errors like read_trace_xml """
+    if not os.path.isfile(filename):
+        error(f"Trace file ({filename}) does not exist.")
+    collector = RecordCollector(scale, ColumnarTraceActor if columnar else TraceActor,
+                                trace_filter)
+    try:
+        with io.TextIOWrapper(open_trace(filename), encoding='utf-8', newline='') as f:
+            read_records(f, collector)
+    except DECOMPRESSION_ERRORS as e:
+        error(f"Failed to read trace file ({filename}).\nReason: {e}")
+    except (ValueError, KeyError) as e:
+        error(f"Failed to parse trace file ({filename}).\nReason: {e}")
+    return collector.result()
+
+
+def _read_jsonl_records(f, collector):
+    for number, line in enumerate(f, 1):
+        if line.strip() == '':
+            continue
+        try:
+            collector.add(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"invalid record on line {number}: {e}")
+
+
+def _read_csv_records(f, collector):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [field.strip() for field in header]
+    for field in ['actor', 'start', 'end']:
+        if field not in header:
+            raise ValueError(f"missing column {field}")
+    column = {field: k for k, field in enumerate(header)}
+    # look up the columns once, fields that are absent are None
+    fields = [column.get(field) for field in
+              ['type', 'actor', 'scenario', 'start', 'end', 'iteration', 'text', 'name',
+               'timestamp']]
+    for number, row in enumerate(reader, 2):
+        if len(row) == 0:
+            continue
+        try:
+            kind, act, scenario, start, end, iteration, text, name, timestamp = \
+                [None if k is None or k >= len(row) else row[k] for k in fields]
+            if not kind or kind == FIRING_RECORD:
+                collector.add_firing(act, scenario, start, end, iteration, text)
+            elif kind == INPUT_RECORD:
+                collector.add_event(collector.inputs, name or 'Inputs', timestamp)
+            elif kind == OUTPUT_RECORD:
+                collector.add_event(collector.outputs, name or 'Outputs', timestamp)
+            else:
+                raise ValueError(f"unknown record type {kind}")
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"invalid record on line {number}: {e}")
+
+
+def read_trace_jsonl(filename, scale=1.0, columnar=False, trace_filter=None):
+    """ read a trace with one JSON object per line and apply an optional scaling to the
+    time stamps. Returns actor firings, input arrivals and output arrivals like
+    read_trace_xml. The file is read line by line. If columnar is True, the actors are
+    ColumnarTraceActor objects. Files compressed with gzip, xz or bz2 are decompressed
+    while they are read. If a TraceFilter is given, only the firings and events that
+    pass the filter are kept. """
+    return _read_lines(filename, scale, columnar, trace_filter, _read_jsonl_records)
+
+
+def read_trace_csv(filename, scale=1.0, columnar=False, trace_filter=None):
+    """ read a trace in CSV format with a header line naming the fields, and apply an
+    optional scaling to the time stamps. Otherwise like read_trace_jsonl. """
+    return _read_lines(filename, scale, columnar, trace_filter, _read_csv_records)
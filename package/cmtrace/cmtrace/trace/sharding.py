@@ -0,0 +1,93 @@
+""" parallel reading of very large sdf3 traces by splitting the firings section into
+shards that are scanned in a process pool """
+
+import os
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from cmtrace.trace.traceactor import ColumnarTraceActor
+from cmtrace.trace.fastscan import FiringCollector, SchemaDeviation, scan_trace, \
+    scan_firing_records
+
+# firings sections smaller than this number of bytes per shard are not split further
+MIN_SHARD_SIZE = 1 << 22
+
+
+def shard_boundaries(data, start, end, shards):
+    """ split the byte range from start to end into at most the given number of shards
+    that start on a tag """
+    bounds = [start]
+    size = (end - start) // shards
+    for k in range(1, shards):
+        pos = data.find(b'<', max(start + k * size, bounds[-1]), end)
+        if pos < 0:
+            break
+        if pos > bounds[-1]:
+            bounds.append(pos)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def scan_shard(filename, start, end, scale, trace_filter=None):
+    """ scan the firing records in the byte range of the file and return a list with
+    for every actor, in order of first occurrence, the actor name and scenario, the
+    columns of its firings that pass the filter and the number of firings skipped
+    before the time window of the filter """
+    actors = {}
+    firings = FiringCollector(actors, scale, ColumnarTraceActor, trace_filter)
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if scan_firing_records(data, start, end, firings) != end:
+                raise SchemaDeviation("firings section contains other elements")
+    return [(raw_key, actor.starts(), actor.ends(), actor.iterations(), actor.texts(),
+             actor.labels(), actor.skipped_firings)
+            for raw_key, actor in firings.raw_actors()]
+
+
+class ShardedSectionReader:
+    """ reads a firings section by scanning shards of it in a process pool and merging
+    the results in order """
+
+    def __init__(self, filename, scale, workers):
+        self.filename = filename
+        self.scale = scale
+        self.workers = workers
+
+    def __call__(self, data, pos, firings):
+        end = data.find(b'</firings', pos)
+        if end < 0:
+            return pos
+        shards = min(self.workers, max(1, (end - pos) // MIN_SHARD_SIZE))
+        if shards < 2:
+            return scan_firing_records(data, pos, end, firings)
+        bounds = shard_boundaries(data, pos, end, shards)
+        with ProcessPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = [executor.submit(scan_shard, self.filename, start, stop, self.scale,
+                                       firings.trace_filter) for start, stop in bounds]
+            try:
+                results = [future.result() for future in futures]
+            except SchemaDeviation:
+                # leave the section to the generic scanner
+                return pos
+        for result in results:
+            for (act, scenario), starts, ends, iterations, texts, labels, skipped in result:
+                firings.add_columns(act, scenario, starts, ends, iterations, texts, labels,
+                                    skipped)
+        return end
+
+
+def read_trace_sharded(filename, scale=1.0, actor_class=ColumnarTraceActor, workers=None,
+                       trace_filter=None):
+    """ read the trace file, scanning the firings section in parallel shards with the
+    given number of worker processes, by default the number of processors.
+    Only the firings and events that pass the optional TraceFilter are kept.
+    Returns None if the document does not follow the plain trace schema. """
+    if workers is None:
+        workers = os.cpu_count()
+    reader = ShardedSectionReader(filename, scale, workers)
+    try:
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return scan_trace(data, scale, actor_class, section_reader=reader,
+                                  trace_filter=trace_filter)
+    except (OSError, ValueError, SchemaDeviation):
+        return None
@@ -0,0 +1,311 @@
+""" representation of the actor firings found in a trace """
+
+import numpy as np
+from cmtrace.graphics.tracesettings import SCENARIO_SEPARATOR
+
+# value stored in the iteration and text columns for firings without iteration or text
+NO_VALUE = -1
+
+
+def _integer_iteration(iteration):
+    """ return the iteration as an integer if it can be stored in an integer column and
+    read back unchanged, None otherwise """
+    if isinstance(iteration, (int, np.integer)) and not isinstance(iteration, bool):
+        value = int(iteration)
+    elif isinstance(iteration, str):
+        try:
+            value = int(iteration)
+        except ValueError:
+            return None
+        if str(value) != iteration:
+            return None
+    else:
+        return None
+    return None if value == NO_VALUE else value
+
+
+def iteration_column(iterations):
+    """ return a column for a list of iterations, None for firings without iteration.
+    The column is an integer array, with NO_VALUE for missing iterations, if all
+    iterations are integers, or an object array with the iterations as they are """
+    values = []
+    for iteration in iterations:
+        if iteration is None:
+            values.append(NO_VALUE)
+            continue
+        value = _integer_iteration(iteration)
+        if value is None:
+            return np.array(list(iterations), dtype=object)
+        values.append(value)
+    return np.array(values, dtype=np.int64)
+
+
+def iteration_values(iterations):
+    """ return the iterations in a column as a list of strings, None for firings without
+    iteration """
+    if iterations.dtype == object:
+        return iterations.tolist()
+    return [None if i == NO_VALUE else str(i) for i in iterations.tolist()]
+
+
+def _object_iterations(iterations):
+    """ return an integer iteration column as an object column """
+    return np.array(iteration_values(iterations), dtype=object)
+
+
+class TraceActor:
+    """A TraceActor has a list of firings, and possibly a scenario"""
+
+    def __init__(self, name, scenario=None):
+        self.firings = list()
+        self.scenario = scenario
+        self.name = name
+        # the number of firings before the time window of a TraceFilter that were not read
+        self.skipped_firings = 0
+
+    def add_firing(self, start, end, iteration, text):
+        """ add a firing to the list of firings """
+        self.firings.append((float(start), float(end), iteration, text))
+
+    def firing_intervals(self):
+        """ Return a list of (start,end, iteration) triples for all firings """
+        return self.firings
+
+    def max_firing_time(self):
+        """ return the largest of completion times of all firing intervals
+        or zero if the list is empty """
+        l = self.firing_intervals()
+        if len(l) == 0:
+            return 0.0
+        return max(map(lambda i: i[1], l))
+
+    def min_firing_time(self):
+        """ return the smallest of starting times of all firing intervals
+        or zero if the list is empty"""
+        l = self.firing_intervals()
+        if len(l) == 0:
+            return 0.0
+        return min(map(lambda i: i[0], l))
+
+
+class ColumnarTraceActor:
+    """A TraceActor that stores its firings in columns of NumPy arrays, start times,
+    end times, iterations and indices into a table of interned text labels.
+    The iterations are stored as integers, NO_VALUE if a firing has no iteration, as
+    long as they are all integers other than NO_VALUE that are written as Python
+    writes them; otherwise they are stored as they are, in an object array.
+    The columns grow with amortised constant cost per firing."""
+
+    # initial number of firings for which room is reserved
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, name, scenario=None):
+        self.name = name
+        self.scenario = scenario
+        self._size = 0
+        self._starts = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+        self._ends = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+        self._iterations = np.empty(self.INITIAL_CAPACITY, dtype=np.int64)
+        self._texts = np.empty(self.INITIAL_CAPACITY, dtype=np.int32)
+        # interned text labels and their index in the table
+        self._labels = []
+        self._label_index = {}
+        # the number of firings before the time window of a TraceFilter that were not read
+        self.skipped_firings = 0
+
+    @classmethod
+    def from_columns(cls, name, scenario, starts, ends, iterations, texts, labels):
+        """ create an actor on existing columns, without copying them. The columns are
+        only copied when firings are added. """
+        actor = cls(name, scenario)
+        actor._size = len(starts)
+        actor._starts = starts
+        actor._ends = ends
+        actor._iterations = iterations
+        actor._texts = texts
+        for label in labels:
+            actor.intern_label(label)
+        return actor
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, extra):
+        """ make sure there is room for extra firings, doubling the capacity if needed """
+        required = self._size + extra
+        capacity = len(self._starts)
+        # columns that are read-only views, e.g. of a mapped cache entry, are copied
+        if required <= capacity and all(column.flags.writeable for column in
+                                        [self._starts, self._ends, self._iterations,
+                                         self._texts]):
+            return
+        capacity = max(capacity, self.INITIAL_CAPACITY)
+        while capacity < required:
+            capacity *= 2
+        self._starts = np.resize(self._starts, capacity)
+        self._ends = np.resize(self._ends, capacity)
+        self._iterations = np.resize(self._iterations, capacity)
+        self._texts = np.resize(self._texts, capacity)
+
+    def intern_label(self, text):
+        """ return the index of text in the label table, adding it if it is new """
+        if text is None:
+            return NO_VALUE
+        idx = self._label_index.get(text)
+        if idx is None:
+            idx = len(self._labels)
+            self._labels.append(text)
+            self._label_index[text] = idx
+        return idx
+
+    def add_firing(self, start, end, iteration, text):
+        """ add a firing to the columns """
+        self._reserve(1)
+        n = self._size
+        self._starts[n] = float(start)
+        self._ends[n] = float(end)
+        if self._iterations.dtype == object:
+            self._iterations[n] = iteration
+        elif iteration is None:
+            self._iterations[n] = NO_VALUE
+        else:
+            value = _integer_iteration(iteration)
+            if value is None:
+                self._to_object_iterations()
+                self._iterations[n] = iteration
+            else:
+                self._iterations[n] = value
+        self._texts[n] = self.intern_label(text)
+        self._size = n + 1
+
+    def add_firings(self, starts, ends, iterations=None, texts=None, labels=None):
+        """ add a batch of firings. iterations and texts are optional arrays,
+        iterations are columns like those made by iteration_column, texts are indices
+        into the list labels, or NO_VALUE """
+        count = len(starts)
+        self._reserve(count)
+        n = self._size
+        self._starts[n:n+count] = starts
+        self._ends[n:n+count] = ends
+        if iterations is None:
+            self._iterations[n:n+count] = None if self._iterations.dtype == object else NO_VALUE
+        else:
+            iterations = np.asarray(iterations)
+            if iterations.dtype == object:
+                self._to_object_iterations()
+            elif self._iterations.dtype == object:
+                iterations = _object_iterations(iterations)
+            self._iterations[n:n+count] = iterations
+        if texts is None:
+            self._texts[n:n+count] = NO_VALUE
+        else:
+            # translate the indices into labels to indices into our own label table
+            # the extra last entry maps NO_VALUE to NO_VALUE
+            remap = np.array([self.intern_label(l) for l in ([] if labels is None else labels)] + [NO_VALUE],
+                             dtype=np.int32)
+            self._texts[n:n+count] = remap[np.asarray(texts)]
+        self._size = n + count
+
+    def _to_object_iterations(self):
+        """ store the iterations as they are from now on """
+        if self._iterations.dtype != object:
+            self._iterations = np.resize(_object_iterations(self.iterations()),
+                                         len(self._starts))
+
+    def starts(self):
+        """ return the array of start times """
+        return self._starts[:self._size]
+
+    def ends(self):
+        """ return the array of end times """
+        return self._ends[:self._size]
+
+    def iterations(self):
+        """ return the array of iterations, an integer array with NO_VALUE if the firing
+        has no iteration, or an object array with None if the firing has no iteration """
+        return self._iterations[:self._size]
+
+    def texts(self):
+        """ return the array of label indices, NO_VALUE if the firing has no text """
+        return self._texts[:self._size]
+
+    def labels(self):
+        """ return the table of text labels """
+        return self._labels
+
+    def text_values(self):
+        """ return the text labels of the firings as a list, None for firings without
+        text """
+        labels = self._labels
+        return [None if t == NO_VALUE else labels[t] for t in self.texts().tolist()]
+
+    def firing_intervals(self):
+        """ Return a list of (start, end, iteration, text) tuples for all firings, with
+        the iterations as strings, like those of a TraceActor. The list is made on every
+        call; use the columns to go through the firings of large traces. """
+        return list(zip(self.starts().tolist(), self.ends().tolist(),
+                        iteration_values(self.iterations()), self.text_values()))
+
+    def trace_actor(self):
+        """ return a TraceActor with the same firings, with the iterations as strings """
+        actor = TraceActor(self.name, self.scenario)
+        actor.firings = self.firing_intervals()
+        actor.skipped_firings = self.skipped_firings
+        return actor
+
+    def max_firing_time(self):
+        """ return the largest of completion times of all firing intervals
+        or zero if the list is empty """
+        if self._size == 0:
+            return 0.0
+        return float(self.ends().max())
+
+    def min_firing_time(self):
+        """ return the smallest of starting times of all firing intervals
+        or zero if the list is empty"""
+        if self._size == 0:
+            return 0.0
+        return float(self.starts().min())
+
+    def sorted_order(self):
+        """ return the indices of the firings ordered by start time, then end time """
+        return np.lexsort((self.ends(), self.starts()))
+
+    def sort(self):
+        """ sort the firings by start time, then end time """
+        order = self.sorted_order()
+        self._starts = self.starts()[order]
+        self._ends = self.ends()[order]
+        self._iterations = self.iterations()[order]
+        self._texts = self.texts()[order]
+
+
+def actor_key(act, scenario):
+    """ return the name of actor act qualified with its scenario; raises ValueError if
+    the firing of the actor has no scenario """
+    if scenario is None:
+        raise ValueError(f"firing of actor {act} has no scenario")
+    return scenario+SCENARIO_SEPARATOR+act
+
+
+def get_actor(actors, act, scenario, actor_class=TraceActor):
+    """ return actor act in scenario from the dict of actors,
+    creating a new actor of class actor_class if it is a new actor """
+    key = actor_key(act, scenario)
+    if not key in actors:
+        actors[key] = actor_class(key, scenario)
+    return actors[key]
+
+
+def add_actor_firing(actors, act, scenario, start, end, iteration, text,
+                     actor_class=TraceActor):
+    """ add a firing of actor act in scenario to the dict of actors,
+    creating a new actor of class actor_class if it is a new actor """
+    get_actor(actors, act, scenario, actor_class).add_firing(start, end, iteration, text)
+
+
+def add_event(events, name, timestamp):
+    """ add an event time stamp to the list of the named event sequence """
+    if name not in events:
+        events[name] = list()
+    events[name].append(timestamp)
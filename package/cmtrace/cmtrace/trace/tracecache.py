@@ -0,0 +1,354 @@
+""" on-disk cache of parsed traces in a compact, memory-mappable binary format """
+
+import os
+import json
+import struct
+import hashlib
+import tempfile
+import functools
+import numpy as np
+from cmtrace.trace.traceactor import ColumnarTraceActor, iteration_values
+from cmtrace.trace.vectortrace import VectorTrace
+from cmtrace.trace.xmlreader import read_vector_trace_xml
+from cmtrace.trace.tracereader import read_trace, detect_trace_format, XML_FORMAT
+
+# file layout of a cache entry:
+#   MAGIC, header length (little endian uint64), JSON header, padding to a multiple of
+#   ALIGNMENT, followed by the raw little endian arrays, each starting at a multiple of
+#   ALIGNMENT. The JSON header records the key and the offsets of the arrays.
+MAGIC = b'CMTRACE\x00'
+FORMAT_VERSION = 4
+ALIGNMENT = 8
+ENTRY_EXTENSION = '.cmtc'
+
+# default location and size of the cache, can be overruled by environment variables
+DEFAULT_CACHE_SIZE = 1 << 30
+CACHE_DIR_VARIABLE = 'CMTRACE_CACHE_DIR'
+CACHE_SIZE_VARIABLE = 'CMTRACE_CACHE_SIZE'
+
+# kinds of traces that are cached
+GANTT_TRACE = 'gantt'
+VECTOR_TRACE = 'vector'
+
+# block size for hashing the trace file
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def default_cache_dir():
+    """ return the default cache directory """
+    if CACHE_DIR_VARIABLE in os.environ:
+        return os.environ[CACHE_DIR_VARIABLE]
+    base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'cmtrace')
+
+
+def content_hash(filename):
+    """ return the SHA-1 hash of the contents of a file. The hash is remembered for
+    the size and modification time of the file, so that the trace cache and the
+    render cache hash a trace only once. """
+    stat = os.stat(filename)
+    return _content_hash(os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=64)
+def _content_hash(path, size, mtime_ns):  # pylint: disable=unused-argument
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _ArrayWriter:
+    """ collects arrays for the data section of a cache entry """
+
+    def __init__(self):
+        self.arrays = []
+        self.size = 0
+
+    def add(self, array, dtype):
+        """ add an array, return its offset in the data section """
+        data = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+        offset = self.size
+        self.arrays.append(data)
+        self.size += _aligned(data.nbytes)
+        return offset
+
+    def write(self, f):
+        """ write the data section """
+        for data in self.arrays:
+            f.write(data.tobytes())
+            f.write(b'\x00' * (_aligned(data.nbytes) - data.nbytes))
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class TraceCache:
+    """ Cache of parsed traces. Entries are keyed on the path of the trace file, the
+    kind of trace and scale and the filter that was applied while it was read, and
+    they are valid as long as the size and
+    modification time, or else the content hash, of the trace file match.
+    The total size of the cache is bounded; the least recently used entries are
+    evicted first. """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory if directory is not None else default_cache_dir()
+        if max_size is None:
+            max_size = int(os.environ.get(CACHE_SIZE_VARIABLE, DEFAULT_CACHE_SIZE))
+        self.max_size = max_size
+
+    def entry_path(self, filename, kind, scale, trace_format=XML_FORMAT, trace_filter=None):
+        """ return the path of the cache entry for the trace file, read with the
+        optional TraceFilter """
+        key = f"{os.path.abspath(filename)}|{kind}|{float(scale)!r}"
+        if trace_format != XML_FORMAT:
+            key += f"|{trace_format}"
+        if trace_filter is not None and not trace_filter.is_trivial():
+            key += f"|{trace_filter.key()}"
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + ENTRY_EXTENSION)
+
+    def read_trace(self, filename, scale=1.0, workers=None, trace_filter=None,
+                   trace_format=None, columnar=False):
+        """ return the actors, inputs and outputs of the trace, from the cache if
+        possible, otherwise parsed with read_trace and stored in the cache. The format
+        is determined from the extension of the file if it is None.
+        The optional TraceFilter is applied while the trace is parsed, and the
+        filtered trace is cached under its own entry. If only the complete trace is
+        cached, the filter is applied to it instead.
+        The cache stores the firings in columns; if columnar is False, the actors are
+        returned as TraceActor objects, like read_trace returns them. """
+        if trace_format is None:
+            trace_format = detect_trace_format(filename)
+        if trace_filter is not None and trace_filter.is_trivial():
+            trace_filter = None
+        result = self.load(filename, GANTT_TRACE, scale, trace_format, trace_filter)
+        if result is None and trace_filter is not None:
+            result = self.load(filename, GANTT_TRACE, scale, trace_format)
+            if result is not None:
+                result = trace_filter.apply(*result)
+        if result is None:
+            result = read_trace(filename, scale, columnar=True, workers=workers,
+                                trace_filter=trace_filter, trace_format=trace_format)
+            self.store(filename, GANTT_TRACE, scale, result, trace_format, trace_filter)
+        if not columnar:
+            actors, inputs, outputs = result
+            result = {name: actor.trace_actor() for name, actor in actors.items()}, \
+                inputs, outputs
+        return result
+
+    def read_vector_trace(self, filename, scale=1.0):
+        """ return the vector sequences of the trace, from the cache if
+        possible, otherwise parsed with read_vector_trace_xml and stored in the cache """
+        result = self.load(filename, VECTOR_TRACE, scale)
+        if result is None:
+            result = read_vector_trace_xml(filename, scale)
+            self.store(filename, VECTOR_TRACE, scale, result)
+        return result
+
+    def load(self, filename, kind, scale, trace_format=XML_FORMAT, trace_filter=None):
+        """ return the cached result for the trace file, read with the optional
+        TraceFilter, or None if there is no valid entry """
+        path = self.entry_path(filename, kind, scale, trace_format, trace_filter)
+        try:
+            stat = os.stat(filename)
+            # the arrays of the result are views of the mapped entry, which stays
+            # mapped as long as they are used
+            data = np.memmap(path, dtype=np.uint8, mode='r')
+        except (OSError, ValueError):
+            return None
+        try:
+            header, data_offset = _read_header(data)
+            source = header['source']
+            if source['size'] != stat.st_size:
+                self._remove(path)
+                return None
+            revalidated = False
+            if source['mtime_ns'] != stat.st_mtime_ns:
+                # the file was touched or copied, check if the contents are still the same
+                if source['sha1'] != content_hash(filename):
+                    self._remove(path)
+                    return None
+                revalidated = True
+            result = _decode(header, data, data_offset)
+        except (ValueError, KeyError, TypeError, struct.error):
+            # a malformed entry, e.g. truncated or written by another version, is a miss
+            self._remove(path)
+            return None
+        if revalidated:
+            # record the new modification time in the entry
+            self.store(filename, kind, scale, result, trace_format, trace_filter)
+        else:
+            # mark the entry as recently used
+            os.utime(path)
+        return result
+
+    def store(self, filename, kind, scale, result, trace_format=XML_FORMAT,
+              trace_filter=None):
+        """ store the parsed result of the trace file, read with the optional
+        TraceFilter, in the cache """
+        stat = os.stat(filename)
+        header = {
+            'version': FORMAT_VERSION,
+            'kind': kind,
+            'scale': scale,
+            'source': {
+                'path': os.path.abspath(filename),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha1': content_hash(filename)
+            }
+        }
+        writer = _ArrayWriter()
+        if kind == GANTT_TRACE:
+            _encode_gantt(header, writer, *result)
+        else:
+            _encode_vector(header, writer, result)
+        header_bytes = json.dumps(header).encode('utf-8')
+        header_size = _aligned(len(MAGIC) + 8 + len(header_bytes))
+        if header_size + writer.size > self.max_size:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entry_path(filename, kind, scale, trace_format, trace_filter)
+        # write to a temporary file first, so that readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<Q', len(header_bytes)))
+                f.write(header_bytes)
+                f.write(b'\x00' * (header_size - len(MAGIC) - 8 - len(header_bytes)))
+                writer.write(f)
+            os.replace(temp_path, path)
+        except OSError:
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def entries(self):
+        """ return a list of (path, size, last use time) of the cache entries """
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_EXTENSION):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((path, stat.st_size, stat.st_mtime))
+        return result
+
+    def evict(self):
+        """ remove the least recently used entries until the cache fits in its
+        maximum size """
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(e[1] for e in entries)
+        for path, size, _ in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """ remove all entries from the cache """
+        for path, _, _ in self.entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _read_header(data):
+    """ return the header and the offset of the data section of a cache entry """
+    if data[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError("Not a trace cache entry.")
+    (length,) = struct.unpack_from('<Q', data, len(MAGIC))
+    start = len(MAGIC) + 8
+    header = json.loads(data[start:start+length].tobytes().decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError("Unsupported trace cache version.")
+    return header, _aligned(start + length)
+
+
+def _array(data, data_offset, offset, dtype, count):
+    """ return a read-only view of an array in the mapped data, without copying it """
+    return np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder('<'), count=count,
+                         offset=data_offset+offset)
+
+
+def _encode_events(writer, events):
+    return {name: [writer.add(stamps, np.float64), len(stamps)]
+            for name, stamps in events.items()}
+
+
+def _decode_events(data, data_offset, events):
+    return {name: _array(data, data_offset, offset, np.float64, count).tolist()
+            for name, (offset, count) in events.items()}
+
+
+def _encode_gantt(header, writer, actors, inputs, outputs):
+    header['actors'] = []
+    for actor in actors.values():
+        entry = {
+            'name': actor.name,
+            'scenario': actor.scenario,
+            'count': len(actor),
+            'skipped': actor.skipped_firings,
+            'labels': actor.labels(),
+            'starts': writer.add(actor.starts(), np.float64),
+            'ends': writer.add(actor.ends(), np.float64),
+            'texts': writer.add(actor.texts(), np.int32)
+        }
+        iterations = actor.iterations()
+        if iterations.dtype == object:
+            # iterations that are not integers are kept as they are in the header
+            entry['iteration_values'] = iteration_values(iterations)
+        else:
+            entry['iterations'] = writer.add(iterations, np.int64)
+        header['actors'].append(entry)
+    header['inputs'] = _encode_events(writer, inputs)
+    header['outputs'] = _encode_events(writer, outputs)
+
+
+def _encode_vector(header, writer, trace):
+    header['tokens'] = trace.tokens
+    header['vectors'] = trace.num_vectors()
+    header['timestamps'] = writer.add(trace.timestamps, np.float64)
+    header['present'] = writer.add(trace.present, np.bool_)
+
+
+def _decode(header, data, data_offset):
+    if header['kind'] == VECTOR_TRACE:
+        shape = (header['vectors'], len(header['tokens']))
+        count = shape[0]*shape[1]
+        return VectorTrace(
+            header['tokens'],
+            _array(data, data_offset, header['timestamps'], np.float64, count).reshape(shape),
+            _array(data, data_offset, header['present'], np.bool_, count).reshape(shape))
+
+    actors = {}
+    for entry in header['actors']:
+        count = entry['count']
+        if 'iteration_values' in entry:
+            iterations = np.array(entry['iteration_values'], dtype=object)
+        else:
+            iterations = _array(data, data_offset, entry['iterations'], np.int64, count)
+        actors[entry['name']] = ColumnarTraceActor.from_columns(
+            entry['name'], entry['scenario'],
+            _array(data, data_offset, entry['starts'], np.float64, count),
+            _array(data, data_offset, entry['ends'], np.float64, count),
+            iterations,
+            _array(data, data_offset, entry['texts'], np.int32, count),
+            entry['labels'])
+        actors[entry['name']].skipped_firings = entry['skipped']
+    inputs = _decode_events(data, data_offset, header['inputs'])
+    outputs = _decode_events(data, data_offset, header['outputs'])
+    return actors, inputs, outputs
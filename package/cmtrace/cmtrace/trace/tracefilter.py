@@ -0,0 +1,122 @@
+""" selection of the firings and events that are read from a trace """
+
+import json
+import numpy as np
+from cmtrace.trace.traceactor import ColumnarTraceActor, TraceActor
+
+
+class TraceFilter:
+    """ A TraceFilter selects the actors, by their name qualified with the scenario,
+    and a time window [t_start, t_end] of the firings and events that are kept when a
+    trace is read. None means no restriction. Actors that are selected are kept
+    even if none of their firings fall in the time window, and actors that are not
+    selected are kept without firings, so that the actors, and the colors assigned to
+    them, are the same as without the filter. The firings that end before the time
+    window are counted in the skipped_firings of their actor, so that colors alternate
+    as if they had been read. """
+
+    def __init__(self, actors=None, t_start=None, t_end=None):
+        self.actors = None if actors is None else frozenset(actors)
+        self.t_start = t_start
+        self.t_end = t_end
+
+    @classmethod
+    def from_settings(cls, settings):
+        """ create a filter for the actors that are drawn in the rows defined in the
+        structure settings and the time window from the layout settings """
+        actors = None
+        rows = settings.rows()
+        if len(rows) > 0:
+            structure = settings.structure()
+            actors = set()
+            for row in rows:
+                if row in structure:
+                    actors.update(structure[row])
+                else:
+                    actors.add(row)
+        t_start, t_end = settings.time_window()
+        return cls(actors, t_start, t_end)
+
+    def is_trivial(self):
+        """ check if the filter keeps everything """
+        return self.actors is None and self.t_start is None and self.t_end is None
+
+    def key(self):
+        """ return a string that identifies the filter, e.g. for a cache key """
+        actors = None if self.actors is None else sorted(self.actors)
+        return json.dumps([actors, self.t_start, self.t_end])
+
+    def has_window(self):
+        """ check if the filter restricts the time """
+        return self.t_start is not None or self.t_end is not None
+
+    def accepts_actor(self, name):
+        """ check if the actor, name qualified with its scenario, is kept """
+        return self.actors is None or name in self.actors
+
+    def accepts_firing(self, start, end, actor=None):
+        """ check if a firing overlaps with the time window, counting it in the skipped
+        firings of the actor, if given, if it ends before the window """
+        if self.t_start is not None and end < self.t_start:
+            if actor is not None:
+                actor.skipped_firings += 1
+            return False
+        return self.t_end is None or start <= self.t_end
+
+    def accepts_event(self, timestamp):
+        """ check if an event falls in the time window """
+        return (self.t_start is None or timestamp >= self.t_start) and \
+            (self.t_end is None or timestamp <= self.t_end)
+
+    def firing_mask(self, starts, ends):
+        """ return a boolean array indicating which of the firings overlap with the
+        time window """
+        mask = np.ones(len(starts), dtype=bool)
+        if self.t_start is not None:
+            mask &= ends >= self.t_start
+        if self.t_end is not None:
+            mask &= starts <= self.t_end
+        return mask
+
+    def skipped_count(self, ends):
+        """ return the number of firings with the array of end times that end before
+        the time window """
+        if self.t_start is None:
+            return 0
+        return int(np.count_nonzero(ends < self.t_start))
+
+    def apply(self, actors, inputs, outputs):
+        """ apply the filter to a trace that has already been read """
+        if self.is_trivial():
+            return actors, inputs, outputs
+        result = {}
+        for name, actor in actors.items():
+            if not self.accepts_actor(name):
+                result[name] = type(actor)(name, actor.scenario)
+                continue
+            if not self.has_window():
+                result[name] = actor
+                continue
+            if isinstance(actor, ColumnarTraceActor):
+                mask = self.firing_mask(actor.starts(), actor.ends())
+                result[name] = ColumnarTraceActor.from_columns(
+                    name, actor.scenario, actor.starts()[mask], actor.ends()[mask],
+                    actor.iterations()[mask], actor.texts()[mask], actor.labels())
+                result[name].skipped_firings = self.skipped_count(actor.ends())
+            else:
+                result[name] = TraceActor(name, actor.scenario)
+                for firing in actor.firing_intervals():
+                    if self.accepts_firing(firing[0], firing[1], result[name]):
+                        result[name].add_firing(*firing)
+            result[name].skipped_firings += actor.skipped_firings
+        return result, self._apply_events(inputs), self._apply_events(outputs)
+
+    def _apply_events(self, events):
+        if not self.has_window():
+            return events
+        result = {}
+        for name, stamps in events.items():
+            stamps = [t for t in stamps if self.accepts_event(t)]
+            if len(stamps) > 0:
+                result[name] = stamps
+        return result
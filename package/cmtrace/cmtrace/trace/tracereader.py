@@ -0,0 +1,41 @@
+""" reading Gantt traces in any of the supported formats """
+
+import os
+from cmtrace.trace.xmlreader import read_trace_xml
+from cmtrace.trace.linereaders import read_trace_jsonl, read_trace_csv
+from cmtrace.trace.compression import strip_compression_extension
+
+# the supported trace formats
+XML_FORMAT = 'xml'
+JSONL_FORMAT = 'jsonl'
+CSV_FORMAT = 'csv'
+TRACE_FORMATS = [XML_FORMAT, JSONL_FORMAT, CSV_FORMAT]
+
+# file extensions of the formats, other extensions are read as xml
+FORMAT_EXTENSIONS = {
+    '.jsonl': JSONL_FORMAT,
+    '.ndjson': JSONL_FORMAT,
+    '.csv': CSV_FORMAT
+}
+
+
+def detect_trace_format(filename):
+    """ return the format of the trace file based on its extension, ignoring a
+    compression extension """
+    _, ext = os.path.splitext(strip_compression_extension(filename))
+    return FORMAT_EXTENSIONS.get(ext.lower(), XML_FORMAT)
+
+
+def read_trace(filename, scale=1.0, columnar=False, workers=None, trace_filter=None,
+               trace_format=None):
+    """ read the trace file in the given format, or the format determined by its
+    extension if it is None, and return the actors, inputs and outputs like
+    read_trace_xml """
+    if trace_format is None:
+        trace_format = detect_trace_format(filename)
+    if trace_format == JSONL_FORMAT:
+        return read_trace_jsonl(filename, scale, columnar, trace_filter)
+    if trace_format == CSV_FORMAT:
+        return read_trace_csv(filename, scale, columnar, trace_filter)
+    return read_trace_xml(filename, scale, columnar=columnar, workers=workers,
+                          trace_filter=trace_filter)
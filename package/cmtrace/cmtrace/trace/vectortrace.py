@@ -0,0 +1,102 @@
+""" columnar representation of vector traces """
+
+from array import array
+import numpy as np
+from cmtrace.dataflow.maxplus import MP_MINUS_INF
+
+
+class VectorTrace:
+    """A VectorTrace holds the time stamps of the tokens of a vector trace in a NumPy
+    array with the vectors as rows and the tokens as columns, and a mask indicating
+    which tokens are present in which vectors. Absent tokens have the time stamp
+    MP_MINUS_INF, so every column is an event sequence of the same length.
+    It can be used as a dict from token names to event sequences."""
+
+    def __init__(self, tokens, timestamps, present):
+        self.tokens = list(tokens)
+        self.timestamps = timestamps
+        self.present = present
+        self._index = {name: k for k, name in enumerate(self.tokens)}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """ return the event sequence of the token as a view on its column """
+        return self.timestamps[:, self._index[name]]
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def keys(self):
+        """ return the token names """
+        return list(self.tokens)
+
+    def items(self):
+        """ return a list of pairs of token names and their event sequences """
+        return [(name, self.timestamps[:, k]) for k, name in enumerate(self.tokens)]
+
+    def values(self):
+        """ return the event sequences """
+        return [self.timestamps[:, k] for k in range(len(self.tokens))]
+
+    def num_vectors(self):
+        """ return the number of vectors """
+        return self.timestamps.shape[0]
+
+    def sorted_by_first_vector(self):
+        """ return a VectorTrace with the tokens ordered by their time stamp in the first
+        vector; tokens with equal time stamps keep their order """
+        if self.num_vectors() == 0:
+            return self
+        order = np.argsort(self.timestamps[0], kind='stable')
+        return VectorTrace([self.tokens[k] for k in order], self.timestamps[:, order],
+                           self.present[:, order])
+
+    def max_timestamp(self):
+        """ return the largest time stamp of the last vector, or zero if there are none """
+        if self.timestamps.size == 0:
+            return 0.0
+        return float(self.timestamps[-1].max())
+
+
+class VectorTraceBuilder:
+    """ collects the tokens of a vector trace one vector at a time, storing only
+    the tokens that are present """
+
+    def __init__(self):
+        self.tokens = []
+        self._index = {}
+        self._rows = array('q')
+        self._cols = array('q')
+        self._values = array('d')
+        self._num_vectors = 0
+
+    def add_token(self, name, timestamp):
+        """ add a token to the current vector """
+        col = self._index.get(name)
+        if col is None:
+            col = len(self.tokens)
+            self.tokens.append(name)
+            self._index[name] = col
+        self._rows.append(self._num_vectors)
+        self._cols.append(col)
+        self._values.append(timestamp)
+
+    def end_vector(self):
+        """ complete the current vector """
+        self._num_vectors += 1
+
+    def build(self):
+        """ return the VectorTrace """
+        shape = (self._num_vectors, len(self.tokens))
+        timestamps = np.full(shape, float(MP_MINUS_INF), dtype=np.float64)
+        present = np.zeros(shape, dtype=bool)
+        rows = np.frombuffer(self._rows, dtype=np.int64)
+        cols = np.frombuffer(self._cols, dtype=np.int64)
+        timestamps[rows, cols] = np.frombuffer(self._values, dtype=np.float64)
+        present[rows, cols] = True
+        return VectorTrace(self.tokens, timestamps, present)
@@ -0,0 +1,234 @@
+""" readers for sdf3 xml Gantt and vector traces """
+
+import os
+import xml.etree.ElementTree as ET
+from cmtrace.trace.traceactor import TraceActor, ColumnarTraceActor, get_actor, add_event
+from cmtrace.trace.fastscan import read_trace_fast
+from cmtrace.trace.sharding import read_trace_sharded
+from cmtrace.trace.vectortrace import VectorTraceBuilder
+from cmtrace.trace.compression import is_compressed, open_trace, DECOMPRESSION_ERRORS
+from cmtrace.utils.utils import error
+
+# the element paths, relative to the root, of the trace elements that are read
+FIRING_PATH = ('firings', 'firing')
+INPUT_PATH = ('inputs', 'input')
+OUTPUT_PATH = ('outputs', 'output')
+VECTOR_PATH = ('vectors', 'vector')
+TOKEN_PATH = ('vectors', 'vector', 'token')
+
+
+def _add_firing_element(actors, attrib, scale, actor_class, trace_filter):
+    """ add the firing described by the attributes of a firing element, if it
+    passes the filter """
+    act = attrib['actor']
+    scenario = attrib.get('scenario')
+    actor = get_actor(actors, act, scenario, actor_class)
+    if trace_filter is not None and not trace_filter.accepts_actor(actor.name):
+        return
+    start = scale*float(attrib['start'])
+    end = scale*float(attrib['end'])
+    if trace_filter is not None and not trace_filter.accepts_firing(start, end, actor):
+        return
+    iteration = attrib.get('iteration')
+    text = attrib.get('text')
+    actor.add_firing(start, end, iteration, text)
+
+
+def _add_event_element(events, attrib, scale, default_name, trace_filter):
+    """ add the time stamp of an input or output element, if it passes the filter """
+    timestamp = scale*float(attrib['timestamp'])
+    if trace_filter is not None and not trace_filter.accepts_event(timestamp):
+        return
+    # is the event named?
+    name = attrib.get('name', default_name)
+    add_event(events, name, timestamp)
+
+
+def read_trace_xml(filename, scale=1.0, columnar=False, fast=True, workers=None,
+                   trace_filter=None):
+    """
+    read the xml trace file and apply an optional scaling to the time stamps
+    return actor firings, input arrivals and output arrivals.
+    arrivals are in the form of a dictionary with names as keys and list of time stamps as value
+    actor is a dict from actor name to TraceActor objects
+    If fast is True, the file is first scanned with the fast reader for the plain trace
+    schema. Otherwise, or if the document deviates from that schema, it is parsed
+    incrementally; elements are discarded as soon as they have been processed, so the
+    XML tree is never held in memory as a whole.
+    If columnar is True, the actors are ColumnarTraceActor objects.
+    If workers is larger than one, the fast reader scans large firings sections in
+    parallel shards with that number of processes.
+    Files compressed with gzip, xz or bz2 are decompressed while they are parsed.
+    If a TraceFilter is given, only the firings and events that pass the filter are kept.
+    """
+
+    # check if trace file exists
+    if not os.path.isfile(filename):
+        error(f"Trace file ({filename}) does not exist.")
+
+    actor_class = ColumnarTraceActor if columnar else TraceActor
+    # the fast readers need to map the uncompressed file
+    if fast and not is_compressed(filename):
+        if workers is not None and workers > 1:
+            result = read_trace_sharded(filename, scale, actor_class, workers, trace_filter)
+        else:
+            result = read_trace_fast(filename, scale, actor_class, trace_filter)
+        if result is not None:
+            return result
+
+    # dictionary to collect the actor traces
+    # keys will be actor scenarios plus actor names
+    actors = {}
+    inputs = {}
+    outputs = {}
+
+    try:
+        with open_trace(filename) as f:
+            _parse_trace_events(f, scale, actor_class, trace_filter, actors, inputs, outputs)
+    except ET.ParseError as e:
+        error(f"Failed to parse xml file ({filename}).\nReason: {e}")
+    except DECOMPRESSION_ERRORS as e:
+        error(f"Failed to read trace file ({filename}).\nReason: {e}")
+    except (ValueError, KeyError) as e:
+        error(f"Failed to parse trace file ({filename}).\nReason: {e}")
+
+    return actors, inputs, outputs
+
+
+def _parse_trace_events(f, scale, actor_class, trace_filter, actors, inputs, outputs):
+    """ parse the trace document from file object f incrementally, and collect the
+    firings and events """
+    _collect_trace_events(ET.iterparse(f, events=('start', 'end')), [], [], scale,
+                          actor_class, trace_filter, actors, inputs, outputs)
+
+
+def _collect_trace_events(events, path, elements, scale, actor_class, trace_filter, actors,
+                          inputs, outputs):
+    """ collect the firings and events from the (event, element) pairs of an
+    incremental parser. path is the path of tags from the root to the current element
+    and elements the open elements; both are updated, so that collecting can be resumed
+    with the next events. Returns True if the root element has been closed. """
+    for event, elem in events:
+        if event == 'start':
+            elements.append(elem)
+            # the root element itself is not part of the path
+            if len(elements) > 1:
+                path.append(elem.tag)
+            continue
+
+        elements.pop()
+        if len(elements) == 0:
+            return True
+        tpath = tuple(path)
+        if tpath == FIRING_PATH:
+            _add_firing_element(actors, elem.attrib, scale, actor_class, trace_filter)
+        elif tpath == INPUT_PATH:
+            _add_event_element(inputs, elem.attrib, scale, 'Inputs', trace_filter)
+        elif tpath == OUTPUT_PATH:
+            _add_event_element(outputs, elem.attrib, scale, 'Outputs', trace_filter)
+        # drop processed records and sections from their parent, so that memory
+        # does not grow with the size of the document
+        if 0 < len(path) <= len(FIRING_PATH):
+            elements[-1].clear()
+        path.pop()
+    return False
+
+
+class TraceTail:
+    """ Follows a trace file that is still being written. Every call to poll parses the
+    bytes that have been appended to the file since the previous call and returns the
+    firings and events in the records that are complete by now. All firings and events
+    read so far are collected in actors, inputs and outputs like read_trace_xml does. """
+
+    def __init__(self, filename, scale=1.0, trace_filter=None):
+        self.filename = filename
+        self.scale = scale
+        self.trace_filter = trace_filter
+        self.actors = {}
+        self.inputs = {}
+        self.outputs = {}
+        # set when the root element of the trace has been closed
+        self.complete = False
+        self._offset = 0
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._path = []
+        self._elements = []
+
+    def poll(self):
+        """ parse the appended bytes, return a tuple of dicts with the new firings per
+        actor name, and the new time stamps per input and per output """
+        try:
+            with open(self.filename, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            # the file has not been created yet
+            return {}, {}, {}
+        except OSError as e:
+            error(f"Failed to read trace file ({self.filename}).\nReason: {e}")
+        if len(data) == 0 or self.complete:
+            return {}, {}, {}
+        self._offset += len(data)
+
+        counts = {name: len(actor.firing_intervals()) for name, actor in self.actors.items()}
+        input_counts = {name: len(stamps) for name, stamps in self.inputs.items()}
+        output_counts = {name: len(stamps) for name, stamps in self.outputs.items()}
+        try:
+            self._parser.feed(data)
+            self.complete = _collect_trace_events(
+                self._parser.read_events(), self._path, self._elements, self.scale,
+                TraceActor, self.trace_filter, self.actors, self.inputs, self.outputs)
+        except ET.ParseError as e:
+            error(f"Failed to parse xml file ({self.filename}).\nReason: {e}")
+        except (ValueError, KeyError) as e:
+            error(f"Failed to parse trace file ({self.filename}).\nReason: {e}")
+
+        firings = {name: actor.firing_intervals()[counts.get(name, 0):]
+                   for name, actor in self.actors.items()
+                   if len(actor.firing_intervals()) > counts.get(name, 0)}
+        return firings, _appended(self.inputs, input_counts), \
+            _appended(self.outputs, output_counts)
+
+
+def _appended(events, counts):
+    """ return the time stamps that were added to the events after the counts were
+    taken """
+    return {name: stamps[counts.get(name, 0):] for name, stamps in events.items()
+            if len(stamps) > counts.get(name, 0)}
+
+# TODO: extend event traces with an iteration number to enable weakly consistent graph
+# missing tokens in some iterations
+def read_vector_trace_xml(filename, scale=1.0):
+    """ read the xml vector trace file and apply an optional scaling to the time
+    stamps. return a VectorTrace, in which the sequences all have the same length;
+    tokens missing from a vector have time stamp minus infinity. The document is
+    parsed incrementally. Files compressed with gzip, xz or bz2 are decompressed
+    while they are parsed. """
+
+    builder = VectorTraceBuilder()
+    # path of tags from the root to the current element, and the open elements
+    path = []
+    elements = []
+    with open_trace(filename) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                elements.append(elem)
+                if len(elements) > 1:
+                    path.append(elem.tag)
+                continue
+
+            elements.pop()
+            tpath = tuple(path)
+            if tpath == TOKEN_PATH:
+                builder.add_token(elem.attrib['name'], scale*float(elem.attrib['timestamp']))
+            elif tpath == VECTOR_PATH:
+                _ = int(elem.attrib['id'])
+                builder.end_vector()
+            # drop processed vectors from their parent; the tokens of a vector are
+            # dropped with it, the vector attributes are still needed when it ends
+            if 0 < len(path) <= len(VECTOR_PATH):
+                elements[-1].clear()
+            if len(path) > 0:
+                path.pop()
+
+    return builder.build()
@@ -0,0 +1,44 @@
+
+'''Script to create the figures of many traces and settings in one process pool '''
+
+import argparse
+import time
+from cmtrace.libbatch import CHART_TYPES, GANTT, BatchException, matrix_jobs, print_summary, \
+    read_manifest, run_batch
+from cmtrace.graphics.rendercache import RenderCache
+from cmtrace.trace.tracecache import TraceCache
+from cmtrace.trace.tracereader import TRACE_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the figures of many trace files, with several settings, in a pool of processes.')
+    parser.add_argument('manifest', nargs='?', help="YAML file with a list of jobs and/or a matrix of traces and settings")
+    parser.add_argument('--traces', dest='traces', nargs='+', default=[], help="glob patterns of the trace files to draw with all settings")
+    parser.add_argument('-s', '--settings', dest='settings', nargs='+', default=[], help="YAML files with settings to draw all traces with; the default settings if omitted")
+    parser.add_argument('-o', '--output', dest='output', default='{trace}_{settings}.svg', help="template of the output files, in which {trace}, {settings} and {type} are replaced by the names of the trace and settings files and the type of chart")
+    parser.add_argument('-t', '--type', dest='type', choices=CHART_TYPES, default=GANTT, help="type is either Gantt (default) or vector")
+    parser.add_argument('--format', dest='format', choices=TRACE_FORMATS, help="format of the Gantt trace files, by default determined by their extensions")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, help="number of processes that read traces and draw figures")
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', help="do not use or update the cache of parsed traces, which is on by default and kept in ~/.cache/cmtrace or $CMTRACE_CACHE_DIR")
+    parser.add_argument('--no-render-cache', dest='no_render_cache', action='store_true', help="do not use or update the cache of drawn figures, which is on by default and kept in the renders folder of the trace cache")
+
+    args = parser.parse_args()
+
+    if args.manifest is None and len(args.traces) == 0:
+        parser.error("a manifest or --traces is required")
+
+    try:
+        jobs = [] if args.manifest is None else read_manifest(args.manifest)
+        if len(args.traces) > 0:
+            jobs += matrix_jobs(args.traces, args.settings, args.output, args.type, args.format)
+    except BatchException as e:
+        parser.error(str(e))
+
+    cache = None if args.no_cache else TraceCache()
+    render_cache = None if args.no_render_cache else RenderCache()
+
+    start = time.perf_counter()
+    results = run_batch(jobs, workers=args.jobs, cache=cache, render_cache=render_cache)
+    print_summary(results, time.perf_counter() - start)
+    if not all(result.succeeded() for result in results):
+        exit(1)
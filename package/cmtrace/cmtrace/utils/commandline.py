@@ -2,21 +2,60 @@
 '''Script to create an SVG figures from a trace '''
 
 import argparse
+import copy
+import os
 from cmtrace.graphics.tracesettings import TraceSettings
-from cmtrace.libtracetosvg import create_gantt_fig, create_vector_fig
+from cmtrace.libtracetosvg import create_gantt_figs, create_gantt_pyramid, create_gantt_tiles, \
+    create_vector_figs, follow_gantt_fig
+from cmtrace.libbatch import CHART_TYPES, GANTT, VECTOR
+from cmtrace.graphics.rendercache import RenderCache
+from cmtrace.graphics.pyramid import MAX_PYRAMID_LEVELS
+from cmtrace.graphics.svggraphics import merges_row_fragments
+from cmtrace.trace.tracecache import TraceCache
+from cmtrace.trace.tracereader import TRACE_FORMATS, XML_FORMAT, detect_trace_format
 
 from cmtrace.graphics.tracesettings import TraceSettingsException
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Create an svg or pdf figure from a trace file.')
-    parser.add_argument('tracefile', help="the xml trace file")
-    parser.add_argument('outputfile', help="the outputfile to write the pdf or svg file to")
+    parser = argparse.ArgumentParser(description='Create an svg, png, pdf, ps or eps figure from a trace file.')
+    parser.add_argument('tracefile', help="the xml, JSON-lines or CSV trace file, optionally compressed with gzip, xz or bz2")
+    parser.add_argument('outputfile', nargs='?', help="the outputfile to write the svg, png, pdf, ps or eps file to; the format is determined by the extension")
+    parser.add_argument('-o', '--output', dest='outputs', action='append', default=[], help="a further outputfile; the trace is read once for all outputfiles")
     parser.add_argument('-s', '--settings', dest='settings', help="YAML file with settings for the layout of the figure")
-    parser.add_argument('-t', '--type', dest='type', choices=['Gantt', 'vector'], default='Gantt', help="type is either Gantt (default) or vector")
+    parser.add_argument('-t', '--type', dest='type', default=GANTT, help="type is either Gantt (default) or vector, or a comma separated list with the type of every outputfile")
+    parser.add_argument('--vector-trace', dest='vector_trace', help="the vector trace file of the vector outputfiles, if they are made together with Gantt charts of the tracefile")
+    parser.add_argument('--format', dest='format', choices=TRACE_FORMATS, help="format of the Gantt trace file, by default determined by its extension: .jsonl or .ndjson for JSON-lines, .csv for CSV and xml otherwise")
+    parser.add_argument('--columnar', dest='columnar', action='store_true', help="store the firings in NumPy columns, which uses less memory for large traces")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, help="number of processes used to parse large traces and to draw the rows of Gantt charts in svg files written by the stream svg-writer without css-styles")
+    parser.add_argument('--time-window', dest='time_window', type=float, nargs=2, metavar=('START', 'END'), help="only read and draw the firings and events between START and END")
+    parser.add_argument('-f', '--follow', dest='follow', action='store_true', help="follow a Gantt trace that is still being written and update the figure as firings are appended")
+    parser.add_argument('--interval', dest='interval', type=float, default=1.0, help="number of seconds between checks for new firings in follow mode")
+    parser.add_argument('--idle-timeout', dest='idle_timeout', type=float, help="stop following after this number of seconds without new firings")
+    parser.add_argument('--tile-length', dest='tile_length', type=float, help="draw the Gantt chart in tiles of this number of units of the time axis, saved in files numbered after the outputfile")
+    parser.add_argument('--bundle', dest='bundle', help="also save the tiles as the pages of this pdf file")
+    parser.add_argument('--pyramid', dest='pyramid', type=int, metavar='LEVELS', help="draw the Gantt chart as LEVELS levels of tiles, each with twice the resolution of the previous one, in the folder outputfile, with a viewer, index.html, that loads the visible tiles")
+    parser.add_argument('--dpi', dest='dpi', type=float, help="resolution of png images in pixels per inch (default 96)")
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', help="do not use or update the cache of parsed traces, which is on by default and kept in ~/.cache/cmtrace or $CMTRACE_CACHE_DIR")
+    parser.add_argument('--no-render-cache', dest='no_render_cache', action='store_true', help="do not use or update the cache of drawn figures, which is on by default and kept in the renders folder of the trace cache")
 
     args = parser.parse_args()
 
+    outputfiles = ([] if args.outputfile is None else [args.outputfile]) + args.outputs
+    if len(outputfiles) == 0:
+        parser.error("an outputfile is required")
+    types = args.type.split(',')
+    for chart_type in types:
+        if chart_type not in CHART_TYPES:
+            parser.error(f"invalid type {chart_type}, choose from {', '.join(CHART_TYPES)}")
+    if len(types) == 1:
+        types = types * len(outputfiles)
+    if len(types) != len(outputfiles):
+        parser.error("--type should give one type, or the type of every outputfile")
+    if len(outputfiles) > 1 and (args.follow or args.tile_length is not None or
+                                 args.pyramid is not None):
+        parser.error("--follow, --tile-length and --pyramid make a single outputfile")
+
     settings = TraceSettings()
     if 'settings' in args:
         if not args.settings is None:
@@ -27,7 +66,55 @@ def main():
                 print("There was an error reading the settings file.")
 
 
-    if args.type == 'Gantt':
-        create_gantt_fig(args.tracefile, args.outputfile, settings=settings)
+    if args.time_window is not None:
+        settings.set_time_window(*args.time_window)
+    if args.dpi is not None:
+        settings.set_dpi(args.dpi)
+    # the rows are drawn in parallel if every Gantt chart can merge them
+    if args.jobs > 1 and all(merges_row_fragments(settings, f)
+                             for f, t in zip(outputfiles, types) if t == GANTT):
+        settings.set_row_workers(args.jobs)
+
+    cache = None if args.no_cache else TraceCache()
+    render_cache = None if args.no_render_cache else RenderCache()
+
+    if args.bundle is not None and args.tile_length is None:
+        parser.error("--bundle requires --tile-length")
+
+    if args.follow:
+        if types[0] != GANTT:
+            parser.error("--follow is only supported for Gantt charts")
+        if (args.format or detect_trace_format(args.tracefile)) != XML_FORMAT:
+            parser.error("--follow is only supported for xml traces")
+        if os.path.splitext(outputfiles[0])[1].lower() != '.svg':
+            parser.error("--follow is only supported for svg figures")
+        follow_gantt_fig(args.tracefile, outputfiles[0], settings=settings,
+                         interval=args.interval, idle_timeout=args.idle_timeout)
+    elif args.pyramid is not None:
+        if types[0] != GANTT:
+            parser.error("--pyramid is only supported for Gantt charts")
+        if not 1 <= args.pyramid <= MAX_PYRAMID_LEVELS:
+            parser.error(f"--pyramid should be from 1 to {MAX_PYRAMID_LEVELS}")
+        create_gantt_pyramid(args.tracefile, outputfiles[0], args.pyramid, settings=settings,
+                             columnar=args.columnar, cache=cache, workers=args.jobs,
+                             trace_format=args.format)
+    elif args.tile_length is not None:
+        if types[0] != GANTT:
+            parser.error("--tile-length is only supported for Gantt charts")
+        if args.tile_length <= 0.0:
+            parser.error("--tile-length should be positive")
+        create_gantt_tiles(args.tracefile, outputfiles[0], args.tile_length, settings=settings,
+                           columnar=args.columnar, cache=cache, workers=args.jobs,
+                           trace_format=args.format, bundle=args.bundle)
     else:
-        create_vector_fig(args.tracefile, args.outputfile, settings=settings)
+        gantt_files = [f for f, t in zip(outputfiles, types) if t == GANTT]
+        vector_files = [f for f, t in zip(outputfiles, types) if t == VECTOR]
+        # the layout is stored in the settings, so every type of chart gets its own copy
+        if len(gantt_files) > 0:
+            create_gantt_figs(args.tracefile, gantt_files, settings=copy.deepcopy(settings),
+                              columnar=args.columnar, cache=cache, workers=args.jobs,
+                              trace_format=args.format, render_cache=render_cache)
+        if len(vector_files) > 0:
+            vector_trace = args.vector_trace if args.vector_trace is not None else args.tracefile
+            create_vector_figs(vector_trace, vector_files, settings=copy.deepcopy(settings),
+                               cache=cache, render_cache=render_cache)
@@ -1,8 +1,18 @@
+import os
+import re
 from setuptools import setup, find_packages
 
+
+def read_version():
+    """ return the version of cmtrace, which is defined in cmtrace/__init__.py only """
+    init_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cmtrace', '__init__.py')
+    with open(init_file, encoding='utf-8') as f:
+        return re.search(r"^__version__ = '([^']*)'", f.read(), re.MULTILINE).group(1)
+
+
 setup(
     name='cmtrace',
-    version='0.1',
+    version=read_version(),
     description=
     'Script to convert xml Gantt or vector trace into an SVG or PDF drawing for a paper or presentation.',
     url='https://github.com/Model-Based-Design-Lab/cmtrace',
@@ -15,8 +25,10 @@ setup(
         'pyyaml',
         'svgwrite',
         'pycairo',
+        'numpy',
     ],
-    entry_points={"console_scripts": ['cmtrace = cmtrace.utils.commandline:main']},
+    entry_points={"console_scripts": ['cmtrace = cmtrace.utils.commandline:main',
+                                      'cmtrace-batch = cmtrace.utils.batchcommandline:main']},
     test_suite='nose.collector',
     tests_require=['nose'],
 )